@@ -0,0 +1,337 @@
+"""
+HTTP API заданий для партнёров (LMS)
+
+    POST /api/v1/solve      {"text": "..."} или {"image": "<base64>"} — решение сразу
+    POST /api/v1/batch      {"tasks": [{...}, ...]} — пачка, ответ 202 с job_id
+    GET  /api/v1/jobs/{id}  — статус пачки и готовые решения
+
+Ключ — в заголовке Authorization: Bearer <ключ> или X-API-Key.
+Тот же конвейер (OCR → кэш → AI), те же лимиты и таблица requests,
+что у Telegram; запросы помечаются source='api'.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import time
+import uuid
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from aiohttp import web
+
+from config import config
+from services.db_service import db_service, DONE, FAILED, PENDING
+from services.load_shedder import load_shedder, Overloaded, CACHE_ONLY, RETRY_AFTER
+from services.logging_setup import bind_log_context
+from services.solve_pipeline import solve_pipeline, save_trace
+from services.throttle_service import throttle_service
+from services.trace import start_trace
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = "/api/v1"
+SOURCE = "api"
+# Как у фото из Telegram: текст после OCR с префиксом
+IMAGE_PREFIX = "[IMAGE OCR] "
+OVERLOADED_ERROR = "сервис перегружен, повторите через минуту"
+STOPPING_ERROR = "сервис перезапускается, повторите через минуту"
+
+
+class ApiClient(NamedTuple):
+    """Владелец ключа API"""
+    name: str
+    daily_quota: int  # 0 — без дневной квоты
+
+    @property
+    def telegram_id(self) -> int:
+        """
+        Синтетический telegram_id клиента для users и user_quotas
+
+        Отрицательный: с настоящими пользователями Telegram не пересекается.
+        """
+        digest = hashlib.sha1(f"api:{self.name}".encode("utf-8")).digest()
+        return -(int.from_bytes(digest[:6], "big") + 1)
+
+
+class TaskInput(NamedTuple):
+    """Задание из тела запроса: текст или байты изображения"""
+    text: Optional[str]
+    image: Optional[bytes]
+
+
+def task_api_enabled() -> bool:
+    """API включён, если заданы ключи; решает задания только роль all"""
+    return bool(config.TASK_API_KEYS) and config.BOT_ROLE == "all"
+
+
+def _error(status: int, message: str, **headers: str) -> web.Response:
+    return web.json_response({"error": message}, status=status, headers=headers)
+
+
+def _authenticate(request: web.Request) -> Optional[ApiClient]:
+    header = request.headers.get("Authorization", "")
+    key = header[7:].strip() if header.startswith("Bearer ") else request.headers.get("X-API-Key", "")
+    if not key:
+        return None
+    # Сравнение всех ключей за постоянное время
+    found = None
+    for secret, (name, daily_quota) in config.TASK_API_KEYS.items():
+        if hmac.compare_digest(key.encode("utf-8"), secret.encode("utf-8")):
+            found = ApiClient(name, daily_quota)
+    return found
+
+
+def _parse_task(data: object) -> TaskInput:
+    """Проверка одного задания; ValueError — с текстом для клиента"""
+    if not isinstance(data, dict):
+        raise ValueError("задание должно быть объектом с полем text или image")
+
+    text, image = data.get("text"), data.get("image")
+    if (text is None) == (image is None):
+        raise ValueError("нужно ровно одно из полей text или image")
+
+    if text is not None:
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError("text должен быть непустой строкой")
+        if len(text) > config.MAX_INPUT_LENGTH:
+            raise ValueError(f"text длиннее {config.MAX_INPUT_LENGTH} символов")
+        return TaskInput(text.strip(), None)
+
+    if not isinstance(image, str):
+        raise ValueError("image должен быть строкой base64")
+    try:
+        return TaskInput(None, base64.b64decode(image, validate=True))
+    except (binascii.Error, ValueError):
+        raise ValueError("image: некорректный base64")
+
+
+class TaskApi:
+    """
+    Обработчики HTTP API
+
+    Задания всех ключей решаются не больше TASK_API_CONCURRENCY
+    одновременно — поток от LMS не вытесняет пользователей Telegram.
+    """
+
+    def __init__(self):
+        self._semaphore = asyncio.Semaphore(config.TASK_API_CONCURRENCY)
+        # Пачки в работе: отменяются при остановке
+        self._batches: set[asyncio.Task] = set()
+        # Запросы в работе (/solve ждёт решения в обработчике): их дожидается stop()
+        self._requests: set[asyncio.Task] = set()
+        self._accepting = True
+
+    def create_app(self) -> web.Application:
+        """Подприложение для app.add_subapp(API_PREFIX, ...)"""
+        app = web.Application(middlewares=[self._auth_middleware])
+        app.router.add_post("/solve", self.handle_solve)
+        app.router.add_post("/batch", self.handle_batch)
+        app.router.add_get("/jobs/{job_id}", self.handle_job)
+        return app
+
+    @web.middleware
+    async def _auth_middleware(
+        self,
+        request: web.Request,
+        handler: Callable[[web.Request], Awaitable[web.StreamResponse]]
+    ) -> web.StreamResponse:
+        client = _authenticate(request)
+        if client is None:
+            return _error(401, "нужен ключ API")
+        if not self._accepting and request.method == "POST":
+            # Задание, принятое во время остановки, не успело бы решиться
+            return _error(503, STOPPING_ERROR, **{"Retry-After": str(RETRY_AFTER)})
+        request["api_client"] = client
+        task = asyncio.current_task()
+        self._requests.add(task)
+        try:
+            return await handler(request)
+        finally:
+            self._requests.discard(task)
+
+    async def handle_solve(self, request: web.Request) -> web.Response:
+        """Одно задание: ответ с решением, когда оно готово"""
+        client: ApiClient = request["api_client"]
+        try:
+            task = _parse_task(await request.json())
+        except ValueError as e:
+            return _error(400, str(e))
+
+        rejected = await self._admit(client, 1)
+        if rejected is not None:
+            return rejected
+
+        [request_id] = await self._log_requests(client, [task])
+        status, solution, error = await self._run(request_id, task)
+        body = {"request_id": request_id, "status": status, "solution": solution}
+        if error:
+            body["error"] = error
+        if error == OVERLOADED_ERROR:
+            return web.json_response(body, status=503, headers={"Retry-After": str(RETRY_AFTER)})
+        return web.json_response(body, status=200 if status == DONE else 502)
+
+    async def handle_batch(self, request: web.Request) -> web.Response:
+        """Пачка заданий: решается в фоне, статус — GET /jobs/{job_id}"""
+        client: ApiClient = request["api_client"]
+        try:
+            data = await request.json()
+        except ValueError:
+            return _error(400, "тело должно быть JSON")
+
+        items = data.get("tasks") if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return _error(400, "нужен непустой список tasks")
+        limit = config.TASK_API_BATCH_MAX
+        if config.TASK_API_RATE_LIMIT:
+            limit = min(limit, config.TASK_API_RATE_LIMIT)
+        if len(items) > limit:
+            return _error(413, f"в пачке больше {limit} заданий")
+
+        tasks = []
+        for i, item in enumerate(items):
+            try:
+                tasks.append(_parse_task(item))
+            except ValueError as e:
+                return _error(400, f"tasks[{i}]: {e}")
+
+        # Под перегрузкой пачка целиком ушла бы в отказы — не принимаем и не списываем квоту
+        if load_shedder.level >= CACHE_ONLY:
+            return _error(503, OVERLOADED_ERROR, **{"Retry-After": str(RETRY_AFTER)})
+
+        # Пачка допускается только целиком
+        rejected = await self._admit(client, len(tasks))
+        if rejected is not None:
+            return rejected
+
+        request_ids = await self._log_requests(client, tasks)
+        job_id = uuid.uuid4().hex
+        await db_service.create_api_job(job_id, client.name, request_ids, time.time())
+
+        batch = asyncio.create_task(self._run_batch(request_ids, tasks))
+        self._batches.add(batch)
+        batch.add_done_callback(self._batches.discard)
+        logger.info(f"Пачка API {job_id} от {client.name}: {len(tasks)} заданий")
+
+        return web.json_response(
+            {"job_id": job_id, "request_ids": request_ids, "status_url": f"{API_PREFIX}/jobs/{job_id}"},
+            status=202
+        )
+
+    async def handle_job(self, request: web.Request) -> web.Response:
+        """Статус пачки: running, пока хоть одно задание в работе"""
+        client: ApiClient = request["api_client"]
+        job = await db_service.get_api_job(request.match_info["job_id"])
+        # Чужая пачка неотличима от несуществующей
+        if job is None or job[0] != client.name:
+            return _error(404, "пачка не найдена")
+
+        _, created_at, rows = job
+        results = []
+        for request_id, status, response_text, latency_ms in rows:
+            result = {"request_id": request_id, "status": status, "solution": response_text}
+            if latency_ms is not None:
+                result["latency_ms"] = latency_ms
+            results.append(result)
+        running = any(result["status"] == PENDING for result in results)
+        return web.json_response({
+            "job_id": request.match_info["job_id"],
+            "status": "running" if running else "done",
+            "created_at": created_at,
+            "tasks": results,
+        })
+
+    async def _admit(self, client: ApiClient, count: int) -> Optional[web.Response]:
+        """Лимиты ключа (через throttle_service); None — задания приняты"""
+        decision = await throttle_service.check(
+            client.telegram_id,
+            count=count,
+            rate_limit=config.TASK_API_RATE_LIMIT,
+            daily_quota=client.daily_quota
+        )
+        if decision.allowed:
+            return None
+        reason = "дневная квота ключа исчерпана" if decision.quota_exceeded else "слишком много заданий"
+        logger.info(f"Ключ API {client.name}: {reason}")
+        return _error(429, reason, **{"Retry-After": str(decision.retry_after)})
+
+    async def _log_requests(self, client: ApiClient, tasks: list[TaskInput]) -> list[int]:
+        """Строки requests до решения: по ним клиент следит за пачкой"""
+        user_id = await db_service.get_or_create_user(
+            telegram_id=client.telegram_id,
+            username=f"api:{client.name}"
+        )
+        return [
+            await db_service.log_request(
+                user_id, task.text if task.text is not None else IMAGE_PREFIX, source=SOURCE
+            )
+            for task in tasks
+        ]
+
+    async def _run_batch(self, request_ids: list[int], tasks: list[TaskInput]) -> None:
+        """Задания пачки параллельно; сколько идёт сразу — решает семафор"""
+        await asyncio.gather(*(self._run(request_id, task) for request_id, task in zip(request_ids, tasks)))
+
+    async def _run(self, request_id: int, task: TaskInput) -> tuple[str, Optional[str], Optional[str]]:
+        """
+        Решение одного задания с записью результата и трассы
+
+        Returns:
+            (статус запроса, решение, ошибка для клиента)
+        """
+        started = time.monotonic()
+        start_trace("api_image" if task.image is not None else SOURCE)
+        bind_log_context(request_id=request_id)
+        try:
+            async with self._semaphore:
+                text = task.text
+                if task.image is not None:
+                    text = await solve_pipeline.recognize(task.image)
+                    if not text or len(text) > config.MAX_INPUT_LENGTH:
+                        await db_service.set_request_status(request_id, FAILED)
+                        return FAILED, None, "не удалось распознать текст на изображении"
+                    await db_service.update_request_text(request_id, IMAGE_PREFIX + text)
+
+                solution = await solve_pipeline.solve(text)
+
+            if not solution:
+                await db_service.set_request_status(request_id, FAILED)
+                return FAILED, None, "не удалось получить решение"
+
+            latency_ms = int((time.monotonic() - started) * 1000)
+            await db_service.update_response(request_id, solution, latency_ms)
+            return DONE, solution, None
+
+        except Overloaded:
+            await db_service.set_request_status(request_id, FAILED)
+            return FAILED, None, OVERLOADED_ERROR
+
+        except Exception as e:
+            logger.error(f"Ошибка решения запроса API {request_id}: {e}")
+            await db_service.set_request_status(request_id, FAILED)
+            return FAILED, None, "внутренняя ошибка"
+
+        finally:
+            await save_trace(request_id)
+
+    def stop_accepting(self) -> None:
+        """Новые задания (POST) получают 503 с Retry-After; статус пачек по-прежнему отдаётся"""
+        self._accepting = False
+
+    async def stop(self, timeout: float = 0) -> None:
+        """
+        Остановка: новые задания не принимаются, запросы и пачки в работе
+        дорабатываются до timeout секунд, незавершённые задания остаются pending
+        """
+        self.stop_accepting()
+        in_flight = self._requests | self._batches
+        if in_flight and timeout > 0:
+            await asyncio.wait(in_flight, timeout=timeout)
+        for batch in list(self._batches):
+            batch.cancel()
+        await asyncio.gather(*self._batches, return_exceptions=True)
+
+
+# Singleton экземпляр API
+task_api = TaskApi()
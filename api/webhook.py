@@ -3,6 +3,7 @@ Webhook endpoint для Vercel
 """
 import os
 import sys
+import hmac
 import json
 import logging
 from http.server import BaseHTTPRequestHandler
@@ -17,10 +18,13 @@ from aiogram.client.default import DefaultBotProperties
 
 from config import config
 from handlers import setup_routers
+from middlewares import setup_middlewares
 from services.db_service import db_service
+from services.background_loop import BackgroundLoop
+from services.logging_setup import setup_logging
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Настройка логирования (консоль; запись — в фоновом потоке)
+setup_logging(to_file=False)
 logger = logging.getLogger(__name__)
 
 # Инициализация бота и диспетчера
@@ -29,11 +33,17 @@ bot = Bot(
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
 dp = Dispatcher()
+setup_middlewares(dp)
 dp.include_router(setup_routers())
 
 # Инициализация БД (выполняется один раз)
 _db_initialized = False
 
+# Update обрабатывается до ответа Telegram: после ответа функцию могут
+# заморозить, и фоновая обработка встала бы. Loop общий для вызовов тёплого
+# инстанса — HTTP-пул и соединение с БД не пересоздаются
+background_loop = BackgroundLoop()
+
 
 async def init_db_once():
     """Инициализация БД один раз"""
@@ -44,49 +54,62 @@ async def init_db_once():
         logger.info("База данных инициализирована")
 
 
+async def process_update(update_data: dict):
+    """Асинхронная обработка update"""
+    try:
+        # Инициализируем БД если нужно
+        await init_db_once()
+        
+        # Создаём объект Update
+        update = Update.model_validate(update_data, context={"bot": bot})
+        
+        # Обрабатываем через диспетчер
+        await dp.feed_update(bot, update)
+        
+    except Exception as e:
+        logger.error(f"Ошибка обработки update: {e}", exc_info=True)
+
+
 class handler(BaseHTTPRequestHandler):
     """Обработчик webhook запросов от Telegram"""
     
     def do_POST(self):
         """Обработка POST запросов"""
         try:
+            # Проверяем секрет, если он задан при установке webhook
+            if config.WEBHOOK_SECRET:
+                secret = self.headers.get('X-Telegram-Bot-Api-Secret-Token') or ""
+                if not hmac.compare_digest(secret, config.WEBHOOK_SECRET):
+                    self._respond(401, {"ok": False})
+                    return
+            
             # Читаем тело запроса
             content_length = int(self.headers.get('Content-Length', 0))
             body = self.rfile.read(content_length).decode('utf-8')
             
             # Парсим JSON
             update_data = json.loads(body)
-            logger.info(f"Получен update: {update_data.get('update_id')}")
+            logger.debug(f"Получен update: {update_data.get('update_id')}")
             
-            # Обрабатываем update
-            import asyncio
-            asyncio.run(self.process_update(update_data))
+            # Обрабатываем update на постоянном loop
+            background_loop.run(process_update(update_data))
             
             # Отправляем ответ
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"ok": True}).encode())
-            
+            self._respond(200, {"ok": True})
+        
+        except json.JSONDecodeError:
+            self._respond(400, {"ok": False})
         except Exception as e:
             logger.error(f"Ошибка обработки webhook: {e}", exc_info=True)
             self.send_response(500)
             self.end_headers()
     
-    async def process_update(self, update_data: dict):
-        """Асинхронная обработка update"""
-        try:
-            # Инициализируем БД если нужно
-            await init_db_once()
-            
-            # Создаём объект Update
-            update = Update(**update_data)
-            
-            # Обрабатываем через диспетчер
-            await dp.feed_update(bot, update)
-            
-        except Exception as e:
-            logger.error(f"Ошибка обработки update: {e}", exc_info=True)
+    def _respond(self, status: int, payload: dict):
+        """Отправка JSON-ответа"""
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(payload).encode())
     
     def do_GET(self):
         """Обработка GET запросов (для проверки работоспособности)"""
@@ -0,0 +1,107 @@
+"""
+Бенчмарк разбиения ответов: прежний split_message против utils.chunker
+
+Ответы ~50 КБ в духе SYSTEM_PROMPT: абзацы, формулы со знаками < > &,
+длинные строки без переносов. Для прежней версии замеряется только
+разбиение (без экранирования, которого у неё не было).
+
+Запуск:
+    python benchmarks/chunker_bench.py --size 50000 --repeat 20
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.chunker import MessageChunker, split_message
+
+
+def legacy_split_message(text: str, max_length: int = 4096) -> list[str]:
+    """Копия прежнего split_message из handlers/text.py (до общего модуля)"""
+    if len(text) <= max_length:
+        return [text]
+
+    parts = []
+    current_part = ""
+    paragraphs = text.split('\n\n')
+
+    for paragraph in paragraphs:
+        if len(paragraph) > max_length:
+            if current_part:
+                parts.append(current_part.strip())
+                current_part = ""
+            sentences = paragraph.replace('. ', '.|').split('|')
+            for sentence in sentences:
+                if len(current_part) + len(sentence) + 1 <= max_length:
+                    current_part += sentence + " "
+                else:
+                    if current_part:
+                        parts.append(current_part.strip())
+                    current_part = sentence + " "
+        else:
+            if len(current_part) + len(paragraph) + 2 <= max_length:
+                current_part += paragraph + "\n\n"
+            else:
+                parts.append(current_part.strip())
+                current_part = paragraph + "\n\n"
+
+    if current_part.strip():
+        parts.append(current_part.strip())
+
+    return parts
+
+
+def make_answer(size: int, seed: int = 42) -> str:
+    """Синтетический ответ заданного размера"""
+    rng = random.Random(seed)
+    words = ["решение", "уравнение", "x", "=", "2", "<", ">", "&", "a²", "√(b)",
+             "Ответ:", "подставим", "значение", "получаем", "🔢", "f(x)"]
+    paragraphs = []
+    total = 0
+    while total < size:
+        sentences = []
+        for _ in range(rng.randint(1, 12)):
+            sentence = " ".join(rng.choice(words) for _ in range(rng.randint(4, 30)))
+            sentences.append(sentence + ".")
+        # Изредка — очень длинный абзац без переносов
+        paragraph = " ".join(sentences) * (8 if rng.random() < 0.05 else 1)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:size]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-length", type=int, default=4096)
+    args = parser.parse_args()
+
+    text = make_answer(args.size)
+
+    def streaming() -> list[str]:
+        chunker = MessageChunker(args.max_length)
+        parts = []
+        for i in range(0, len(text), 64):  # Дельты как у потокового ответа
+            parts += chunker.feed(text[i:i + 64])
+        return parts + chunker.flush()
+
+    cases = {
+        "legacy split_message": lambda: legacy_split_message(text, args.max_length),
+        "chunker split_message": lambda: split_message(text, args.max_length),
+        "chunker streaming (64 симв.)": streaming,
+    }
+
+    print(f"Ответ: {len(text)} символов, лимит {args.max_length}, повторов {args.repeat}\n")
+    for name, func in cases.items():
+        seconds = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        parts = func()
+        print(f"  {name:30s} {seconds * 1000:8.2f} мс  частей: {len(parts)}  "
+              f"макс. длина: {max(len(p) for p in parts)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,566 @@
+"""
+Сквозной нагрузочный тест: заглушки Bot API и OpenAI-совместимого API
+
+В отдельном процессе поднимаются два локальных сервера:
+  * Bot API — getUpdates отдаёт синтетические задания (текст и фото),
+    sendMessage/editMessageText/deleteMessage фиксируют ответы бота,
+    getFile и /file/... отдают сгенерированную картинку;
+  * AI — /v1/chat/completions с настраиваемой задержкой, потоковой
+    выдачей (SSE) и долей ошибок.
+
+Бот работает в этом процессе целиком: настоящий Dispatcher, роутеры,
+middleware, sender, БД (временная) и OCR. Если tesseract не установлен,
+используется скрипт-заглушка с задержкой --ocr-latency.
+
+Результат: обновлений в секунду, перцентили сквозной задержки и этапов
+(из request_stages), пиковый RSS процесса бота. С --json отчёт печатается
+в JSON, --output сохраняет его в файл для сравнения версий.
+
+Запуск:
+    python benchmarks/e2e_load.py --updates 500 --photo-ratio 0.3 --ai-latency 800
+    python benchmarks/e2e_load.py --updates 1000 --rate 50 --ai-error-rate 0.05 --json --output e2e.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from typing import Any, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+
+BOT_TOKEN = "123456:BENCHMARK"
+FIRST_CHAT_ID = 100000
+
+TASKS = [
+    "Реши уравнение 2x + 3 = 7",
+    "Найди площадь прямоугольника со сторонами 5 и 8 см",
+    "Упрости выражение (a + b)^2 - 2ab",
+    "Сколько будет 15% от 240?",
+    "Переведи на английский: Я люблю читать книги",
+]
+OCR_TEXT = "Solve: 2x + 3 = 7"
+
+# Сообщения бота «в процессе» — после них задание ещё не завершено
+PROGRESS_PREFIXES = ("📷", "🤖", "📝")
+# Завершение правкой сообщения о обработке: ошибка или отмена
+FINAL_EDIT_PREFIXES = ("❌", "🚫")
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    """Перцентиль по ближайшему рангу (как в /latency)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(len(ordered) * q))
+    return ordered[rank - 1]
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else None,
+    }
+
+
+# --- Заглушки (дочерний процесс) ---
+
+def render_task_image(width: int, height: int) -> bytes:
+    """PNG с текстом задания для getFile"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for row in range(max(1, height // 60)):
+        draw.text((20, 20 + row * 60), OCR_TEXT, fill="black")
+    output = BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+class FakeTelegram:
+    """Bot API: очередь синтетических update и учёт ответов бота"""
+
+    def __init__(self, options: dict):
+        self.total = options["updates"]
+        self.rate = options["rate"]
+        self.photo_ratio = options["photo_ratio"]
+        self.photo = render_task_image(*options["photo_size"])
+        self.photo_size = options["photo_size"]
+        self.random = random.Random(options["seed"])
+
+        self.available: list[dict] = []
+        self.new_updates = asyncio.Event()
+        self.release_task: Optional[asyncio.Task] = None
+        self.message_id = 0
+
+        self.served: dict[int, float] = {}          # chat_id -> выдан в getUpdates
+        self.done: dict[int, tuple[float, bool]] = {}  # chat_id -> (завершён, успешно)
+        self.calls: dict[str, int] = {}
+
+    def make_update(self, index: int) -> dict:
+        chat_id = FIRST_CHAT_ID + index
+        message = {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load", "username": f"load{index}"},
+        }
+        if self.random.random() < self.photo_ratio:
+            width, height = self.photo_size
+            message["photo"] = [{
+                "file_id": f"photo-{index}",
+                "file_unique_id": f"u{index}",
+                "width": width,
+                "height": height,
+                "file_size": len(self.photo),
+            }]
+        else:
+            message["text"] = self.random.choice(TASKS)
+        return {"update_id": index + 1, "message": message}
+
+    async def release(self) -> None:
+        """Выдача update с заданной частотой (0 — все сразу)"""
+        started = time.perf_counter()
+        for index in range(self.total):
+            if self.rate > 0:
+                delay = started + index / self.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self.available.append(self.make_update(index))
+            self.new_updates.set()
+
+    def next_message(self, chat_id: int, text: Optional[str]) -> dict:
+        self.message_id += 1
+        return {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "Bench"},
+            "text": text or "",
+        }
+
+    def finish(self, chat_id: int, ok: bool) -> None:
+        if chat_id in self.served and chat_id not in self.done:
+            self.done[chat_id] = (time.perf_counter(), ok)
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await request.post()
+        self.calls[method] = self.calls.get(method, 0) + 1
+        result = await self.dispatch(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def dispatch(self, method: str, params: Any) -> Any:
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+        if method == "getUpdates":
+            if self.release_task is None:
+                self.release_task = asyncio.create_task(self.release())
+            offset = int(params.get("offset") or 0)
+            limit = int(params.get("limit") or 100)
+            timeout = float(params.get("timeout") or 0)
+            self.available = [u for u in self.available if u["update_id"] >= offset]
+            if not self.available:
+                self.new_updates.clear()
+                try:
+                    await asyncio.wait_for(self.new_updates.wait(), timeout=max(timeout, 0.05))
+                except asyncio.TimeoutError:
+                    return []
+            batch = self.available[:limit]
+            now = time.perf_counter()
+            for update in batch:
+                self.served.setdefault(update["message"]["chat"]["id"], now)
+            return batch
+
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            text = params.get("text")
+            if text and not text.startswith(PROGRESS_PREFIXES):
+                self.finish(chat_id, ok=not text.startswith(FINAL_EDIT_PREFIXES))
+            return self.next_message(chat_id, text)
+
+        if method == "editMessageText":
+            chat_id = int(params["chat_id"])
+            text = params.get("text") or ""
+            if text.startswith(FINAL_EDIT_PREFIXES):
+                self.finish(chat_id, ok=False)
+            result = self.next_message(chat_id, text)
+            result["message_id"] = int(params["message_id"])
+            return result
+
+        if method == "getFile":
+            file_id = params["file_id"]
+            return {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(self.photo),
+                "file_path": f"photos/{file_id}.png",
+            }
+
+        # deleteMessage, answerCallbackQuery и прочее
+        return True
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        self.calls["file"] = self.calls.get("file", 0) + 1
+        return web.Response(body=self.photo, content_type="image/png")
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        latencies = [(finished - self.served[chat_id]) * 1000 for chat_id, (finished, _) in self.done.items()]
+        return web.json_response({
+            "served": len(self.served),
+            "done": len(self.done),
+            "errors": sum(1 for _, ok in self.done.values() if not ok),
+            "latencies_ms": latencies,
+            "calls": self.calls,
+        })
+
+
+class FakeAI:
+    """OpenAI-совместимый /v1/chat/completions с задержкой и ошибками"""
+
+    def __init__(self, options: dict):
+        self.latency = options["ai_latency"] / 1000
+        self.ttft = min(options["ai_ttft"] / 1000, self.latency)
+        self.error_rate = options["ai_error_rate"]
+        self.tokens = max(1, options["ai_tokens"])
+        self.random = random.Random(options["seed"] + 1)
+        self.requests = 0
+        self.errors = 0
+
+    def answer_tokens(self) -> list[str]:
+        body = ["Решение: ", "переносим ", "3 ", "вправо, ", "делим ", "на ", "2. "]
+        tokens = [body[i % len(body)] for i in range(self.tokens - 1)]
+        return tokens + ["\n\n✅ Ответ: 2"]
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        self.requests += 1
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(self.ttft)
+            return web.json_response({"error": {"message": "stub overloaded"}}, status=500)
+
+        tokens = self.answer_tokens()
+        usage = {"prompt_tokens": 120, "completion_tokens": len(tokens), "total_tokens": 120 + len(tokens)}
+        model = payload.get("model", "stub")
+
+        if not payload.get("stream"):
+            await asyncio.sleep(self.latency)
+            return web.json_response({
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await asyncio.sleep(self.ttft)
+        pause = (self.latency - self.ttft) / len(tokens)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(pause)
+            chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": token}}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        await response.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"requests": self.requests, "errors": self.errors})
+
+
+async def serve_stubs(options: dict, conn) -> None:
+    telegram = FakeTelegram(options)
+    ai = FakeAI(options)
+
+    tg_app = web.Application()
+    tg_app.router.add_post("/bot{token}/{method}", telegram.handle_method)
+    tg_app.router.add_get("/file/bot{token}/{path:.*}", telegram.handle_file)
+    tg_app.router.add_get("/_stats", telegram.handle_stats)
+
+    ai_app = web.Application()
+    ai_app.router.add_post("/v1/chat/completions", ai.handle)
+    ai_app.router.add_get("/_stats", ai.handle_stats)
+
+    ports = []
+    runners = []
+    for app in (tg_app, ai_app):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host="127.0.0.1", port=0)
+        await site.start()
+        runners.append(runner)
+        ports.append(site._server.sockets[0].getsockname()[1])
+
+    conn.send(ports)
+    try:
+        # Работаем, пока родитель не закроет канал
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+    except EOFError:
+        pass
+    for runner in runners:
+        await runner.cleanup()
+
+
+def stub_process(options: dict, conn) -> None:
+    asyncio.run(serve_stubs(options, conn))
+
+
+# --- Бот (этот процесс) ---
+
+def write_fake_tesseract(directory: str, latency_ms: float) -> str:
+    """Исполняемая заглушка tesseract: читает PNG из stdin, печатает текст"""
+    path = os.path.join(directory, "tesseract")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(
+            f"#!{sys.executable}\n"
+            "import sys, time\n"
+            "sys.stdin.buffer.read()\n"
+            f"time.sleep({latency_ms / 1000!r})\n"
+            f"print({OCR_TEXT!r})\n"
+        )
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+
+def configure_environment(args: argparse.Namespace, tg_port: int, ai_port: int, workdir: str) -> str:
+    """Окружение бота до импорта config: временные БД и адреса заглушек"""
+    os.environ["DATABASE_PATH"] = os.path.join(workdir, "bench.db")
+    os.environ["UPDATE_QUEUE_PATH"] = os.path.join(workdir, "update_queue.db")
+    os.environ["JOB_QUEUE_PATH"] = os.path.join(workdir, "jobs.db")
+    os.environ["WARM_STATE_PATH"] = os.path.join(workdir, "warm_state.json")
+    os.environ["AI_API_URL"] = f"http://127.0.0.1:{ai_port}/v1/chat/completions"
+    os.environ["AI_API_KEY"] = "bench"
+    os.environ["AI_STREAM"] = "1" if args.ai_stream else "0"
+    os.environ["BOT_ROLE"] = "all"
+    os.environ["METRICS_PORT"] = "0"
+    # Лимиты на пользователя меряют не конвейер, а политику
+    os.environ["THROTTLE_RATE_LIMIT"] = "0"
+    os.environ["THROTTLE_DAILY_QUOTA"] = "0"
+    if not args.telegram_limits:
+        os.environ["SEND_GLOBAL_RATE"] = "100000"
+        os.environ["SEND_CHAT_RATE"] = "100000"
+        os.environ["SEND_CHAT_BURST"] = "100000"
+
+    ocr = args.ocr
+    if ocr == "auto":
+        ocr = "real" if shutil.which("tesseract") else "fake"
+    if ocr == "fake":
+        os.environ["TESSERACT_PATH"] = write_fake_tesseract(workdir, args.ocr_latency)
+    return ocr
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS процесса бота (ru_maxrss: КБ в Linux, байты в macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return round(peak / 1024 / 1024, 1)
+    return round(peak / 1024, 1)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(args: argparse.Namespace, tg_port: int, ai_port: int, ocr: str) -> dict:
+    import aiohttp
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.enums import ParseMode
+
+    import bot as bot_app
+    from services.db_service import db_service
+    from services.metrics import UPDATES_IN_FLIGHT
+
+    tg_url = f"http://127.0.0.1:{tg_port}"
+    dp = bot_app.create_dispatcher()
+    bot = Bot(
+        token=BOT_TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(tg_url)),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+
+    wall_started = time.time()
+    started = time.perf_counter()
+    polling = asyncio.create_task(dp.start_polling(
+        bot,
+        handle_signals=False,
+        polling_timeout=1,
+        allowed_updates=dp.resolve_used_update_types()
+    ))
+
+    stats: dict = {}
+    deadline = started + args.timeout
+    async with aiohttp.ClientSession() as http:
+        while time.perf_counter() < deadline and not polling.done():
+            async with http.get(f"{tg_url}/_stats") as resp:
+                stats = await resp.json()
+            if stats["done"] >= args.updates:
+                break
+            await asyncio.sleep(0.1)
+        elapsed = time.perf_counter() - started
+
+        # Трассы пишутся после ответа пользователю — ждём последние обработчики
+        drain_deadline = time.perf_counter() + 10
+        while UPDATES_IN_FLIGHT._default().get() > 0 and time.perf_counter() < drain_deadline:
+            await asyncio.sleep(0.05)
+
+        async with http.get(f"http://127.0.0.1:{ai_port}/_stats") as resp:
+            ai_stats = await resp.json()
+
+    stages = {
+        name: {"count": n, "p50": p50, "p95": p95, "p99": p99}
+        for name, n, p50, p95, p99 in await db_service.get_stage_percentiles(since=wall_started - 1)
+    }
+
+    await dp.stop_polling()
+    await polling
+    await bot.session.close()
+
+    completed = stats.get("done", 0)
+    return {
+        "benchmark": "e2e_load",
+        "revision": git_revision(),
+        "timestamp": int(wall_started),
+        "python": platform.python_version(),
+        "config": {
+            "updates": args.updates,
+            "rate": args.rate,
+            "photo_ratio": args.photo_ratio,
+            "photo_size": list(args.photo_size),
+            "ai_latency_ms": args.ai_latency,
+            "ai_ttft_ms": args.ai_ttft,
+            "ai_tokens": args.ai_tokens,
+            "ai_stream": args.ai_stream,
+            "ai_error_rate": args.ai_error_rate,
+            "ocr": ocr,
+            "ocr_latency_ms": args.ocr_latency if ocr == "fake" else None,
+            "telegram_limits": args.telegram_limits,
+            "seed": args.seed,
+        },
+        "updates": args.updates,
+        "completed": completed,
+        "errors": stats.get("errors", 0),
+        "timed_out": args.updates - completed,
+        "elapsed_sec": round(elapsed, 3),
+        "updates_per_sec": round(completed / elapsed, 2) if elapsed else None,
+        "latency_ms": summarize(stats.get("latencies_ms", [])),
+        "stages_ms": stages,
+        "peak_rss_mb": peak_rss_mb(),
+        "telegram_calls": stats.get("calls", {}),
+        "ai_requests": ai_stats["requests"],
+        "ai_errors": ai_stats["errors"],
+    }
+
+
+def format_report(report: dict) -> str:
+    def ms(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value:.0f}"
+
+    latency = report["latency_ms"]
+    lines = [
+        f"updates:    {report['completed']}/{report['updates']} "
+        f"(errors {report['errors']}, timed out {report['timed_out']})",
+        f"throughput: {report['updates_per_sec']} updates/sec за {report['elapsed_sec']} с",
+        f"latency:    p50 {ms(latency['p50'])} / p95 {ms(latency['p95'])} / "
+        f"p99 {ms(latency['p99'])} / max {ms(latency['max'])} ms",
+        f"peak RSS:   {report['peak_rss_mb']} MB",
+        f"ocr:        {report['config']['ocr']}",
+        "",
+        f"{'stage':<16}{'n':>7}{'p50':>8}{'p95':>8}{'p99':>8}",
+    ]
+    for name, row in report["stages_ms"].items():
+        lines.append(f"{name:<16}{row['count']:>7}{ms(row['p50']):>8}{ms(row['p95']):>8}{ms(row['p99']):>8}")
+    return "\n".join(lines)
+
+
+def parse_size(value: str) -> tuple[int, int]:
+    width, _, height = value.lower().partition("x")
+    return int(width), int(height)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=0, help="update в секунду, 0 — все сразу")
+    parser.add_argument("--photo-ratio", type=float, default=0.3)
+    parser.add_argument("--photo-size", type=parse_size, default=(1280, 720), help="ШИРИНАxВЫСОТА")
+    parser.add_argument("--ai-latency", type=float, default=500, help="полный ответ AI, мс")
+    parser.add_argument("--ai-ttft", type=float, default=100, help="до первого токена, мс")
+    parser.add_argument("--ai-tokens", type=int, default=40)
+    parser.add_argument("--ai-stream", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--ai-error-rate", type=float, default=0.0)
+    parser.add_argument("--ocr", choices=("auto", "real", "fake"), default="auto")
+    parser.add_argument("--ocr-latency", type=float, default=200, help="задержка заглушки tesseract, мс")
+    parser.add_argument("--telegram-limits", action="store_true", help="оставить лимиты sender как в проде")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="печатать отчёт в JSON")
+    parser.add_argument("--output", help="сохранить JSON-отчёт в файл")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+
+    options = {
+        "updates": args.updates,
+        "rate": args.rate,
+        "photo_ratio": args.photo_ratio,
+        "photo_size": args.photo_size,
+        "ai_latency": args.ai_latency,
+        "ai_ttft": args.ai_ttft,
+        "ai_tokens": args.ai_tokens,
+        "ai_error_rate": args.ai_error_rate,
+        "seed": args.seed,
+    }
+    # Заглушки в своём процессе: не делят с ботом CPU event loop и не входят в его RSS
+    context = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = context.Pipe()
+    stubs = context.Process(target=stub_process, args=(options, child_conn), daemon=True)
+    stubs.start()
+    child_conn.close()
+    tg_port, ai_port = parent_conn.recv()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        ocr = configure_environment(args, tg_port, ai_port, workdir)
+        try:
+            report = asyncio.run(run_benchmark(args, tg_port, ai_port, ocr))
+        finally:
+            parent_conn.close()
+            stubs.join(timeout=5)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
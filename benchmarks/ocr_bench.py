@@ -0,0 +1,403 @@
+"""
+Бенчмарк OCR: скорость и точность конфигураций на корпусе изображений
+
+Корпус — каталог с картинками заданий (png/jpg/webp) и эталонным текстом
+рядом: task1.png + task1.txt. Изображения без .txt замеряются только по
+скорости. Синтетический корпус можно сгенерировать через --generate.
+
+Конфигурация — подготовка изображения + язык + --psm + движок. Пресет
+current повторяет OCRService._prepare_image как есть, остальные меняют
+по одному параметру. Свои конфигурации — JSON-файл --configs-file:
+
+    {"big-bin": {"preprocess": {"min_width": 1600, "grayscale": true, "threshold": 140},
+                 "lang": "rus+eng", "psm": 6}}
+
+Для каждой конфигурации: изображений в секунду (по стене), CPU-время
+подготовки и tesseract, пиковая память процесса tesseract и воркера,
+CER/WER против эталона. Изображения распределяются по --jobs процессам.
+
+Запуск:
+    python benchmarks/ocr_bench.py --generate corpus/ --count 40
+    python benchmarks/ocr_bench.py corpus/ --config current --config binarize --jobs 4
+    python benchmarks/ocr_bench.py corpus/ --json --output ocr.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+
+# Пресеты: current — как в OCRService, остальные отличаются одним параметром
+# lang None — OCRService.LANGUAGES
+PRESETS = {
+    "current": {"preprocess": "service", "lang": None, "psm": 6},
+    "raw": {"preprocess": {}, "lang": None, "psm": 6},
+    "no-upscale": {"preprocess": {"grayscale": True}, "lang": None, "psm": 6},
+    "upscale-1600": {"preprocess": {"min_width": 1600, "grayscale": True}, "lang": None, "psm": 6},
+    "autocontrast": {
+        "preprocess": {"min_width": 1000, "grayscale": True, "autocontrast": True},
+        "lang": None, "psm": 6,
+    },
+    "binarize": {
+        "preprocess": {"min_width": 1000, "grayscale": True, "threshold": 150},
+        "lang": None, "psm": 6,
+    },
+    "psm-3": {"preprocess": "service", "lang": None, "psm": 3},
+    "psm-4": {"preprocess": "service", "lang": None, "psm": 4},
+    "rus": {"preprocess": "service", "lang": "rus", "psm": 6},
+}
+
+SAMPLE_TASKS = [
+    "Реши уравнение 2x + 3 = 7",
+    "Найди площадь прямоугольника со сторонами 5 см и 8 см",
+    "Упрости выражение (a + b)^2 - 2ab",
+    "Сколько будет 15% от 240?",
+    "Переведи на английский: Я люблю читать книги",
+    "Поезд прошёл 120 км за 2 часа. Найди его скорость.",
+    "Solve the equation 3x - 5 = 10",
+    "Вычисли: 144 / 12 + 7 * 3",
+]
+
+
+# --- Метрики точности ---
+
+def normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def edit_distance(reference: list, hypothesis: list) -> int:
+    """Расстояние Левенштейна (две строки DP)"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_item in enumerate(reference, 1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_item in enumerate(hypothesis, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_item != hyp_item)
+            )
+        previous = current
+    return previous[-1]
+
+
+def error_counts(reference: str, hypothesis: str) -> tuple[int, int, int, int]:
+    """(ошибки символов, символов в эталоне, ошибки слов, слов в эталоне)"""
+    reference, hypothesis = normalize(reference), normalize(hypothesis)
+    ref_words, hyp_words = reference.split(), hypothesis.split()
+    return (
+        edit_distance(list(reference), list(hypothesis)), len(reference),
+        edit_distance(ref_words, hyp_words), len(ref_words),
+    )
+
+
+# --- Подготовка изображения и распознавание (процессы пула) ---
+
+def prepare_image(image_bytes: bytes, preprocess) -> bytes:
+    """PNG для tesseract: через OCRService или по параметрам конфигурации"""
+    if preprocess == "service":
+        from services.ocr_service import ocr_service
+        return ocr_service._prepare_image(image_bytes)
+
+    from PIL import Image, ImageFilter, ImageOps
+
+    image = Image.open(BytesIO(image_bytes))
+    if image.mode in ("RGBA", "P"):
+        image = image.convert("RGB")
+
+    width, height = image.size
+    min_width = preprocess.get("min_width")
+    max_width = preprocess.get("max_width")
+    if min_width and width < min_width:
+        ratio = min_width / width
+        image = image.resize((int(width * ratio), int(height * ratio)), Image.Resampling.LANCZOS)
+    elif max_width and width > max_width:
+        ratio = max_width / width
+        image = image.resize((int(width * ratio), int(height * ratio)), Image.Resampling.LANCZOS)
+
+    if preprocess.get("grayscale"):
+        image = image.convert("L")
+    if preprocess.get("autocontrast"):
+        image = ImageOps.autocontrast(image.convert("L"))
+    if preprocess.get("sharpen"):
+        image = image.filter(ImageFilter.SHARPEN)
+    threshold = preprocess.get("threshold")
+    if threshold is not None:
+        image = image.convert("L").point(lambda p: 255 if p > threshold else 0)
+
+    output = BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def run_tesseract(command: str, image_png: bytes, lang: str, psm: int, timeout: float) -> tuple[str, resource.struct_rusage]:
+    """
+    tesseract stdin stdout, как в OCRService._run_tesseract
+
+    Процесс дожидается через os.wait4: CPU-время и пиковая память
+    относятся именно к этому запуску, а не ко всем детям воркера.
+    """
+    process = subprocess.Popen(
+        [command, "stdin", "stdout", "-l", lang, "--psm", str(psm)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    # Зависший tesseract убивается по таймеру, чтение ниже тогда завершится
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    try:
+        process.stdin.write(image_png)
+        process.stdin.close()
+        stdout = process.stdout.read()
+        stderr = process.stderr.read()
+        _, status, usage = os.wait4(process.pid, 0)
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        timer.cancel()
+        process.stdout.close()
+        process.stderr.close()
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    if process.returncode == -signal.SIGKILL:
+        raise TimeoutError(f"tesseract дольше {timeout} с")
+    if process.returncode != 0:
+        raise RuntimeError(f"tesseract ({process.returncode}): {stderr.decode(errors='replace').strip()}")
+    return stdout.decode("utf-8", errors="replace").strip(), usage
+
+
+def warm_up(_: int) -> None:
+    import PIL.Image  # noqa: F401
+    from services.ocr_service import _load_ocr_stack
+    _load_ocr_stack()
+
+
+def run_one(job: tuple) -> dict:
+    """Одно изображение в одной конфигурации"""
+    config, path, command, timeout = job
+    result = {"image": os.path.basename(path), "text": "", "error": None}
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    try:
+        with open(path, "rb") as f:
+            image_png = prepare_image(f.read(), config["preprocess"])
+        result["cpu_preprocess"] = time.process_time() - cpu_started
+
+        text, usage = run_tesseract(command, image_png, config["lang"], config["psm"], timeout)
+        result["text"] = text
+        result["cpu_ocr"] = usage.ru_utime + usage.ru_stime
+        result["ocr_peak_kb"] = usage.ru_maxrss
+    except Exception as e:
+        result["error"] = str(e)
+        result.setdefault("cpu_preprocess", time.process_time() - cpu_started)
+    result["wall"] = time.perf_counter() - wall_started
+    result["worker_peak_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+# --- Корпус ---
+
+def load_corpus(directory: str) -> list[tuple[str, Optional[str]]]:
+    """[(путь к изображению, эталон или None)]"""
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in IMAGE_EXTENSIONS:
+            continue
+        truth_path = os.path.join(directory, stem + ".txt")
+        truth = None
+        if os.path.exists(truth_path):
+            with open(truth_path, encoding="utf-8") as f:
+                truth = f.read()
+        corpus.append((os.path.join(directory, name), truth))
+    return corpus
+
+
+def generate_corpus(directory: str, count: int, font_path: Optional[str], seed: int) -> None:
+    """Синтетические «скриншоты» заданий: разный размер, шум, лёгкий наклон"""
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for index in range(count):
+        text = rng.choice(SAMPLE_TASKS)
+        size = rng.choice((22, 28, 36))
+        try:
+            font = ImageFont.truetype(font_path or "DejaVuSans.ttf", size)
+        except OSError:
+            font = ImageFont.load_default(size=size)
+
+        left, top, right, bottom = font.getbbox(text)
+        width, height = right - left + 80, bottom - top + 80
+        image = Image.new("L", (width, height), rng.randint(215, 255))
+        ImageDraw.Draw(image).text((40 - left, 40 - top), text, font=font, fill=rng.randint(0, 60))
+        if rng.random() < 0.5:
+            image = image.rotate(rng.uniform(-2, 2), expand=True, fillcolor=235)
+        if rng.random() < 0.3:
+            image = image.filter(ImageFilter.GaussianBlur(0.8))
+
+        stem = os.path.join(directory, f"task{index:03d}")
+        image.convert("RGB").save(stem + ".png")
+        with open(stem + ".txt", "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+# --- Прогон ---
+
+def summarize(name: str, config: dict, corpus: list, results: list[dict], elapsed: float) -> dict:
+    truths = {os.path.basename(path): truth for path, truth in corpus}
+    char_errors = chars = word_errors = words = 0
+    for result in results:
+        truth = truths[result["image"]]
+        if truth is None:
+            continue
+        ce, cn, we, wn = error_counts(truth, result["text"])
+        char_errors += ce
+        chars += cn
+        word_errors += we
+        words += wn
+
+    cpu_preprocess = sum(r.get("cpu_preprocess", 0.0) for r in results)
+    cpu_ocr = sum(r.get("cpu_ocr", 0.0) for r in results)
+    return {
+        "config": name,
+        "preprocess": config["preprocess"],
+        "lang": config["lang"],
+        "psm": config["psm"],
+        "images": len(results),
+        "errors": sum(1 for r in results if r["error"]),
+        "elapsed_sec": round(elapsed, 3),
+        "images_per_sec": round(len(results) / elapsed, 2) if elapsed else None,
+        "cpu_sec": round(cpu_preprocess + cpu_ocr, 3),
+        "cpu_preprocess_sec": round(cpu_preprocess, 3),
+        "cpu_ocr_sec": round(cpu_ocr, 3),
+        "cpu_ms_per_image": round((cpu_preprocess + cpu_ocr) * 1000 / len(results), 1) if results else None,
+        "ocr_peak_mb": round(max((r.get("ocr_peak_kb", 0) for r in results), default=0) / 1024, 1),
+        "worker_peak_mb": round(max((r["worker_peak_kb"] for r in results), default=0) / 1024, 1),
+        "cer": round(char_errors / chars, 4) if chars else None,
+        "wer": round(word_errors / words, 4) if words else None,
+        "first_error": next((r["error"] for r in results if r["error"]), None),
+    }
+
+
+def pick_best(rows: list[dict], tolerance: float) -> Optional[str]:
+    """Самая быстрая конфигурация с CER не хуже лучшего + tolerance"""
+    scored = [r for r in rows if r["cer"] is not None and not r["errors"]]
+    if not scored:
+        return None
+    best_cer = min(r["cer"] for r in scored)
+    candidates = [r for r in scored if r["cer"] <= best_cer + tolerance]
+    return max(candidates, key=lambda r: r["images_per_sec"] or 0)["config"]
+
+
+def format_report(report: dict) -> str:
+    def value(v, fmt: str = "") -> str:
+        return "-" if v is None else format(v, fmt)
+
+    lines = [
+        f"corpus: {report['corpus']} ({report['images']} изображений, jobs={report['jobs']})",
+        "",
+        f"{'config':<16}{'img/s':>8}{'cpu ms/img':>12}{'ocr MB':>8}{'CER':>8}{'WER':>8}{'err':>5}",
+    ]
+    for row in report["results"]:
+        lines.append(
+            f"{row['config']:<16}{value(row['images_per_sec'], '.1f'):>8}"
+            f"{value(row['cpu_ms_per_image'], '.0f'):>12}{value(row['ocr_peak_mb'], '.0f'):>8}"
+            f"{value(row['cer'], '.3f'):>8}{value(row['wer'], '.3f'):>8}{row['errors']:>5}"
+        )
+    for row in report["results"]:
+        if row["first_error"]:
+            lines.append(f"{row['config']}: {row['first_error']}")
+    if report["best"]:
+        lines.append(f"\nбыстрейшая без потери точности (CER +{report['cer_tolerance']}): {report['best']}")
+    return "\n".join(lines)
+
+
+def load_configs(args: argparse.Namespace) -> dict:
+    from services.ocr_service import OCRService
+
+    configs = dict(PRESETS)
+    if args.configs_file:
+        with open(args.configs_file, encoding="utf-8") as f:
+            for name, config in json.load(f).items():
+                configs[name] = {"preprocess": "service", "lang": None, "psm": 6, **config}
+    selected = args.config or list(configs)
+    unknown = [name for name in selected if name not in configs]
+    if unknown:
+        raise SystemExit(f"Неизвестные конфигурации: {', '.join(unknown)} (есть: {', '.join(configs)})")
+    return {
+        name: {**configs[name], "lang": configs[name]["lang"] or OCRService.LANGUAGES}
+        for name in selected
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="?", help="каталог с изображениями и .txt")
+    parser.add_argument("--config", action="append", help=f"конфигурация (по умолчанию все): {', '.join(PRESETS)}")
+    parser.add_argument("--configs-file", help="JSON со своими конфигурациями")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="процессов распознавания")
+    parser.add_argument("--tesseract", default=os.getenv("TESSERACT_PATH", "tesseract"), help="путь к tesseract")
+    parser.add_argument("--timeout", type=float, default=60, help="на одно изображение, с")
+    parser.add_argument("--cer-tolerance", type=float, default=0.005)
+    parser.add_argument("--generate", metavar="DIR", help="создать синтетический корпус и выйти")
+    parser.add_argument("--count", type=int, default=40)
+    parser.add_argument("--font", help="TTF для --generate (по умолчанию DejaVuSans)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="печатать отчёт в JSON")
+    parser.add_argument("--output", help="сохранить JSON-отчёт в файл")
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_corpus(args.generate, args.count, args.font, args.seed)
+        print(f"{args.count} изображений в {args.generate}")
+        return
+    if not args.corpus:
+        parser.error("нужен каталог корпуса или --generate")
+
+    configs = load_configs(args)
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        raise SystemExit(f"В {args.corpus} нет изображений")
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        # Импорт Pillow и OCRService в воркерах не должен попасть в замер первой конфигурации
+        list(pool.map(warm_up, range(args.jobs)))
+        for name, config in configs.items():
+            jobs = [(config, path, args.tesseract, args.timeout) for path, _ in corpus]
+            started = time.perf_counter()
+            results = list(pool.map(run_one, jobs))
+            rows.append(summarize(name, config, corpus, results, time.perf_counter() - started))
+
+    report = {
+        "benchmark": "ocr_bench",
+        "corpus": os.path.abspath(args.corpus),
+        "images": len(corpus),
+        "with_truth": sum(1 for _, truth in corpus if truth is not None),
+        "jobs": args.jobs,
+        "cer_tolerance": args.cer_tolerance,
+        "results": rows,
+        "best": pick_best(rows, args.cer_tolerance),
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Профиль холодного старта: время импорта и инициализации по модулям
+
+Каждый замер — в новом процессе, как при холодном старте serverless-функции.
+
+Запуск:
+    python benchmarks/startup_profile.py                    # api.webhook (Vercel)
+    python benchmarks/startup_profile.py --entry bot --top 15
+    python benchmarks/startup_profile.py --budget-ms 1500   # код выхода 1 при превышении
+    python benchmarks/startup_profile.py --json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули проекта показываем по отдельности, сторонние — по пакету верхнего уровня
+PROJECT_PACKAGES = {"api", "bot", "config", "handlers", "keyboards", "middlewares", "services", "netlify"}
+
+# Шаги инициализации, выполняются в дочернем процессе после импорта точки входа
+INIT_SCRIPT = """
+import asyncio, json, sys, time
+timings = {}
+
+started = time.perf_counter()
+import importlib
+entry = importlib.import_module(sys.argv[1])
+timings["import " + sys.argv[1]] = time.perf_counter() - started
+
+from services.db_service import db_service
+
+async def init():
+    started = time.perf_counter()
+    await db_service.init_db()
+    timings["init_db (новая БД, DDL и миграции)"] = time.perf_counter() - started
+
+    await db_service.close()
+    started = time.perf_counter()
+    await db_service.init_db()
+    timings["init_db (схема актуальна)"] = time.perf_counter() - started
+    await db_service.close()
+
+asyncio.run(init())
+
+started = time.perf_counter()
+from services.ocr_service import _load_ocr_stack
+_load_ocr_stack()
+timings["стек OCR (первое фото)"] = time.perf_counter() - started
+
+print(json.dumps(timings))
+"""
+
+
+def child_env(db_dir: str) -> dict:
+    """Окружение дочернего процесса: отдельная БД, без записи в рабочие файлы"""
+    env = dict(os.environ)
+    env["DATABASE_PATH"] = os.path.join(db_dir, "profile.db")
+    env["UPDATE_QUEUE_PATH"] = os.path.join(db_dir, "update_queue.db")
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env.setdefault("BOT_TOKEN", "123456:PROFILE")
+    return env
+
+
+def profile_imports(entry: str, env: dict) -> list[tuple[str, int, int]]:
+    """Разбор вывода `python -X importtime`: (модуль, self мкс, cumulative мкс)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {entry}"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        self_us, cumulative_us, name = int(parts[0]), int(parts[1]), parts[2].strip()
+        rows.append((name, self_us, cumulative_us))
+    return rows
+
+
+def profile_init(entry: str, env: dict) -> dict:
+    """Время импорта точки входа и шагов инициализации (секунды)"""
+    result = subprocess.run(
+        [sys.executable, "-c", INIT_SCRIPT, entry],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def group_imports(rows: list[tuple[str, int, int]]) -> dict[str, float]:
+    """Суммарное собственное время импорта (мс) по модулям проекта и сторонним пакетам"""
+    grouped: dict[str, float] = defaultdict(float)
+    for name, self_us, _ in rows:
+        top = name.split(".")[0]
+        key = name if top in PROJECT_PACKAGES else top
+        grouped[key] += self_us / 1000
+    return dict(grouped)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entry", default="api.webhook", help="Модуль точки входа (api.webhook, bot, ...)")
+    parser.add_argument("--top", type=int, default=20, help="Сколько модулей показать")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="Бюджет на импорт + init_db; при превышении код выхода 1")
+    parser.add_argument("--json", action="store_true", help="Машиночитаемый вывод")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        env = child_env(db_dir)
+        imports = group_imports(profile_imports(args.entry, env))
+        init = profile_init(args.entry, env)
+
+    total_ms = (init[f"import {args.entry}"] + init["init_db (схема актуальна)"]) * 1000
+    heavy_loaded = sorted(name for name in ("PIL", "pytesseract", "httpx") if name in imports)
+
+    if args.json:
+        print(json.dumps({
+            "entry": args.entry,
+            "imports_ms": imports,
+            "init_ms": {k: v * 1000 for k, v in init.items()},
+            "cold_start_ms": total_ms,
+            "heavy_modules_at_import": heavy_loaded,
+        }, ensure_ascii=False, indent=2))
+    else:
+        print(f"Точка входа: {args.entry}\n")
+        print("Импорт (собственное время, мс):")
+        for name, ms in sorted(imports.items(), key=lambda item: -item[1])[: args.top]:
+            print(f"  {ms:9.1f}  {name}")
+        print("\nИнициализация (мс):")
+        for name, seconds in init.items():
+            print(f"  {seconds * 1000:9.1f}  {name}")
+        print(f"\nХолодный старт (импорт + init_db): {total_ms:.1f} мс")
+        if heavy_loaded:
+            print(f"⚠️ При импорте загружены тяжёлые модули: {', '.join(heavy_loaded)}")
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"❌ Бюджет {args.budget_ms:.0f} мс превышен", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Нагрузочный тест: webhook-сервер bot.py против long polling
+
+Обновления проходят через настоящий Dispatcher и роутеры, но вместо
+Telegram Bot API используется заглушка сессии — сеть и токен не нужны.
+Трафик — команды /help и «📊 Моя статистика» (чтение из БД), без вызовов AI.
+Сверх UPDATE_QUEUE_SIZE сервер отвечает 503 — клиент, как и Telegram,
+повторяет такое обновление позже; число отказов выводится как shed.
+
+Запуск:
+    python benchmarks/webhook_load.py --updates 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Отдельная БД и секрет, чтобы не трогать рабочие данные
+_workdir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_PATH", os.path.join(_workdir, "bench.db"))
+os.environ.setdefault("UPDATE_QUEUE_PATH", os.path.join(_workdir, "update_queue.db"))
+os.environ.setdefault("WARM_STATE_PATH", os.path.join(_workdir, "warm_state.json"))
+os.environ.setdefault("WEBHOOK_SECRET", "bench-secret")
+# Меряем пропускную способность сервера, а не лимиты Telegram в sender
+os.environ.setdefault("SEND_GLOBAL_RATE", "100000")
+os.environ.setdefault("SEND_CHAT_RATE", "100000")
+os.environ.setdefault("SEND_CHAT_BURST", "100000")
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetUpdates, GetMe, TelegramMethod
+from aiogram.types import Chat, Message, Update, User
+
+import bot as bot_app
+from config import config
+
+BOT_TOKEN = "123456:BENCHMARK"
+# Пауза перед повтором update, отклонённого переполненной очередью (503)
+RETRY_DELAY = 0.05
+TEXTS = ["/help", "📊 Моя статистика"]
+
+
+def make_update(update_id: int) -> dict:
+    """Синтетическое текстовое обновление"""
+    user_id = 1000 + update_id % 100
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            "text": TEXTS[update_id % len(TEXTS)],
+        },
+    }
+
+
+class StubSession(BaseSession):
+    """Сессия-заглушка Bot API: отдаёт getUpdates из очереди и считает ответы"""
+
+    def __init__(self, updates: Optional[list[dict]] = None):
+        super().__init__()
+        self.pending = list(updates or [])
+        self.sent = 0
+        self.all_sent = asyncio.Event()
+        self.expected = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: Optional[int] = None) -> Any:
+        if isinstance(method, GetMe):
+            return User(id=1, is_bot=True, first_name="Bench", username="bench_bot")
+        if isinstance(method, GetUpdates):
+            offset = method.offset or 0
+            self.pending = [u for u in self.pending if u["update_id"] >= offset]
+            batch = self.pending[: method.limit or 100]
+            if not batch:
+                await asyncio.sleep(0.01)
+            return [Update.model_validate(u, context={"bot": bot}) for u in batch]
+
+        # sendMessage и прочие — фиксируем ответ
+        self.sent += 1
+        if self.sent >= self.expected:
+            self.all_sent.set()
+        chat_id = getattr(method, "chat_id", 0) or 0
+        return Message(
+            message_id=self.sent,
+            date=datetime.now(),
+            chat=Chat(id=chat_id, type="private"),
+            text=getattr(method, "text", None),
+        ).as_(bot)
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(self, *args: Any, **kwargs: Any):
+        raise NotImplementedError
+        yield b""
+
+
+async def bench_polling(dp: Dispatcher, total: int) -> float:
+    """Пропускная способность long polling (обновлений в секунду)"""
+    session = StubSession([make_update(i) for i in range(1, total + 1)])
+    session.expected = total
+    bot = Bot(token=BOT_TOKEN, session=session)
+
+    started = time.perf_counter()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=0))
+    await session.all_sent.wait()
+    elapsed = time.perf_counter() - started
+
+    await dp.stop_polling()
+    await polling
+    return total / elapsed
+
+
+async def bench_webhook(dp: Dispatcher, total: int, concurrency: int) -> tuple[float, int]:
+    """Пропускная способность webhook-сервера (обновлений в секунду) и число ответов 503"""
+    session = StubSession()
+    session.expected = total
+    bot = Bot(token=BOT_TOKEN, session=session)
+    app = bot_app.create_app(bot, dp)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host="127.0.0.1", port=0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}{config.WEBHOOK_PATH}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": config.WEBHOOK_SECRET}
+
+    # Свои update_id: прогон polling уже занял 1..total в окне дедупликации
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for i in range(total + 1, 2 * total + 1):
+        queue.put_nowait(i)
+
+    shed = 0
+
+    async def client(http: aiohttp.ClientSession) -> None:
+        nonlocal shed
+        while not queue.empty():
+            update_id = queue.get_nowait()
+            while True:
+                async with http.post(url, json=make_update(update_id), headers=headers) as resp:
+                    if resp.status != 503:
+                        resp.raise_for_status()
+                        break
+                # Очередь переполнена — повтор, как у Telegram
+                shed += 1
+                await asyncio.sleep(RETRY_DELAY)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as http:
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+    await session.all_sent.wait()
+    elapsed = time.perf_counter() - started
+
+    await runner.cleanup()
+    return total / elapsed, shed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    # Роутеры — синглтоны модулей, поэтому диспетчер один на оба прогона
+    dp = bot_app.create_dispatcher()
+    polling_rate = await bench_polling(dp, args.updates)
+    webhook_rate, shed = await bench_webhook(dp, args.updates, args.concurrency)
+
+    print(f"updates:  {args.updates}")
+    print(f"polling:  {polling_rate:8.1f} updates/sec")
+    print(f"webhook:  {webhook_rate:8.1f} updates/sec (concurrency={args.concurrency})")
+    print(f"shed:     {shed} ответов 503 (UPDATE_QUEUE_SIZE={config.UPDATE_QUEUE_SIZE}), повторены")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,29 +1,38 @@
-<<<<<<< HEAD
 """
 Главный файл бота ИИ-ГДЗ
 Точка входа приложения
 """
 import asyncio
+import hmac
 import logging
+import signal
 import sys
+import time
+from contextlib import suppress
+from typing import Optional
 
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import web
 
+from api.tasks import API_PREFIX, task_api, task_api_enabled
 from config import config
 from handlers import setup_routers
+from middlewares import setup_middlewares
 from services.db_service import db_service
+from services.ai_service import ai_service
+from services.answer_corpus import answer_corpus
+from services.update_queue import UpdateQueue
+from services.job_queue import job_queue
+from services.solver_worker import SolverWorker
+from services.throttle_service import throttle_service
+from services.metrics import metrics, UPDATE_QUEUE_PENDING, UPDATES_IN_FLIGHT
+from services.logging_setup import setup_logging
+from services.warm_state import warm_state
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler("bot.log", encoding="utf-8")
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
@@ -31,99 +40,291 @@ async def on_startup(bot: Bot) -> None:
     """Действия при запуске бота"""
     logger.info("Инициализация базы данных...")
     await db_service.init_db()
+    # Кэши прошлого запуска: после деплоя без волны промахов
+    warm_state.restore()
     
     # Получаем информацию о боте
     bot_info = await bot.get_me()
     logger.info(f"Бот запущен: @{bot_info.username}")
 
 
+async def drain_updates(timeout: float) -> None:
+    """
+    Ожидание update в обработке (до timeout секунд)
+    
+    В polling aiogram перестаёт получать update, но не ждёт уже запущенные
+    хендлеры; очередь webhook и solver дорабатывают своё в stop().
+    """
+    deadline = time.monotonic() + timeout
+    while UPDATES_IN_FLIGHT.get() > 0 and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    if UPDATES_IN_FLIGHT.get() > 0:
+        logger.warning(f"Остановка без ожидания update в работе: {UPDATES_IN_FLIGHT.get():.0f}")
+
+
 async def on_shutdown(bot: Bot) -> None:
-    """Действия при остановке бота"""
+    """
+    Действия при остановке бота
+    
+    Новые update к этому моменту уже не принимаются. Задания в работе
+    дорабатываются до SHUTDOWN_TIMEOUT, затем сохраняется снимок кэшей и
+    сбрасываются отложенные записи в БД.
+    """
+    logger.info("Остановка: дорабатываем задания в работе...")
+    # HTTP API заданий в polling ещё слушает порт (закрывается после
+    # on_shutdown) — новые задания сразу получают 503, а не теряются
+    task_api.stop_accepting()
+    # Пачки API пишут в БД, поэтому до закрытия сервисов
+    await asyncio.gather(
+        task_api.stop(config.SHUTDOWN_TIMEOUT),
+        drain_updates(config.SHUTDOWN_TIMEOUT)
+    )
+    warm_state.save()
+    await ai_service.close()
+    await answer_corpus.close()
+    await job_queue.close()
+    await throttle_service.close()  # Счётчики квот пишутся в БД, поэтому до db_service
+    await db_service.close()
     logger.info("Бот остановлен")
 
 
-async def main() -> None:
-    """Главная функция запуска бота"""
-    # Валидация конфигурации
-    try:
-        config.validate()
-    except ValueError as e:
-        logger.error(f"Ошибка конфигурации: {e}")
-        sys.exit(1)
+async def on_webhook_startup(bot: Bot, dispatcher: Dispatcher) -> None:
+    """Регистрация webhook в Telegram, если задан публичный адрес"""
+    if not config.WEBHOOK_URL:
+        return
     
-    # Создаём бота и диспетчер
-    bot = Bot(
+    webhook_url = f"{config.WEBHOOK_URL.rstrip('/')}{config.WEBHOOK_PATH}"
+    await bot.set_webhook(
+        url=webhook_url,
+        secret_token=config.WEBHOOK_SECRET,
+        allowed_updates=dispatcher.resolve_used_update_types()
+    )
+    logger.info(f"Webhook установлен: {webhook_url}")
+
+
+def create_bot() -> Bot:
+    """Создание экземпляра бота"""
+    return Bot(
         token=config.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+
+
+def create_dispatcher() -> Dispatcher:
+    """Создание диспетчера с роутерами и хуками запуска/остановки"""
     dp = Dispatcher()
     
-    # Регистрируем роутеры
+    # Регистрируем middleware и роутеры
+    setup_middlewares(dp)
     dp.include_router(setup_routers())
     
     # Регистрируем хуки запуска/остановки
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
     
-    # Запускаем polling
-    logger.info("Запуск бота...")
+    return dp
+
+
+async def healthcheck(request: web.Request) -> web.Response:
+    """Проверка работоспособности для балансировщика"""
+    return web.Response(text="Bot is running!")
+
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    """Метрики в текстовом формате Prometheus"""
+    if config.METRICS_TOKEN:
+        header = request.headers.get("Authorization", "")
+        token = header[7:].strip() if header.startswith("Bearer ") else ""
+        if not hmac.compare_digest(token.encode("utf-8"), config.METRICS_TOKEN.encode("utf-8")):
+            return web.Response(status=401, text="Unauthorized")
+    return web.Response(
+        body=metrics.render().encode("utf-8"),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+
+async def start_metrics_server() -> Optional[web.AppRunner]:
+    """
+    Отдельный HTTP-сервер метрик на METRICS_PORT
+    
+    Порт занят (второй процесс на том же хосте с тем же METRICS_PORT) —
+    бот работает дальше без метрик, а не падает при запуске.
+    """
+    if not config.METRICS_PORT:
+        return None
+    
+    app = web.Application()
+    app.router.add_get(config.METRICS_PATH, metrics_endpoint)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.WEB_HOST, port=config.METRICS_PORT)
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
-    finally:
-        await bot.session.close()
+        await site.start()
+    except OSError as e:
+        logger.error(f"Сервер метрик не запущен на порту {config.METRICS_PORT}: {e}")
+        await runner.cleanup()
+        return None
+    logger.info(f"Метрики: http://{config.WEB_HOST}:{config.METRICS_PORT}{config.METRICS_PATH}")
+    return runner
 
 
-if __name__ == "__main__":
+async def start_task_api_server() -> Optional[web.AppRunner]:
+    """HTTP API заданий на TASK_API_PORT (в режиме webhook — на основном порту)"""
+    if not task_api_enabled():
+        return None
+    
+    app = web.Application(client_max_size=config.TASK_API_MAX_BODY)
+    app.add_subapp(API_PREFIX, task_api.create_app())
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.WEB_HOST, port=config.TASK_API_PORT)
+    await site.start()
+    logger.info(f"HTTP API заданий: http://{config.WEB_HOST}:{config.TASK_API_PORT}{API_PREFIX}")
+    return runner
+
+
+async def handle_webhook(request: web.Request) -> web.Response:
+    """
+    Приём обновления от Telegram
+    
+    Обновление сохраняется в очередь и подтверждается сразу, не дожидаясь
+    OCR и ответа AI — иначе Telegram ждёт, доставляет повторно и
+    придерживает следующие обновления.
+    """
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
+    if not hmac.compare_digest(secret or "", config.WEBHOOK_SECRET):
+        return web.Response(status=401, text="Unauthorized")
+    
     try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        logger.info("Бот остановлен пользователем")
-=======
-"""
-Главный файл бота ИИ-ГДЗ
-Точка входа приложения
-"""
-import asyncio
-import logging
-import sys
+        update_data = await request.json()
+    except ValueError:
+        return web.Response(status=400, text="Bad Request")
+    
+    update_queue: UpdateQueue = request.app["update_queue"]
+    if not update_queue.submit(update_data):
+        logger.warning(f"Очередь обновлений переполнена, update {update_data.get('update_id')} отклонён")
+        return web.Response(status=503, text="Queue is full")
+    
+    return web.json_response({"ok": True})
 
-from aiogram import Bot, Dispatcher
-from aiogram.enums import ParseMode
-from aiogram.client.default import DefaultBotProperties
 
-from config import config
-from handlers import setup_routers
-from services.db_service import db_service
+def create_app(bot: Bot, dp: Dispatcher) -> web.Application:
+    """
+    aiohttp-приложение для режима webhook
+    
+    Все обновления обрабатываются на одном event loop, поэтому пул
+    HTTP-соединений к AI, соединение с БД и кэши остаются прогретыми.
+    """
+    # Фото в base64 для HTTP API не помещаются в лимит тела по умолчанию (1 МБ)
+    app = web.Application(client_max_size=config.TASK_API_MAX_BODY if task_api_enabled() else 1024 ** 2)
+    app.router.add_get("/", healthcheck)
+    app.router.add_post(config.WEBHOOK_PATH, handle_webhook)
+    if config.METRICS_TOKEN:
+        # Порт публичный — без токена метрики только на METRICS_PORT
+        app.router.add_get(config.METRICS_PATH, metrics_endpoint)
+    if task_api_enabled():
+        app.add_subapp(API_PREFIX, task_api.create_app())
+    
+    update_queue = UpdateQueue()
+    app["update_queue"] = update_queue
+    UPDATE_QUEUE_PENDING.set_function(lambda: update_queue.pending)
+    
+    async def process_update(update_data: dict, replayed: bool) -> None:
+        update = Update.model_validate(update_data, context={"bot": bot})
+        # Обработку update из журнала прервал прошлый процесс — его захват
+        # в dedup перехватывается (см. DeduplicationMiddleware)
+        await dp.feed_update(bot, update, journal_replay=replayed)
+    
+    async def start_queue(app: web.Application) -> None:
+        await update_queue.start(process_update)
+    
+    async def stop_queue(app: web.Application) -> None:
+        await update_queue.stop(config.SHUTDOWN_TIMEOUT)
+    
+    # Пробрасывает startup/shutdown aiohttp в хуки диспетчера
+    setup_application(app, dp, bot=bot)
+    # Воркеры стартуют после хуков диспетчера (БД уже готова) и
+    # останавливаются до них
+    app.on_startup.append(start_queue)
+    app.on_shutdown.insert(0, stop_queue)
+    return app
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler("bot.log", encoding="utf-8")
-    ]
-)
-logger = logging.getLogger(__name__)
 
+async def wait_for_stop_signal() -> None:
+    """Ожидание SIGTERM (остановка платформой при деплое) или Ctrl+C"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        # На Windows обработчики сигналов в event loop не поддерживаются
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
 
-async def on_startup(bot: Bot) -> None:
-    """Действия при запуске бота"""
-    logger.info("Инициализация базы данных...")
-    await db_service.init_db()
+
+async def run_polling(bot: Bot, dp: Dispatcher) -> None:
+    """Запуск в режиме long polling"""
+    logger.info("Запуск бота (polling)...")
+    metrics_runner = await start_metrics_server()
+    task_api_runner = await start_task_api_server()
+    try:
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        if task_api_runner is not None:
+            await task_api_runner.cleanup()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """Запуск постоянного webhook-сервера"""
+    dp.startup.register(on_webhook_startup)
+    app = create_app(bot, dp)
+    metrics_runner = await start_metrics_server()
     
-    # Получаем информацию о боте
-    bot_info = await bot.get_me()
-    logger.info(f"Бот запущен: @{bot_info.username}")
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.WEB_HOST, port=config.WEB_PORT)
+    await site.start()
+    logger.info(f"Запуск бота (webhook) на {config.WEB_HOST}:{config.WEB_PORT}{config.WEBHOOK_PATH}")
+    
+    try:
+        # Работаем до SIGTERM / Ctrl+C; cleanup закрывает порт, затем
+        # дорабатывает очередь и вызывает on_shutdown
+        await wait_for_stop_signal()
+    finally:
+        await runner.cleanup()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
-async def on_shutdown(bot: Bot) -> None:
-    """Действия при остановке бота"""
-    logger.info("Бот остановлен")
+async def run_solver(bot: Bot, dp: Dispatcher) -> None:
+    """
+    Запуск solver-воркера: обновления из Telegram не принимает,
+    решает задания из очереди и отправляет ответы
+    """
+    worker = SolverWorker(bot, dp)
+    await dp.emit_startup(bot=bot)
+    metrics_runner = await start_metrics_server()
+    run = asyncio.create_task(worker.run())
+    stop_signal = asyncio.create_task(wait_for_stop_signal())
+    try:
+        done, _ = await asyncio.wait({run, stop_signal}, return_when=asyncio.FIRST_COMPLETED)
+        if run in done:
+            run.result()
+    finally:
+        # Цикл захвата прерывается сразу, начатые задачи дорабатываются в stop()
+        stop_signal.cancel()
+        run.cancel()
+        await worker.stop(config.SHUTDOWN_TIMEOUT)
+        await dp.emit_shutdown(bot=bot)
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 async def main() -> None:
     """Главная функция запуска бота"""
+    setup_logging()
+    
     # Валидация конфигурации
     try:
         config.validate()
@@ -132,23 +333,16 @@ async def main() -> None:
         sys.exit(1)
     
     # Создаём бота и диспетчер
-    bot = Bot(
-        token=config.BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-    )
-    dp = Dispatcher()
-    
-    # Регистрируем роутеры
-    dp.include_router(setup_routers())
+    bot = create_bot()
+    dp = create_dispatcher()
     
-    # Регистрируем хуки запуска/остановки
-    dp.startup.register(on_startup)
-    dp.shutdown.register(on_shutdown)
-    
-    # Запускаем polling
-    logger.info("Запуск бота...")
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if config.BOT_ROLE == "solver":
+            await run_solver(bot, dp)
+        elif config.BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp)
     finally:
         await bot.session.close()
 
@@ -158,4 +352,3 @@ if __name__ == "__main__":
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
->>>>>>> c019fb3704d76551e27d6d4b41bc90cfb01f08b4
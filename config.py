@@ -18,14 +18,149 @@ class Config:
     AI_API_KEY: str = os.getenv("AI_API_KEY", "")
     AI_API_URL: str = os.getenv("AI_API_URL", "https://api.openai.com/v1/chat/completions")
     AI_MODEL: str = os.getenv("AI_MODEL", "gpt-3.5-turbo")
+    # Быстрая модель для простых заданий (пусто — все задания на AI_MODEL)
+    AI_MODEL_FAST: str = os.getenv("AI_MODEL_FAST", "")
+    AI_TIER_THRESHOLD: int = int(os.getenv("AI_TIER_THRESHOLD", "2"))  # Баллы сложности для AI_MODEL
+    # Цены за 1M токенов (вход/выход) для учёта стоимости: "gpt-4o-mini=0.15/0.6,gpt-4o=2.5/10"
+    AI_PRICES: dict[str, tuple[float, float]] = {
+        name.strip(): (float(price_in), float(price_out))
+        for name, _, prices in (
+            item.partition("=") for item in os.getenv("AI_PRICES", "").split(",") if "=" in item
+        )
+        for price_in, _, price_out in (prices.partition("/"),)
+    }
     
     # Лимиты
     MAX_MESSAGE_LENGTH: int = 4096  # Лимит Telegram
     MAX_INPUT_LENGTH: int = 4000    # Максимальная длина входного текста
     REQUEST_TIMEOUT: int = 60       # Таймаут запроса к AI API (секунды)
     
+    # Режим работы: polling или webhook (постоянный aiohttp-сервер)
+    BOT_MODE: str = os.getenv("BOT_MODE", "polling")
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")         # Публичный адрес, например https://app.fly.dev
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")   # X-Telegram-Bot-Api-Secret-Token
+    WEB_HOST: str = os.getenv("WEB_HOST", "0.0.0.0")
+    WEB_PORT: int = int(os.getenv("PORT", "8080"))
+    
+    # Очередь входящих обновлений webhook
+    UPDATE_QUEUE_SIZE: int = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))  # Сверх лимита — 503, Telegram повторит
+    UPDATE_WORKERS: int = int(os.getenv("UPDATE_WORKERS", "8"))
+    UPDATE_QUEUE_PATH: str = os.getenv("UPDATE_QUEUE_PATH", "database/update_queue.db")
+    
+    # Роль процесса: all — всё в одном, ingress — только приём обновлений
+    # и постановка заданий в очередь, solver — только решение заданий из очереди
+    BOT_ROLE: str = os.getenv("BOT_ROLE", "all")
+    JOB_QUEUE_PATH: str = os.getenv("JOB_QUEUE_PATH", "database/jobs.db")
+    JOB_VISIBILITY_TIMEOUT: int = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "120"))  # Секунды
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+    SOLVER_CONCURRENCY: int = int(os.getenv("SOLVER_CONCURRENCY", "4"))
+    
+    # Дедупликация update_id (повторные доставки Telegram)
+    DEDUP_WINDOW_SIZE: int = int(os.getenv("DEDUP_WINDOW_SIZE", "10000"))        # update_id в памяти
+    DEDUP_WINDOW_SECONDS: int = int(os.getenv("DEDUP_WINDOW_SECONDS", "86400"))  # Хранение в SQLite
+    DEDUP_PROCESSING_TTL: int = int(os.getenv("DEDUP_PROCESSING_TTL", "300"))    # Зависшая обработка
+    DEDUP_PERSIST: bool = os.getenv("DEDUP_PERSIST", "1") == "1"                 # Общая таблица для инстансов
+    
+    # Исходящие сообщения: лимиты Telegram (~30 сообщений/с всего, ~1/с в чат)
+    SEND_GLOBAL_RATE: float = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+    SEND_CHAT_RATE: float = float(os.getenv("SEND_CHAT_RATE", "1"))
+    SEND_CHAT_BURST: int = int(os.getenv("SEND_CHAT_BURST", "3"))                # Подряд без ожидания
+    SEND_QUEUE_IDLE_TIMEOUT: float = float(os.getenv("SEND_QUEUE_IDLE_TIMEOUT", "60"))  # Простой очереди чата
+    
+    # Ограничения на пользователя (задания с текстом и фото)
+    THROTTLE_RATE_LIMIT: int = int(os.getenv("THROTTLE_RATE_LIMIT", "5"))       # Заданий за окно, 0 — без лимита
+    THROTTLE_RATE_WINDOW: int = int(os.getenv("THROTTLE_RATE_WINDOW", "60"))    # Скользящее окно (секунды)
+    THROTTLE_DAILY_QUOTA: int = int(os.getenv("THROTTLE_DAILY_QUOTA", "50"))    # Заданий в сутки (UTC), 0 — без лимита
+    THROTTLE_FLUSH_INTERVAL: int = int(os.getenv("THROTTLE_FLUSH_INTERVAL", "10"))  # Сброс счётчиков в SQLite
+    
+    # Кнопка «Попробовать снова»: сколько хранится состояние неудавшегося запроса
+    RETRY_STATE_TTL: int = int(os.getenv("RETRY_STATE_TTL", "600"))      # Секунды
+    RETRY_STATE_SIZE: int = int(os.getenv("RETRY_STATE_SIZE", "10000"))  # Записей в памяти
+    
+    # OCR: потоков подготовки изображений (Pillow)
+    OCR_WORKERS: int = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 2)))
+    
+    # Метрики Prometheus: отдельный сервер на METRICS_PORT (0 — выключен; у каждого
+    # процесса на хосте свой порт). На публичном порту webhook — только с METRICS_TOKEN
+    METRICS_PATH: str = os.getenv("METRICS_PATH", "/metrics")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")  # Authorization: Bearer <токен>
+    
+    # Потоковый ответ AI (stream=true): нужен для замера времени до первого токена.
+    # Если провайдер отклоняет stream/stream_options (400/422 с упоминанием stream),
+    # запрос повторяется без потока, и поток выключается на 10 минут
+    AI_STREAM: bool = os.getenv("AI_STREAM", "1") == "1"
+    # Короткий системный промпт предмета, если предмет определён локально
+    AI_SUBJECT_PROMPTS: bool = os.getenv("AI_SUBJECT_PROMPTS", "1") == "1"
+    
+    # Администраторы (telegram_id через запятую): команда /latency
+    ADMIN_IDS: frozenset[int] = frozenset(
+        int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x
+    )
+    
+    # Логирование: запись в файл и консоль — в фоновом потоке, не в event loop
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FILE: str = os.getenv("LOG_FILE", "bot.log")                  # Пусто — только консоль
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")                 # text | json (JSON lines)
+    LOG_MAX_BYTES: int = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # Ротация по размеру
+    LOG_ROTATE_WHEN: str = os.getenv("LOG_ROTATE_WHEN", "")           # midnight, H... — ротация по времени
+    LOG_BACKUP_COUNT: int = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))   # Сверх — записи отбрасываются
+    # Доля сохраняемых INFO/DEBUG по логгерам: "aiogram.event=0.1,middlewares.dedup=0.5"
+    LOG_SAMPLING: dict[str, float] = {
+        name.strip(): float(rate)
+        for name, _, rate in (
+            item.partition("=") for item in os.getenv("LOG_SAMPLING", "").split(",") if "=" in item
+        )
+    }
+    
+    # Деградация под нагрузкой: пороги сигналов давления и гистерезис
+    DEGRADE_ENABLED: bool = os.getenv("DEGRADE_ENABLED", "1") == "1"
+    DEGRADE_OCR_QUEUE: int = int(os.getenv("DEGRADE_OCR_QUEUE", "20"))          # Фото в очереди подготовки OCR
+    DEGRADE_AI_IN_FLIGHT: int = int(os.getenv("DEGRADE_AI_IN_FLIGHT", "40"))    # Запросов к AI одновременно
+    DEGRADE_P95_SECONDS: float = float(os.getenv("DEGRADE_P95_SECONDS", "25"))  # p95 решения через AI
+    DEGRADE_WINDOW: int = int(os.getenv("DEGRADE_WINDOW", "30"))                # Окно p95 (секунды)
+    DEGRADE_STEP_INTERVAL: float = float(os.getenv("DEGRADE_STEP_INTERVAL", "10"))  # Ступень вверх не чаще
+    DEGRADE_RECOVER_RATIO: float = float(os.getenv("DEGRADE_RECOVER_RATIO", "0.6"))  # Доля порогов для восстановления
+    DEGRADE_COOLDOWN: float = float(os.getenv("DEGRADE_COOLDOWN", "30"))        # Секунд спокойствия на ступень вниз
+    DEGRADE_MAX_TOKENS: int = int(os.getenv("DEGRADE_MAX_TOKENS", "800"))       # Длина ответа в режиме short_answers
+    DEGRADE_OCR_WIDTH: int = int(os.getenv("DEGRADE_OCR_WIDTH", "800"))         # Ширина фото в режиме ocr_reduced
+    DEGRADE_CORPUS_SIMILARITY: float = float(os.getenv("DEGRADE_CORPUS_SIMILARITY", "0.8"))
+    DEGRADE_CACHE_TTL: int = int(os.getenv("DEGRADE_CACHE_TTL", "120"))         # Срок кэша для урезанных ответов
+    
     # Пути
-    DATABASE_PATH: str = "database/gdz.db"
+    DATABASE_PATH: str = os.getenv("DATABASE_PATH", "database/gdz.db")
+    
+    # Корпус готовых ответов (import_answers.py); нет файла — поиск выключен
+    ANSWER_CORPUS_PATH: str = os.getenv("ANSWER_CORPUS_PATH", "database/answers.db")
+    ANSWER_CORPUS_MIN_SIMILARITY: float = float(os.getenv("ANSWER_CORPUS_MIN_SIMILARITY", "0.9"))
+    
+    # Кэш недавних решений AI в памяти (по нормализованному тексту задания)
+    SOLUTION_CACHE_SIZE: int = int(os.getenv("SOLUTION_CACHE_SIZE", "1000"))  # 0 — выключен
+    SOLUTION_CACHE_TTL: int = int(os.getenv("SOLUTION_CACHE_TTL", "3600"))    # Секунды
+    USER_ID_CACHE_SIZE: int = int(os.getenv("USER_ID_CACHE_SIZE", "10000"))  # telegram_id -> users.id
+    
+    # Остановка: задания в работе дорабатываются, горячие кэши сохраняются на диск
+    SHUTDOWN_TIMEOUT: float = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))  # Секунды на доработку заданий
+    # Снимок кэшей для следующего запуска (пусто — без снимка)
+    WARM_STATE_PATH: str = os.getenv("WARM_STATE_PATH", f"database/warm_state_{BOT_ROLE}.json")
+    
+    # HTTP API заданий для партнёров (только BOT_ROLE=all): "имя:ключ:заданий_в_сутки,..."
+    # Нет ключей — API выключен. В webhook — на основном порту, иначе на TASK_API_PORT
+    TASK_API_KEYS: dict[str, tuple[str, int]] = {
+        parts[1]: (parts[0], int(parts[2]) if len(parts) > 2 and parts[2] else 0)
+        for parts in (
+            [part.strip() for part in item.split(":")]
+            for item in os.getenv("TASK_API_KEYS", "").split(",") if item.count(":") >= 1
+        )
+    }
+    TASK_API_PORT: int = int(os.getenv("TASK_API_PORT", "8081"))
+    TASK_API_RATE_LIMIT: int = int(os.getenv("TASK_API_RATE_LIMIT", "60"))    # Заданий за THROTTLE_RATE_WINDOW на ключ
+    TASK_API_BATCH_MAX: int = int(os.getenv("TASK_API_BATCH_MAX", "50"))      # Заданий в одной пачке
+    TASK_API_CONCURRENCY: int = int(os.getenv("TASK_API_CONCURRENCY", "8"))   # Заданий API в работе одновременно
+    TASK_API_MAX_BODY: int = int(os.getenv("TASK_API_MAX_BODY", str(20 * 1024 * 1024)))  # Байт (фото в base64)
     
     @classmethod
     def validate(cls) -> None:
@@ -34,6 +169,12 @@ class Config:
             raise ValueError("BOT_TOKEN не установлен в .env файле")
         if not cls.AI_API_KEY:
             raise ValueError("AI_API_KEY не установлен в .env файле")
+        if cls.BOT_MODE not in ("polling", "webhook"):
+            raise ValueError(f"Неизвестный BOT_MODE: {cls.BOT_MODE}")
+        if cls.BOT_ROLE not in ("all", "ingress", "solver"):
+            raise ValueError(f"Неизвестный BOT_ROLE: {cls.BOT_ROLE}")
+        if cls.BOT_MODE == "webhook" and not cls.WEBHOOK_SECRET:
+            raise ValueError("WEBHOOK_SECRET обязателен в режиме webhook")
 
 
 config = Config()
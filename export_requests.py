@@ -0,0 +1,256 @@
+"""
+Потоковая выгрузка запросов (requests + users) для аналитики
+
+Строки читаются страницами по id (keyset: WHERE id > последний LIMIT n)
+через соединение только для чтения: каждая страница — короткое чтение,
+бот в это время пишет в БД как обычно. В памяти — одна страница.
+
+    python export_requests.py requests.jsonl.gz
+    python export_requests.py march.csv.gz --since 2025-03-01 --until 2025-04-01
+    python export_requests.py requests.parquet --user 123456789 --source image
+    python export_requests.py daily.jsonl.gz --checkpoint export.checkpoint.json
+
+С --checkpoint выгружаются только строки новее прошлой выгрузки, и не
+дальше первого запроса, который ещё может измениться: решается (pending
+моложе --pending-minutes) или неудачен, но кнопка «Попробовать снова»
+ещё работает (failed моложе RETRY_STATE_TTL) — он попадёт в следующую
+выгрузку с итоговым ответом. Более старые pending (бот упал или
+остановился посреди решения) и failed уже не изменятся: они выгружаются
+как есть и выгрузку не держат. Parquet требует pyarrow.
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import nullcontext
+from typing import IO, ContextManager, Iterator, Optional
+
+from config import config
+
+COLUMNS = (
+    "id", "user_id", "telegram_id", "username", "source", "status",
+    "request_text", "response_text", "latency_ms", "created_at",
+)
+
+SELECT = """
+    SELECT r.id, r.user_id, u.telegram_id, u.username, r.source, r.status,
+           r.request_text, r.response_text, r.latency_ms, r.created_at
+    FROM requests r
+    LEFT JOIN users u ON u.id = r.user_id
+"""
+
+FORMATS = ("jsonl", "csv", "parquet")
+
+
+def parse_args() -> argparse.Namespace:
+    """Разбор аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Потоковая выгрузка таблицы requests")
+    parser.add_argument("output", help="Файл (.jsonl, .csv, .parquet; .gz — со сжатием) или - для stdout")
+    parser.add_argument("--db", default=config.DATABASE_PATH, help="База (по умолчанию DATABASE_PATH)")
+    parser.add_argument("--format", choices=FORMATS, help="По умолчанию — по расширению файла")
+    parser.add_argument("--since", help="created_at не раньше (YYYY-MM-DD или YYYY-MM-DD HH:MM:SS, UTC)")
+    parser.add_argument("--until", help="created_at раньше (UTC)")
+    parser.add_argument("--user", type=int, action="append", default=[], help="telegram_id (можно несколько)")
+    parser.add_argument("--source", action="append", default=[], help="text, image, api... (можно несколько)")
+    parser.add_argument("--checkpoint", help="JSON с последним выгруженным id: выгрузка только новых строк")
+    parser.add_argument("--pending-minutes", type=int, default=30,
+                        help="pending моложе этого считаются решаемыми (с --checkpoint)")
+    parser.add_argument("--batch", type=int, default=5000, help="Строк на страницу")
+    parser.add_argument("--pause", type=float, default=0.0, help="Пауза между страницами (секунды)")
+    return parser.parse_args()
+
+
+def detect_format(output: str, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    name = output[:-3] if output.endswith(".gz") else output
+    for candidate in FORMATS:
+        if name.endswith(f".{candidate}"):
+            return candidate
+    raise SystemExit(f"Не удалось определить формат по имени {output!r}: укажи --format")
+
+
+def open_readonly(path: str) -> sqlite3.Connection:
+    """Соединение только для чтения; autocommit — снимок не держится между страницами"""
+    if not os.path.exists(path):
+        raise SystemExit(f"База не найдена: {path}")
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, isolation_level=None)
+    db.execute("PRAGMA busy_timeout=5000")
+    db.execute("PRAGMA query_only=1")
+    return db
+
+
+def load_checkpoint(path: Optional[str]) -> int:
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        return int(json.load(f)["last_id"])
+
+
+def save_checkpoint(path: str, last_id: int, rows: int) -> None:
+    """Атомарная запись: прерванная выгрузка не портит checkpoint"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"last_id": last_id, "rows": rows, "exported_at": time.strftime("%Y-%m-%d %H:%M:%S")}, f)
+    os.replace(tmp, path)
+
+
+def id_range(db: sqlite3.Connection, args: argparse.Namespace, after_id: int) -> tuple[int, int]:
+    """
+    Диапазон id для обхода: (после какого id начинать, последний id)
+
+    Фильтр по датам сужает диапазон через индекс по created_at, чтобы не
+    читать годы истории ради одного месяца.
+    """
+    last_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM requests").fetchone()[0]
+    if args.since:
+        first = db.execute("SELECT MIN(id) FROM requests WHERE created_at >= ?", (args.since,)).fetchone()[0]
+        after_id = max(after_id, (first or last_id + 1) - 1)
+    if args.until:
+        last = db.execute("SELECT MAX(id) FROM requests WHERE created_at < ?", (args.until,)).fetchone()[0]
+        last_id = min(last_id, last or 0)
+    if args.checkpoint:
+        # Решаемые сейчас и ещё доступные для повтора запросы изменятся —
+        # выгрузка останавливается перед первым. Давний pending брошен (падение,
+        # остановка) и держал бы checkpoint вечно. Окно повтора отсчитывается от
+        # created_at (handlers/retry.py), минута запаса — на нажатие у границы
+        mutable = db.execute(
+            """SELECT MIN(id) FROM requests
+               WHERE id > ? AND (
+                   (status = 'pending' AND created_at > datetime('now', ?))
+                   OR (status = 'failed' AND created_at > datetime('now', ?))
+               )""",
+            (after_id, f"-{args.pending_minutes} minutes", f"-{config.RETRY_STATE_TTL + 60} seconds")
+        ).fetchone()[0]
+        if mutable is not None:
+            last_id = min(last_id, mutable - 1)
+    return after_id, last_id
+
+
+def iter_pages(
+    db: sqlite3.Connection,
+    args: argparse.Namespace,
+    after_id: int,
+    last_id: int
+) -> Iterator[list[tuple]]:
+    """Страницы строк по возрастанию id"""
+    where = ["r.id > ?", "r.id <= ?"]
+    params: list = []
+    if args.since:
+        where.append("r.created_at >= ?")
+        params.append(args.since)
+    if args.until:
+        where.append("r.created_at < ?")
+        params.append(args.until)
+    if args.user:
+        where.append(f"u.telegram_id IN ({','.join('?' * len(args.user))})")
+        params.extend(args.user)
+    if args.source:
+        where.append(f"r.source IN ({','.join('?' * len(args.source))})")
+        params.extend(args.source)
+    query = f"{SELECT} WHERE {' AND '.join(where)} ORDER BY r.id LIMIT ?"
+
+    cursor_id = after_id
+    while cursor_id < last_id:
+        rows = db.execute(query, (cursor_id, last_id, *params, args.batch)).fetchall()
+        if not rows:
+            return
+        yield rows
+        cursor_id = rows[-1][0]
+        if args.pause:
+            time.sleep(args.pause)
+
+
+def open_text(output: str) -> ContextManager[IO[str]]:
+    if output == "-":
+        # stdout не закрывается вместе с выгрузкой
+        return nullcontext(sys.stdout)
+    if output.endswith(".gz"):
+        return gzip.open(output, "wt", encoding="utf-8", newline="")
+    return open(output, "w", encoding="utf-8", newline="")
+
+
+def write_jsonl(pages: Iterator[list[tuple]], output: str) -> int:
+    total = 0
+    with open_text(output) as out:
+        for rows in pages:
+            out.writelines(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows)
+            total = report(total, len(rows))
+    return total
+
+
+def write_csv(pages: Iterator[list[tuple]], output: str) -> int:
+    total = 0
+    with open_text(output) as out:
+        writer = csv.writer(out)
+        writer.writerow(COLUMNS)
+        for rows in pages:
+            writer.writerows(rows)
+            total = report(total, len(rows))
+    return total
+
+
+def write_parquet(pages: Iterator[list[tuple]], output: str) -> int:
+    """Страница — группа строк Parquet (zstd)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Для Parquet нужен pyarrow: pip install pyarrow")
+
+    schema = pa.schema([
+        ("id", pa.int64()), ("user_id", pa.int64()), ("telegram_id", pa.int64()),
+        ("username", pa.string()), ("source", pa.string()), ("status", pa.string()),
+        ("request_text", pa.string()), ("response_text", pa.string()),
+        ("latency_ms", pa.int64()), ("created_at", pa.string()),
+    ])
+    total = 0
+    with pq.ParquetWriter(output, schema, compression="zstd") as writer:
+        for rows in pages:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema
+            ))
+            total = report(total, len(rows))
+    return total
+
+
+def report(total: int, added: int) -> int:
+    """Прогресс в stderr каждые 100 тысяч строк; возвращает новый итог"""
+    if (total + added) // 100_000 > total // 100_000:
+        print(f"... {total + added} строк", file=sys.stderr)
+    return total + added
+
+
+WRITERS = {"jsonl": write_jsonl, "csv": write_csv, "parquet": write_parquet}
+
+
+def main() -> None:
+    args = parse_args()
+    fmt = detect_format(args.output, args.format)
+    if fmt == "parquet" and args.output == "-":
+        raise SystemExit("Parquet нельзя писать в stdout")
+
+    db = open_readonly(args.db)
+    started = time.monotonic()
+    after_id, last_id = id_range(db, args, load_checkpoint(args.checkpoint))
+    total = WRITERS[fmt](iter_pages(db, args, after_id, last_id), args.output)
+    db.close()
+
+    # Checkpoint сдвигается только после полностью записанного файла
+    if args.checkpoint:
+        save_checkpoint(args.checkpoint, max(after_id, last_id), total)
+
+    print(
+        f"Выгружено строк: {total} (id {after_id + 1}..{last_id}) за {time.monotonic() - started:.1f} с",
+        file=sys.stderr
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,14 @@
 """
 from aiogram import Router
 
+from config import config
 from handlers.start import router as start_router
+from handlers.admin import router as admin_router
 from handlers.text import router as text_router
 from handlers.image import router as image_router
+from handlers.small_talk import router as small_talk_router
+from handlers.callbacks import router as callbacks_router
+from handlers.retry import router as retry_router
 
 
 def setup_routers() -> Router:
@@ -14,7 +19,29 @@ def setup_routers() -> Router:
     
     # Порядок важен: start должен быть первым
     main_router.include_router(start_router)
+    main_router.include_router(admin_router)  # До текста: /latency не задание
     main_router.include_router(image_router)  # Фото перед текстом
+    # «Привет», «спасибо» — ответ без AI; до текста и вне лимитов и очереди заданий
+    main_router.include_router(small_talk_router)
     main_router.include_router(text_router)
+    main_router.include_router(callbacks_router)
+    main_router.include_router(retry_router)
+    
+    if config.BOT_ROLE != "solver":
+        # Лимиты проверяются при приёме: solver получает уже допущенные задания.
+        # Регистрируется раньше offload, чтобы отказ не попадал в очередь
+        from middlewares.throttling import ThrottlingMiddleware
+        throttling = ThrottlingMiddleware()
+        image_router.message.middleware(throttling)
+        text_router.message.middleware(throttling)
+        retry_router.callback_query.middleware(throttling)
+    
+    if config.BOT_ROLE == "ingress":
+        # Задания решают solver-воркеры, здесь только постановка в очередь
+        from middlewares.offload import JobOffloadMiddleware
+        image_router.message.middleware(JobOffloadMiddleware())
+        text_router.message.middleware(JobOffloadMiddleware())
+        # Повтор — тоже запрос к AI
+        retry_router.callback_query.middleware(JobOffloadMiddleware())
     
     return main_router
@@ -0,0 +1,52 @@
+"""
+Команды администратора
+"""
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+from typing import Optional
+import re
+import time
+
+from config import config
+from services.db_service import db_service
+from services.sender import sender
+
+router = Router()
+# Команды видны только администраторам, остальным — как обычный текст
+router.message.filter(F.from_user.id.in_(config.ADMIN_IDS))
+
+_WINDOW_RE = re.compile(r"^(\d+)([mhd])$")
+_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+def _parse_window(value: str) -> Optional[int]:
+    """«30m», «24h», «7d» в секунды"""
+    match = _WINDOW_RE.match(value.strip().lower())
+    if not match:
+        return None
+    return int(match.group(1)) * _UNITS[match.group(2)]
+
+
+@router.message(Command("latency"))
+async def cmd_latency(message: Message, command: CommandObject) -> None:
+    """Перцентили длительности этапов: /latency [30m|24h|7d]"""
+    window_arg = command.args or "24h"
+    window = _parse_window(window_arg)
+    if window is None:
+        await sender.answer(message, "Использование: /latency [30m|24h|7d]")
+        return
+    
+    rows = await db_service.get_stage_percentiles(since=time.time() - window)
+    if not rows:
+        await sender.answer(message, f"За {window_arg} трасс нет.")
+        return
+    
+    lines = [f"{'этап':<15}{'n':>6}{'p50':>8}{'p95':>8}{'p99':>8}"]
+    for stage, count, p50, p95, p99 in rows:
+        lines.append(f"{stage:<15}{count:>6}{p50:>8.0f}{p95:>8.0f}{p99:>8.0f}")
+    
+    await sender.answer(
+        message,
+        f"⏱ Этапы за {window_arg}, мс:\n<pre>" + "\n".join(lines) + "</pre>"
+    )
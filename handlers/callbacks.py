@@ -0,0 +1,28 @@
+"""
+Обработчик inline-кнопок сообщений о обработке
+"""
+from aiogram import Router, F
+from aiogram.types import CallbackQuery
+
+from services.cancel_service import cancel_service
+
+router = Router()
+
+
+@router.callback_query(F.data == "cancel")
+async def handle_cancel(callback: CallbackQuery) -> None:
+    """Кнопка «❌ Отмена» под сообщением о обработке"""
+    if callback.message is None:
+        await callback.answer()
+        return
+    
+    cancelled = await cancel_service.cancel(
+        chat_id=callback.message.chat.id,
+        message_id=callback.message.message_id,
+        user_id=callback.from_user.id
+    )
+    
+    if cancelled:
+        await callback.answer("🚫 Отменяю...")
+    else:
+        await callback.answer("Задание уже завершено")
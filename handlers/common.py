@@ -0,0 +1,117 @@
+"""
+Общие функции обработчиков заданий
+"""
+from aiogram.types import Message
+import logging
+import time
+
+from config import config
+from services.cancel_service import cancel_service, SolveCancelled
+from services.db_service import db_service, CANCELLED, FAILED
+from services.load_shedder import Overloaded
+from services.logging_setup import bind_log_context
+from services.request_state import request_state, RetryState
+from services.sender import sender
+from services.solve_pipeline import solve_pipeline, save_trace
+from services.trace import current_trace, stage
+from keyboards.main import get_retry_keyboard
+from utils.chunker import split_message
+
+logger = logging.getLogger(__name__)
+
+# Запас под заголовок «📄 Продолжение (i/n):» в частях после первой
+CONTINUATION_RESERVE = 40
+
+CANCELLED_TEXT = "🚫 Задание отменено."
+
+OVERLOADED_TEXT = "⏳ Сейчас очень много заданий. Попробуй, пожалуйста, через минуту."
+
+
+async def send_solution(message: Message, solution: str) -> None:
+    """Отправка решения, при необходимости несколькими сообщениями"""
+    parts = split_message(solution, config.MAX_MESSAGE_LENGTH - CONTINUATION_RESERVE)
+    
+    for i, part in enumerate(parts):
+        if i == 0:
+            await sender.answer(message, part)
+        else:
+            await sender.answer(message, f"📄 Продолжение ({i+1}/{len(parts)}):\n\n{part}")
+
+
+async def solve_task(
+    processing_msg: Message,
+    telegram_id: int,
+    request_id: int,
+    task_text: str,
+    started: float
+) -> None:
+    """
+    Этап решения (кэш, корпус готовых ответов, AI), запись ответа в запрос и отправка
+    
+    Общий для текста, фото и кнопки повтора. При неудаче под сообщением
+    о обработке появляется кнопка «Попробовать снова», а текст задания
+    сохраняется в request_state — повтор не делает OCR и новую запись в БД.
+    """
+    bind_log_context(request_id=request_id)
+    try:
+        # Кнопка отмены прерывает запрос к AI
+        async with cancel_service.track(processing_msg, telegram_id) as scope:
+            solution = await scope.run(solve_pipeline.solve(task_text))
+        
+        # Ответ из одних пробелов отправить нельзя — как пустой
+        if not solution or not solution.strip():
+            await _offer_retry(
+                processing_msg, telegram_id, request_id, task_text,
+                "❌ Не удалось получить решение. Попробуй ещё раз позже.\n"
+                "Возможно, сервис временно недоступен."
+            )
+            return
+        
+        # Обновляем ответ в БД
+        latency_ms = int((time.monotonic() - started) * 1000)
+        await db_service.update_response(request_id, solution, latency_ms)
+        
+        # Удаляем сообщение о обработке
+        await sender.delete(processing_msg)
+        
+        # Отправляем ответ (длинный — несколькими сообщениями)
+        with stage("send"):
+            await send_solution(processing_msg, solution)
+    
+    except SolveCancelled:
+        await db_service.set_request_status(request_id, CANCELLED)
+        await sender.edit_text(processing_msg, CANCELLED_TEXT)
+    
+    except Overloaded:
+        await _offer_retry(processing_msg, telegram_id, request_id, task_text, OVERLOADED_TEXT)
+    
+    except Exception as e:
+        logger.error(f"Ошибка решения запроса {request_id}: {e}")
+        await _offer_retry(
+            processing_msg, telegram_id, request_id, task_text,
+            "❌ Произошла ошибка при обработке. Попробуй ещё раз."
+        )
+    
+    finally:
+        await save_trace(request_id)
+
+
+async def _offer_retry(
+    processing_msg: Message,
+    telegram_id: int,
+    request_id: int,
+    task_text: str,
+    error_text: str
+) -> None:
+    """Запрос помечается неудавшимся, под ошибкой — кнопка повтора"""
+    trace = current_trace()
+    request_state.put(RetryState(
+        request_id=request_id,
+        telegram_id=telegram_id,
+        task_text=task_text,
+        chat_id=processing_msg.chat.id,
+        message_id=processing_msg.message_id,
+        retries=trace.attrs.get("retries", 0) if trace is not None else 0
+    ))
+    await db_service.set_request_status(request_id, FAILED)
+    await sender.edit_text(processing_msg, error_text, reply_markup=get_retry_keyboard(request_id))
@@ -0,0 +1,67 @@
+"""
+Обработчик кнопки «🔄 Попробовать снова» под неудавшимся решением
+"""
+from aiogram import Router, F
+from aiogram.types import CallbackQuery
+import time
+
+from config import config
+from services.db_service import db_service, PENDING
+from services.request_state import request_state
+from services.sender import sender
+from services.trace import start_trace
+from handlers.common import solve_task
+from keyboards.main import get_cancel_keyboard
+
+router = Router()
+
+# Префикс текста фото-запросов в таблице requests
+IMAGE_PREFIX = "[IMAGE OCR] "
+
+
+@router.callback_query(F.data.startswith("retry:"))
+async def handle_retry(callback: CallbackQuery) -> None:
+    """Повтор только этапа AI: текст задания и запись запроса уже есть"""
+    if callback.message is None:
+        await callback.answer()
+        return
+    
+    try:
+        request_id = int(callback.data.split(":", 1)[1])
+    except ValueError:
+        await callback.answer()
+        return
+    
+    # Состояние в памяти (take — повторное нажатие не запустит второй запрос);
+    # после перезапуска или в другом процессе — из строки запроса в БД.
+    # Окно повтора в обоих случаях — RETRY_STATE_TTL от создания запроса:
+    # после него строка уже не меняется, и export_requests --checkpoint её не ждёт
+    state = request_state.take(request_id)
+    row = await db_service.get_failed_request(request_id, config.RETRY_STATE_TTL)
+    valid = row is not None
+    if state is not None:
+        telegram_id, task_text, retries = state.telegram_id, state.task_text, state.retries
+        valid = valid and (state.chat_id, state.message_id) == (callback.message.chat.id, callback.message.message_id)
+    elif valid:
+        telegram_id, task_text, source = row
+        retries = 0
+        if source == "image" and task_text.startswith(IMAGE_PREFIX):
+            task_text = task_text[len(IMAGE_PREFIX):]
+    
+    # Повторить может только автор запроса
+    if not valid or telegram_id != callback.from_user.id:
+        if state is not None:
+            request_state.put(state)
+        await callback.answer("Повтор недоступен — отправь задание заново", show_alert=True)
+        return
+    
+    await callback.answer("🔄 Пробую снова...")
+    start_trace("retry").set(retries=retries + 1)
+    await db_service.set_request_status(request_id, PENDING)
+    await sender.edit_text(
+        callback.message,
+        "🤖 Думаю над решением...",
+        reply_markup=get_cancel_keyboard()
+    )
+    
+    await solve_task(callback.message, telegram_id, request_id, task_text, time.monotonic())
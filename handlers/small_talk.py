@@ -0,0 +1,43 @@
+"""
+Обработчик сообщений без задания: приветствия, благодарности, реплики
+Отвечает локально, без записи в БД, лимитов и запроса к AI
+"""
+from aiogram import Router, F
+from aiogram.filters import BaseFilter
+from aiogram.types import Message
+from typing import Union
+
+from services.metrics import LOCAL_REPLIES_TOTAL
+from services.sender import sender
+from utils.task_classifier import (
+    classify_message, GREETING, NOT_TASK, SMALL_TALK, TASK, THANKS
+)
+
+router = Router()
+
+REPLIES = {
+    GREETING: "👋 Привет! Пришли задание текстом или фото — я решу и объясню.",
+    THANKS: "😊 Пожалуйста! Присылай следующее задание.",
+    SMALL_TALK: (
+        "🤖 Я решаю домашние задания по школьным предметам.\n"
+        "Напиши условие задачи или отправь фото."
+    ),
+    NOT_TASK: "🤔 Не вижу здесь задания. Напиши условие текстом или отправь фото.",
+}
+
+
+class NotTaskFilter(BaseFilter):
+    """Пропускает сообщения, на которые не нужен AI; тип передаётся в обработчик"""
+
+    async def __call__(self, message: Message) -> Union[bool, dict]:
+        kind = classify_message(message.text)
+        if kind == TASK:
+            return False
+        return {"kind": kind}
+
+
+@router.message(F.text, NotTaskFilter())
+async def handle_small_talk(message: Message, kind: str) -> None:
+    """Локальный ответ вместо решения"""
+    LOCAL_REPLIES_TOTAL.labels(kind).inc()
+    await sender.answer(message, REPLIES[kind])
@@ -6,6 +6,7 @@ from aiogram.types import Message
 from aiogram.filters import CommandStart, Command
 
 from services.db_service import db_service
+from services.sender import sender
 from keyboards.main import get_main_keyboard
 
 router = Router()
@@ -30,7 +31,8 @@ async def cmd_start(message: Message) -> None:
 
 Давай начнём! 🚀"""
     
-    await message.answer(
+    await sender.answer(
+        message,
         welcome_text,
         reply_markup=get_main_keyboard()
     )
@@ -59,7 +61,7 @@ async def cmd_help(message: Message) -> None:
 🎓 Поддерживаемые предметы:
 Математика, Алгебра, Геометрия, Физика, Химия, Русский язык, Литература, История, Биология, География, Английский и другие"""
     
-    await message.answer(help_text)
+    await sender.answer(message, help_text)
 
 
 @router.message(F.text == "📊 Моя статистика")
@@ -73,4 +75,4 @@ async def cmd_stats(message: Message) -> None:
 
 Продолжай учиться! 💪"""
     
-    await message.answer(stats_text)
+    await sender.answer(message, stats_text)
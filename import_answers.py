@@ -0,0 +1,145 @@
+"""
+Импорт корпуса готовых ответов из JSONL в ANSWER_CORPUS_PATH
+
+Одна строка — одно задание:
+    {"task": "Решите уравнение 2x + 3 = 7", "answer": "x = 2",
+     "subject": "математика", "textbook": "Алгебра 7, Макарычев", "exercise": "245"}
+
+Файл читается потоково, пачками по --batch строк в одной транзакции,
+поэтому миллионы строк не нужно держать в памяти. Повторный импорт
+того же задания (по нормализованному тексту) обновляет ответ.
+
+    python import_answers.py answers.jsonl
+    python import_answers.py part1.jsonl part2.jsonl.gz --db database/answers.db
+    cat answers.jsonl | python import_answers.py -
+"""
+import argparse
+import gzip
+import json
+import sys
+import time
+from typing import IO, Iterator
+
+from config import config
+from services.answer_corpus import exercise_number, normalize_task, open_for_import, task_hash
+
+# Поля с текстом задания в разных выгрузках
+TASK_FIELDS = ("task", "task_text", "question", "text")
+
+
+def parse_args() -> argparse.Namespace:
+    """Разбор аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Импорт корпуса готовых ответов из JSONL")
+    parser.add_argument("files", nargs="+", help="JSONL (можно .gz); - — стандартный ввод")
+    parser.add_argument("--db", default=config.ANSWER_CORPUS_PATH,
+                        help="Файл корпуса (по умолчанию ANSWER_CORPUS_PATH)")
+    parser.add_argument("--batch", type=int, default=5000, help="Строк в одной транзакции")
+    return parser.parse_args()
+
+
+def open_source(path: str) -> IO[str]:
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def read_records(path: str, errors: list[int]) -> Iterator[tuple]:
+    """Строки файла -> (hash, нормализованный текст, task, answer, subject, textbook, exercise)"""
+    with open_source(path) as source:
+        for line_number, line in enumerate(source, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                task = next(record[field] for field in TASK_FIELDS if record.get(field))
+                answer = str(record["answer"])
+            except (ValueError, KeyError, StopIteration, TypeError):
+                errors[0] += 1
+                if errors[0] <= 10:
+                    print(f"{path}:{line_number}: пропущена строка без задания или ответа", file=sys.stderr)
+                continue
+
+            exercise = record.get("exercise")
+            exercise = str(exercise).replace(",", ".") if exercise is not None else exercise_number(task)
+            normalized = normalize_task(task)
+            yield (
+                task_hash(normalized), normalized, task, answer,
+                record.get("subject"), record.get("textbook"), exercise
+            )
+
+
+def batches(records: Iterator[tuple], size: int) -> Iterator[list[tuple]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_batch(db, batch: list[tuple]) -> int:
+    """Пачка в одной транзакции; возвращает число новых заданий"""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        last_id = db.execute("SELECT MAX(id) FROM answers").fetchone()[0] or 0
+        db.executemany(
+            """INSERT INTO answers (text_hash, task_text, answer, subject, textbook, exercise)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT(text_hash) DO UPDATE SET
+                   answer = excluded.answer,
+                   subject = excluded.subject,
+                   textbook = excluded.textbook,
+                   exercise = excluded.exercise""",
+            [(h, task, answer, subject, textbook, exercise)
+             for h, _, task, answer, subject, textbook, exercise in batch]
+        )
+
+        # В триграммный индекс — только новые строки (у обновлённых текст тот же)
+        normalized = {h: norm for h, norm, *_ in batch}
+        new_rows = db.execute(
+            "SELECT id, text_hash FROM answers WHERE id > ?", (last_id,)
+        ).fetchall()
+        db.executemany(
+            "INSERT INTO answers_fts (rowid, norm_text) VALUES (?, ?)",
+            [(row_id, normalized[h]) for row_id, h in new_rows]
+        )
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    return len(new_rows)
+
+
+def main() -> None:
+    args = parse_args()
+    db = open_for_import(args.db)
+    # Потеря последней пачки при сбое не страшна — импорт можно повторить
+    db.execute("PRAGMA synchronous=NORMAL")
+
+    started = time.monotonic()
+    total = inserted = 0
+    errors = [0]
+    for path in args.files:
+        for batch in batches(read_records(path, errors), args.batch):
+            inserted += import_batch(db, batch)
+            total += len(batch)
+            if total % 100_000 < len(batch):
+                print(f"... {total} строк, {total / (time.monotonic() - started):.0f} строк/с", file=sys.stderr)
+
+    db.execute("PRAGMA optimize")
+    count = db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+    db.close()
+
+    print(
+        f"Импортировано строк: {total} (новых {inserted}, обновлено {total - inserted}, "
+        f"с ошибками {errors[0]}) за {time.monotonic() - started:.1f} с. В корпусе: {count}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 """
 Клавиатуры бота
 """
+from typing import Optional
+
 from aiogram.types import (
     ReplyKeyboardMarkup, 
     KeyboardButton,
@@ -32,11 +34,12 @@ def get_cancel_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
-def get_retry_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура повторной попытки"""
+def get_retry_keyboard(request_id: Optional[int] = None) -> InlineKeyboardMarkup:
+    """Клавиатура повторной попытки (request_id — какой запрос повторить)"""
+    callback_data = "retry" if request_id is None else f"retry:{request_id}"
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="🔄 Попробовать снова", callback_data="retry")]
+            [InlineKeyboardButton(text="🔄 Попробовать снова", callback_data=callback_data)]
         ]
     )
     return keyboard
@@ -0,0 +1,22 @@
+"""
+Middleware бота
+"""
+from aiogram import Dispatcher
+
+from config import config
+from middlewares.dedup import DeduplicationMiddleware
+from middlewares.metrics import MetricsMiddleware
+from middlewares.throttling import ThrottlingMiddleware
+
+
+def setup_middlewares(dp: Dispatcher) -> None:
+    """Регистрация middleware уровня диспетчера"""
+    dp.update.outer_middleware(MetricsMiddleware())
+
+    # Дубликаты отсекаются до любых фильтров и хендлеров. Solver получает
+    # update из очереди, уже прошедшие дедупликацию в ingress
+    if config.BOT_ROLE != "solver":
+        dp.update.outer_middleware(DeduplicationMiddleware())
+
+
+__all__ = ["setup_middlewares", "DeduplicationMiddleware", "MetricsMiddleware", "ThrottlingMiddleware"]
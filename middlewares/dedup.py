@@ -0,0 +1,53 @@
+"""
+Middleware идемпотентной обработки обновлений по update_id
+"""
+from typing import Any, Awaitable, Callable, Dict
+import logging
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from services.dedup_service import dedup_service
+
+logger = logging.getLogger(__name__)
+
+
+class DeduplicationMiddleware(BaseMiddleware):
+    """
+    Пропускает повторные доставки одного и того же update_id
+
+    Telegram доставляет update повторно после медленного ответа webhook
+    или перезапуска инстанса — без этой проверки заново запускаются OCR
+    и платный запрос к AI.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        # journal_replay: update из журнала очереди после перезапуска. Захват
+        # 'processing' остался от упавшего процесса — иначе update отбросили бы
+        # как дубликат, а очередь удалила бы его из журнала без ответа
+        if not await dedup_service.claim(event.update_id, take_over=data.get("journal_replay", False)):
+            dedup_service.record_duplicate(event)
+            logger.info(f"Дубликат update {event.update_id} пропущен")
+            return None
+
+        # finally, а не except Exception: обработку, прерванную при остановке
+        # (CancelledError), тоже нужно отпустить — иначе update из журнала
+        # очереди после перезапуска будет отброшен как дубликат
+        completed = False
+        try:
+            result = await handler(event, data)
+            completed = True
+        finally:
+            if not completed:
+                await dedup_service.release(event.update_id)
+
+        await dedup_service.complete(event.update_id)
+        return result
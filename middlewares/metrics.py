@@ -0,0 +1,45 @@
+"""
+Middleware учёта update: число в обработке и длительность
+"""
+from typing import Any, Awaitable, Callable, Dict
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from services.metrics import UPDATE_SECONDS, UPDATES_IN_FLIGHT, UPDATES_TOTAL
+from services.logging_setup import bind_log_context, reset_log_context
+from services.trace import reset_trace, restore_trace
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Внешний middleware диспетчера: видит все update, включая дубликаты
+
+    Заодно задаёт границу трассы: воркеры очереди webhook обрабатывают
+    update по очереди в одной задаче, и трасса прошлого задания не должна
+    достаться следующему.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        update_type = event.event_type
+        UPDATES_IN_FLIGHT.inc()
+        token = reset_trace()
+        log_token = bind_log_context(update_id=event.update_id)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            reset_log_context(log_token)
+            restore_trace(token)
+            UPDATE_SECONDS.labels(update_type).observe(time.perf_counter() - started)
+            UPDATES_TOTAL.labels(update_type).inc()
+            UPDATES_IN_FLIGHT.dec()
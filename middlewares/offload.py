@@ -0,0 +1,37 @@
+"""
+Middleware режима ingress: задания уходят в очередь solver-воркеров
+"""
+from typing import Any, Awaitable, Callable, Dict
+import logging
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from services.job_queue import job_queue
+from services.solver_worker import SOLVE_UPDATE
+
+logger = logging.getLogger(__name__)
+
+
+class JobOffloadMiddleware(BaseMiddleware):
+    """
+    Вместо вызова хендлера решения ставит update в очередь задач
+
+    Регистрируется как inner middleware на роутерах с OCR и AI, поэтому
+    срабатывает только когда фильтры уже выбрали хендлер решения.
+    Команды и кнопки меню обрабатываются в ingress как обычно.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        update: Update = data["event_update"]
+        payload = update.model_dump(mode="json", by_alias=True, exclude_none=True)
+
+        queued = await job_queue.enqueue(SOLVE_UPDATE, payload, dedup_key=str(update.update_id))
+        if queued:
+            logger.info(f"Update {update.update_id} поставлен в очередь решений")
+        return None
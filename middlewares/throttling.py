@@ -0,0 +1,77 @@
+"""
+Middleware ограничения частоты заданий и дневной квоты
+"""
+from typing import Any, Awaitable, Callable, Dict
+import logging
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from services.sender import sender
+from services.throttle_service import throttle_service
+
+logger = logging.getLogger(__name__)
+
+
+def _seconds(n: int) -> str:
+    """Склонение: 1 секунду, 2 секунды, 5 секунд"""
+    if n % 10 == 1 and n % 100 != 11:
+        return f"{n} секунду"
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return f"{n} секунды"
+    return f"{n} секунд"
+
+
+def _format_wait(seconds: int) -> str:
+    """«45 секунд» или «3 ч 12 мин»"""
+    if seconds < 60:
+        return _seconds(seconds)
+    hours, minutes = divmod((seconds + 59) // 60, 60)
+    return f"{hours} ч {minutes} мин" if hours else f"{minutes} мин"
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Не пускает к хендлерам решения задания сверх лимитов пользователя
+
+    Вешается на message-обсервер роутеров заданий и на callback_query
+    кнопки «Попробовать снова» (повтор — тоже запрос к AI), поэтому
+    команды и кнопки меню лимитами не считаются.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if (
+            not isinstance(event, (Message, CallbackQuery))
+            or event.from_user is None
+            or not throttle_service.enabled
+        ):
+            return await handler(event, data)
+
+        decision = await throttle_service.check(event.from_user.id)
+        if decision.allowed:
+            return await handler(event, data)
+
+        if decision.quota_exceeded:
+            logger.info(f"Дневная квота исчерпана: {event.from_user.id}")
+            text = (
+                f"🚫 Дневной лимит ({throttle_service.daily_quota} заданий) исчерпан.\n"
+                f"Новые задания можно будет отправить через {_format_wait(decision.retry_after)}."
+            )
+        else:
+            logger.info(f"Слишком частые задания: {event.from_user.id}")
+            text = (
+                f"⏳ Слишком много заданий подряд. Подожди {_seconds(decision.retry_after)} "
+                "и отправь снова."
+            )
+
+        if isinstance(event, CallbackQuery):
+            # Кнопка остаётся под сообщением — повторить можно, когда лимит освободится
+            await event.answer(text, show_alert=True)
+        else:
+            await sender.answer(event, text)
+        return None
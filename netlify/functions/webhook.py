@@ -3,6 +3,7 @@ Netlify Function для обработки webhook от Telegram
 """
 import os
 import sys
+import hmac
 import json
 import logging
 
@@ -16,10 +17,13 @@ from aiogram.client.default import DefaultBotProperties
 
 from config import config
 from handlers import setup_routers
+from middlewares import setup_middlewares
 from services.db_service import db_service
+from services.background_loop import BackgroundLoop
+from services.logging_setup import setup_logging
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Настройка логирования (консоль; запись — в фоновом потоке)
+setup_logging(to_file=False)
 logger = logging.getLogger(__name__)
 
 # Инициализация бота и диспетчера
@@ -28,11 +32,17 @@ bot = Bot(
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
 dp = Dispatcher()
+setup_middlewares(dp)
 dp.include_router(setup_routers())
 
 # Инициализация БД
 _db_initialized = False
 
+# Update обрабатывается до ответа Telegram: после ответа функцию могут
+# заморозить, и фоновая обработка встала бы. Loop общий для вызовов тёплого
+# инстанса — HTTP-пул и соединение с БД не пересоздаются
+background_loop = BackgroundLoop()
+
 
 async def init_db_once():
     """Инициализация БД один раз"""
@@ -47,7 +57,7 @@ async def process_update(update_data: dict):
     """Обработка update от Telegram"""
     try:
         await init_db_once()
-        update = Update(**update_data)
+        update = Update.model_validate(update_data, context={"bot": bot})
         await dp.feed_update(bot, update)
     except Exception as e:
         logger.error(f"Ошибка обработки update: {e}", exc_info=True)
@@ -56,8 +66,6 @@ async def process_update(update_data: dict):
 
 def handler(event, context):
     """Netlify Function handler"""
-    import asyncio
-    
     try:
         # Проверяем метод
         http_method = event.get('httpMethod', '')
@@ -74,14 +82,24 @@ def handler(event, context):
                 'body': 'Method not allowed'
             }
         
+        # Проверяем секрет, если он задан при установке webhook
+        if config.WEBHOOK_SECRET:
+            headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+            secret = headers.get('x-telegram-bot-api-secret-token') or ""
+            if not hmac.compare_digest(secret, config.WEBHOOK_SECRET):
+                return {
+                    'statusCode': 401,
+                    'body': json.dumps({'ok': False})
+                }
+        
         # Парсим тело запроса
         body = event.get('body', '{}')
         update_data = json.loads(body)
         
-        logger.info(f"Получен update: {update_data.get('update_id')}")
+        logger.debug(f"Получен update: {update_data.get('update_id')}")
         
-        # Обрабатываем update
-        asyncio.run(process_update(update_data))
+        # Обрабатываем update на постоянном loop
+        background_loop.run(process_update(update_data))
         
         return {
             'statusCode': 200,
@@ -1,8 +1,21 @@
 """
 Сервисы бота
 """
-from services.db_service import db_service
-from services.ai_service import ai_service
-from services.ocr_service import ocr_service
+import importlib
+
+# Сервисы импортируются по первому обращению: `from services import ocr_service`
+# не должен тянуть стек OCR в холодный старт, если нужен только db_service
+_SERVICES = {
+    "db_service": "services.db_service",
+    "ai_service": "services.ai_service",
+    "ocr_service": "services.ocr_service",
+}
+
+
+def __getattr__(name: str):
+    if name in _SERVICES:
+        return getattr(importlib.import_module(_SERVICES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = ["db_service", "ai_service", "ocr_service"]
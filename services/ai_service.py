@@ -2,11 +2,21 @@
 Сервис взаимодействия с AI API
 Универсальный модуль для работы с различными AI провайдерами
 """
-import httpx
+import asyncio
+import json
 import logging
-from typing import Optional
+import time
+from typing import Optional, TYPE_CHECKING
 
 from config import config
+from services.metrics import (
+    AI_COST_USD, AI_ESCALATIONS_TOTAL, AI_IN_FLIGHT, AI_REQUESTS_TOTAL
+)
+from services.trace import current_trace, record_stage
+from utils.task_classifier import detect_subject, estimate_difficulty
+
+if TYPE_CHECKING:
+    import httpx
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +24,22 @@ logger = logging.getLogger(__name__)
 class AIService:
     """Сервис для получения решений от ИИ"""
     
+    # Обязательный раздел ответа (см. SYSTEM_PROMPT): без него ответ быстрой модели не принимается
+    ANSWER_MARKER = "✅ Ответ:"
+    
+    # Сколько символов тела ошибки провайдера попадает в лог
+    ERROR_BODY_LIMIT = 500
+    
+    # Так отвечают совместимые провайдеры, не знающие stream / stream_options
+    # (в теле ошибки — имя параметра): запрос повторяется без потока, и поток
+    # выключается на STREAM_OFF_SECONDS. Прочие 400 (длинный контекст, модель)
+    # остаются ошибкой запроса
+    STREAM_REJECTED_STATUSES = (400, 422)
+    STREAM_OFF_SECONDS = 600
+    
+    # Длина ответа по умолчанию (под нагрузкой — меньше, см. load_shedder)
+    MAX_TOKENS = 2000
+    
     # Системный промпт для ИИ
     SYSTEM_PROMPT = """Ты — умный помощник по домашним заданиям (ГДЗ). 
 Твоя задача:
@@ -34,60 +60,292 @@ class AIService:
 - Используй формулы где нужно
 - Если задание неполное или непонятное — уточни что не хватает
 - Будь дружелюбным и поддерживающим"""
+    
+    # Короткий промпт, когда предмет определён локально (detect_subject):
+    # без перечня предметов и общих указаний — меньше входных токенов
+    SUBJECT_PROMPT = """Ты — помощник по домашним заданиям, предмет: {subject}.
+Реши задание по шагам с краткими пояснениями. {hint}
+
+Формат ответа:
+📚 Предмет: {subject}
+
+📝 Решение:
+[пошаговое решение]
+
+✅ Ответ: [финальный ответ]
+
+Если задание не по этому предмету — всё равно реши его и укажи верный предмет."""
+    
+    SUBJECT_HINTS = {
+        "математика": "Записывай вычисления и формулы, проверяй ответ.",
+        "физика": "Выпиши «Дано», переведи величины в СИ, указывай формулы и единицы.",
+        "химия": "Пиши уравнения реакций с коэффициентами, расчёты — через количество вещества.",
+        "русский язык": "Ссылайся на правила, отмечай орфограммы и знаки препинания.",
+        "английский": "Называй грамматическое правило, пояснения — на русском.",
+        "литература": "Опирайся на текст произведения, приводи примеры.",
+        "история": "Указывай даты, имена, причины и последствия.",
+        "биология": "Используй термины, процессы объясняй по этапам.",
+        "география": "Приводи факты о расположении, климате и природе.",
+    }
 
     def __init__(self):
         self.api_url = config.AI_API_URL
         self.api_key = config.AI_API_KEY
         self.model = config.AI_MODEL
+        self.fast_model = config.AI_MODEL_FAST
+        self.tier_threshold = config.AI_TIER_THRESHOLD
+        self.prices = config.AI_PRICES
         self.timeout = config.REQUEST_TIMEOUT
+        self.stream = config.AI_STREAM
+        # До какого момента (monotonic) поток выключен после отказа провайдера
+        self._stream_off_until = 0.0
+        self.subject_prompts = config.AI_SUBJECT_PROMPTS
+        # HTTP-клиент с пулом соединений живёт между запросами (keep-alive, TLS)
+        self._client: Optional["httpx.AsyncClient"] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _get_client(self) -> "httpx.AsyncClient":
+        """Постоянный HTTP-клиент для текущего event loop"""
+        # httpx импортируется при первом запросе к AI, а не при холодном старте
+        import httpx
+        
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+            self._client_loop = loop
+        return self._client
+    
+    async def close(self) -> None:
+        """Закрытие HTTP-клиента (вызывается при остановке)"""
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
     
-    async def get_solution(self, task_text: str) -> Optional[str]:
+    async def get_solution(
+        self,
+        task_text: str,
+        max_tokens: Optional[int] = None,
+        force_fast: bool = False
+    ) -> Optional[str]:
         """
         Получить решение задания от ИИ
         
+        Простые задания (по локальной оценке сложности) сначала решает
+        быстрая модель AI_MODEL_FAST; если она ошиблась или в ответе нет
+        раздела «✅ Ответ:» из SYSTEM_PROMPT — задание уходит на AI_MODEL.
+        Если предмет определён локально, вместо SYSTEM_PROMPT идёт
+        короткий промпт этого предмета.
+        
         Args:
             task_text: Текст задания
+            max_tokens: Ограничение длины ответа (None — MAX_TOKENS)
+            force_fast: Быстрая модель независимо от сложности (перегрузка)
             
         Returns:
             Решение от ИИ или None при ошибке
         """
+        started = time.perf_counter()
+        max_tokens = max_tokens or self.MAX_TOKENS
+        AI_IN_FLIGHT.inc()
+        try:
+            tier = self.choose_tier(task_text, force_fast)
+            subject = detect_subject(task_text)
+            system_prompt = self.system_prompt(subject)
+            trace = current_trace()
+            if trace is not None:
+                trace.set(ai_tier=tier, subject=subject)
+            
+            if tier == "fast":
+                solution = await self._request(
+                    self.fast_model, tier, system_prompt, task_text, max_tokens, ttft_from=started
+                )
+                if solution and self.ANSWER_MARKER in solution:
+                    return solution
+                
+                logger.info("Быстрая модель не дала ответа, задание передано основной")
+                AI_ESCALATIONS_TOTAL.inc()
+                if trace is not None:
+                    trace.set(ai_escalated=True)
+                return await self._request(self.model, "main", system_prompt, task_text, max_tokens)
+            
+            return await self._request(
+                self.model, tier, system_prompt, task_text, max_tokens, ttft_from=started
+            )
+        finally:
+            AI_IN_FLIGHT.dec()
+            record_stage("ai_total", started, time.perf_counter())
+    
+    def system_prompt(self, subject: Optional[str]) -> str:
+        """Промпт предмета или общий SYSTEM_PROMPT, если предмет не определён"""
+        if not self.subject_prompts or subject not in self.SUBJECT_HINTS:
+            return self.SYSTEM_PROMPT
+        return self.SUBJECT_PROMPT.format(subject=subject, hint=self.SUBJECT_HINTS[subject])
+    
+    def choose_tier(self, task_text: str, force_fast: bool = False) -> str:
+        """fast — быстрая модель, main — основная"""
+        if not self.fast_model:
+            return "main"
+        if force_fast:
+            return "fast"
+        
+        trace = current_trace()
+        source = trace.attrs.get("source", "text") if trace is not None else "text"
+        # Повтор после неудачи сразу идёт на основную модель
+        if source == "retry":
+            return "main"
+        
+        score = estimate_difficulty(task_text, source)
+        if trace is not None:
+            trace.set(difficulty=score)
+        return "fast" if score < self.tier_threshold else "main"
+    
+    async def _request(
+        self,
+        model: str,
+        tier: str,
+        system_prompt: str,
+        task_text: str,
+        max_tokens: int,
+        ttft_from: Optional[float] = None
+    ) -> Optional[str]:
+        """
+        Один запрос к модели
+        
+        Args:
+            ttft_from: Начало задания для этапа ai_ttft (None — не записывать,
+                       например при эскалации)
+        """
+        import httpx
+        
+        started = time.perf_counter()
         try:
             # Формируем запрос в формате OpenAI API
             payload = {
-                "model": self.model,
+                "model": model,
                 "messages": [
-                    {"role": "system", "content": self.SYSTEM_PROMPT},
+                    {"role": "system", "content": system_prompt},
                     {"role": "user", "content": task_text}
                 ],
-                "max_tokens": 2000,
+                "max_tokens": max_tokens,
                 "temperature": 0.7
             }
             
+            trace = current_trace()
+            if trace is not None:
+                trace.set(ai_backend=httpx.URL(self.api_url).host, ai_model=model)
+            
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    self.api_url,
-                    json=payload,
-                    headers=headers
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"AI API ошибка {response.status_code}: {response.text}")
-                    return None
+            usage: dict = {}
+            client = self._get_client()
+            stream = self.stream and time.monotonic() >= self._stream_off_until
+            while True:
+                body = payload
+                if stream:
+                    # Последний чанк придёт с usage (токены для трассы)
+                    body = {**payload, "stream": True, "stream_options": {"include_usage": True}}
                 
-                data = response.json()
-                return self._extract_response(data)
+                # Отмена задания закрывает соединение на выходе из stream()
+                async with client.stream("POST", self.api_url, json=body, headers=headers) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        if stream and self._rejects_stream(response):
+                            logger.warning(
+                                f"AI API отклонил потоковый запрос ({response.status_code}), "
+                                f"{self.STREAM_OFF_SECONDS} с без stream: "
+                                f"{response.text[:self.ERROR_BODY_LIMIT]}"
+                            )
+                            self._stream_off_until = time.monotonic() + self.STREAM_OFF_SECONDS
+                            stream = False
+                            continue
+                        # Тело ошибки провайдера бывает огромным (HTML-страница прокси)
+                        logger.error(
+                            f"AI API ошибка {response.status_code}: {response.text[:self.ERROR_BODY_LIMIT]}"
+                        )
+                        AI_REQUESTS_TOTAL.labels(tier, "error").inc()
+                        return None
+                    
+                    # Провайдер может проигнорировать stream и ответить обычным JSON
+                    if "text/event-stream" in response.headers.get("content-type", ""):
+                        solution = await self._read_stream(response, ttft_from, usage)
+                    else:
+                        await response.aread()
+                        if ttft_from is not None:
+                            record_stage("ai_ttft", ttft_from, time.perf_counter())
+                        data = response.json()
+                        usage.update(data.get("usage") or {})
+                        solution = self._extract_response(data)
+                break
+            
+            self._record_usage(model, tier, usage)
+            AI_REQUESTS_TOTAL.labels(tier, "ok" if solution else "error").inc()
+            return solution
                     
         except httpx.RequestError as e:
             logger.error(f"Ошибка сети при запросе к AI: {e}")
+            AI_REQUESTS_TOTAL.labels(tier, "error").inc()
             return None
         except Exception as e:
             logger.error(f"Неожиданная ошибка AI сервиса: {e}")
+            AI_REQUESTS_TOTAL.labels(tier, "error").inc()
             return None
+        finally:
+            # ai_fast / ai_main: задержка по моделям в /latency и gdz_stage_seconds
+            record_stage(f"ai_{tier}", started, time.perf_counter())
+    
+    def _rejects_stream(self, response: "httpx.Response") -> bool:
+        """Ошибка именно из-за stream / stream_options, а не из-за содержимого запроса"""
+        return (
+            response.status_code in self.STREAM_REJECTED_STATUSES
+            and "stream" in response.text.lower()
+        )
+    
+    async def _read_stream(
+        self,
+        response: "httpx.Response",
+        ttft_from: Optional[float],
+        usage: dict
+    ) -> Optional[str]:
+        """Сборка ответа из SSE-потока (формат OpenAI: data: {...choices[0].delta...})"""
+        parts: list[str] = []
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            
+            chunk = json.loads(data)
+            usage.update(chunk.get("usage") or {})
+            choices = chunk.get("choices") or []
+            content = choices[0].get("delta", {}).get("content") if choices else None
+            if content:
+                if not parts and ttft_from is not None:
+                    record_stage("ai_ttft", ttft_from, time.perf_counter())
+                parts.append(content)
+        
+        return "".join(parts) or None
+    
+    def _record_usage(self, model: str, tier: str, usage: dict) -> None:
+        """Токены и стоимость запроса: в трассу задания и метрики"""
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        cost = None
+        if model in self.prices:
+            price_in, price_out = self.prices[model]
+            cost = (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+            AI_COST_USD.labels(tier).inc(cost)
+        
+        trace = current_trace()
+        if trace is not None and usage:
+            trace.incr("prompt_tokens", prompt_tokens)
+            trace.incr("completion_tokens", completion_tokens)
+            if cost is not None:
+                trace.set(ai_cost_usd=round(trace.attrs.get("ai_cost_usd", 0) + cost, 6))
     
     def _extract_response(self, data: dict) -> Optional[str]:
         """
@@ -0,0 +1,236 @@
+"""
+Корпус готовых ответов: номера упражнений из популярных учебников
+Поиск до запроса к AI — точный по хешу нормализованного текста
+и нечёткий по триграммному индексу FTS5
+"""
+import aiosqlite
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+from difflib import SequenceMatcher
+from typing import NamedTuple, Optional
+
+from config import config
+from services.metrics import CORPUS_LOOKUPS_TOTAL
+from services.trace import stage
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    text_hash TEXT NOT NULL UNIQUE,
+    task_text TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    subject TEXT,
+    textbook TEXT,
+    exercise TEXT
+);
+-- Без содержимого (contentless): только триграммы нормализованного текста,
+-- сам текст хранится один раз, в answers
+CREATE VIRTUAL TABLE IF NOT EXISTS answers_fts USING fts5(
+    norm_text, content='', tokenize='trigram'
+);
+"""
+
+# Сколько кандидатов одного запроса FTS проверяется точным сравнением
+FUZZY_CANDIDATES = 20
+# Сколько самых характерных слов задания идёт в запрос
+FUZZY_TOKENS = 4
+# Слова короче трёх символов триграммный индекс не ищет
+_MIN_TOKEN = 3
+# «№ 245», «номер 245», «упр. 245», «упражнение 245», «задание 3.14»
+_EXERCISE_RE = re.compile(r"(?:№|номер|упр\.?|упражнение|задание)\s*(\d+(?:[.,]\d+)?)", re.IGNORECASE)
+_PUNCTUATION_RE = re.compile(r"[^\w\s+\-*/=^√()<>%.,]")
+# Числа и знаки операций; дефис внутри слова («какой-то») — не минус
+_MATH_TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)?|[+*/=^√<>%]|-(?![^\W\d_])|(?<![^\W\d_])-")
+
+
+class CorpusAnswer(NamedTuple):
+    """Найденный ответ"""
+    id: int
+    answer: str
+    subject: Optional[str]
+    textbook: Optional[str]
+    exercise: Optional[str]
+    similarity: float  # 1.0 — точное совпадение по хешу
+
+
+def normalize_task(text: str) -> str:
+    """Регистр, ё, кавычки и лишние пробелы не влияют на совпадение"""
+    text = text.lower().replace("ё", "е")
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return " ".join(text.split())
+
+
+def task_hash(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def exercise_number(text: str) -> Optional[str]:
+    match = _EXERCISE_RE.search(text)
+    return match.group(1).replace(",", ".") if match else None
+
+
+def math_tokens(normalized: str) -> list[str]:
+    """Числа и операторы задания по порядку: «12x + 35 = 107» -> 12 + 35 = 107"""
+    return [token.replace(",", ".") for token in _MATH_TOKEN_RE.findall(normalized)]
+
+
+def open_for_import(path: str) -> sqlite3.Connection:
+    """Синхронное соединение для массового импорта (import_answers.py)"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA busy_timeout=5000")
+    db.executescript(SCHEMA)
+    return db
+
+
+class AnswerCorpus:
+    """
+    Поиск готового ответа по тексту задания
+
+    Файл корпуса создаёт import_answers.py; бот открывает его только
+    на чтение. Нет файла — поиск выключен, задания идут в AI как раньше.
+    """
+
+    def __init__(self, path: str = config.ANSWER_CORPUS_PATH):
+        self.path = path
+        self.min_similarity = config.ANSWER_CORPUS_MIN_SIMILARITY
+        self._db: Optional[aiosqlite.Connection] = None
+        self._db_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _get_db(self) -> Optional[aiosqlite.Connection]:
+        """Соединение только для чтения для текущего event loop (None — корпуса нет)"""
+        loop = asyncio.get_running_loop()
+        if self._db is None or self._db_loop is not loop:
+            if not self.path or not os.path.exists(self.path):
+                return None
+            self._db = await aiosqlite.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._db_loop = loop
+        return self._db
+
+    async def close(self) -> None:
+        """Закрытие соединения"""
+        if self._db is not None and self._db_loop is asyncio.get_running_loop():
+            await self._db.close()
+        self._db = None
+        self._db_loop = None
+
+    async def lookup(self, task_text: str, min_similarity: Optional[float] = None) -> Optional[CorpusAnswer]:
+        """
+        Готовый ответ на задание или None
+
+        min_similarity заменяет порог нечёткого совпадения (под нагрузкой — ниже)
+        """
+        db = await self._get_db()
+        if db is None:
+            return None
+
+        try:
+            with stage("corpus_lookup"):
+                normalized = normalize_task(task_text)
+                answer = await self._exact(db, normalized) or await self._fuzzy(
+                    db, task_text, normalized, min_similarity or self.min_similarity
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка поиска в корпусе ответов: {e}")
+            return None
+
+        CORPUS_LOOKUPS_TOTAL.labels("miss" if answer is None else "hit").inc()
+        return answer
+
+    async def _exact(self, db: aiosqlite.Connection, normalized: str) -> Optional[CorpusAnswer]:
+        cursor = await db.execute(
+            "SELECT id, answer, subject, textbook, exercise FROM answers WHERE text_hash = ?",
+            (task_hash(normalized),)
+        )
+        row = await cursor.fetchone()
+        return CorpusAnswer(*row, similarity=1.0) if row else None
+
+    async def _fuzzy(
+        self,
+        db: aiosqlite.Connection,
+        task_text: str,
+        normalized: str,
+        min_similarity: float
+    ) -> Optional[CorpusAnswer]:
+        """
+        Кандидаты по триграммам, затем точное сходство строк
+
+        Запрос — AND самых характерных слов (с цифрами, длинных): частые
+        слова вроде «решите» совпадают с половиной корпуса и не сужают
+        поиск. Если кандидатов нет, по очереди выбрасывается одно слово —
+        OCR мог исказить любое из них.
+
+        Номер упражнения, если он есть и в задании, и в корпусе, должен
+        совпасть: «№ 245» и «№ 254» из одного учебника почти одинаковы.
+        Числа и знаки операций тоже должны совпасть в точности —
+        «12x + 35 = 167» и «12x - 35 = 107» похожи на «12x + 35 = 107»
+        на 98%, но ответ у них другой. Сходство строк прощает только
+        различия в словах и пробелах.
+        """
+        tokens = sorted(
+            {token for token in normalized.split() if len(token) >= _MIN_TOKEN},
+            key=lambda token: (not any(c.isdigit() for c in token), -len(token))
+        )[:FUZZY_TOKENS]
+        if not tokens:
+            return None
+
+        queries = [tokens]
+        if len(tokens) > 2:
+            queries += [tokens[:i] + tokens[i + 1:] for i in range(len(tokens))]
+
+        number = exercise_number(task_text)
+        numbers = math_tokens(normalized)
+        seen: set[int] = set()
+        best: Optional[CorpusAnswer] = None
+        for query_tokens in queries:
+            query = " AND ".join('"' + token.replace('"', '""') + '"' for token in query_tokens)
+            cursor = await db.execute(
+                """SELECT a.id, a.answer, a.subject, a.textbook, a.exercise, a.task_text
+                   FROM answers a
+                   WHERE a.id IN (SELECT rowid FROM answers_fts WHERE answers_fts MATCH ? LIMIT ?)""",
+                (query, FUZZY_CANDIDATES)
+            )
+            for row_id, answer, subject, textbook, exercise, candidate_text in await cursor.fetchall():
+                if row_id in seen or (number and exercise and number != exercise):
+                    continue
+                seen.add(row_id)
+                candidate = normalize_task(candidate_text)
+                if math_tokens(candidate) != numbers:
+                    continue
+                matcher = SequenceMatcher(None, normalized, candidate)
+                if matcher.quick_ratio() < min_similarity:
+                    continue
+                similarity = matcher.ratio()
+                if similarity >= min_similarity and (best is None or similarity > best.similarity):
+                    best = CorpusAnswer(row_id, answer, subject, textbook, exercise, round(similarity, 3))
+            if best is not None:
+                return best
+        return None
+
+
+def format_corpus_answer(found: CorpusAnswer) -> str:
+    """Ответ из корпуса в формате ответов AI (SYSTEM_PROMPT)"""
+    lines = []
+    if found.subject:
+        lines.append(f"📚 Предмет: {found.subject}")
+    if found.textbook or found.exercise:
+        source = ", ".join(part for part in (found.textbook, f"№ {found.exercise}" if found.exercise else None) if part)
+        lines.append(f"📖 {source}")
+    if lines:
+        lines.append("")
+    answer = found.answer.strip()
+    lines.append(answer if "✅ Ответ:" in answer else f"✅ Ответ: {answer}")
+    return "\n".join(lines)
+
+
+# Singleton экземпляр корпуса
+answer_corpus = AnswerCorpus()
@@ -0,0 +1,34 @@
+"""
+Постоянный event loop в фоновом потоке для синхронных serverless-обработчиков
+"""
+import asyncio
+import threading
+from typing import Any, Coroutine, Optional
+
+
+class BackgroundLoop:
+    """
+    Один event loop на инстанс функции
+
+    Обработчик Vercel/Netlify синхронный; asyncio.run() на каждый вызов
+    создавал бы новый loop, а HTTP-пул к AI и соединение с БД привязаны
+    к loop, на котором созданы. Здесь loop живёт между вызовами тёплого
+    инстанса, а вызов ждёт результата корутины: ответ Telegram уходит
+    после обработки, пока функция ещё не заморожена.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="background-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        """Выполнить корутину на постоянном loop и дождаться результата (потокобезопасно)"""
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
@@ -0,0 +1,157 @@
+"""
+Отмена заданий, которые сейчас решаются
+Задание определяется сообщением «Думаю над решением...» с кнопкой отмены
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Optional, TypeVar
+
+from aiogram.types import Message
+
+from config import config
+from services.db_service import db_service
+from services.metrics import CANCELLED_TOTAL
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Заявки на отмену из другого процесса старше этого срока не нужны (секунды)
+CANCEL_REQUEST_TTL = 600
+
+
+class SolveCancelled(Exception):
+    """Пользователь отменил задание"""
+
+
+class CancelScope:
+    """
+    Область отменяемого задания
+
+    Долгие этапы (OCR, запрос к AI) запускаются через run() отдельной
+    задачей; отмена снимает текущий этап сразу, а следующие не начнутся.
+    """
+
+    def __init__(self, key: tuple[int, int], user_id: int):
+        self.key = key
+        self.user_id = user_id
+        self.cancelled = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self, awaitable: Awaitable[T]) -> T:
+        """Выполнить этап; SolveCancelled если задание отменено"""
+        if self.cancelled:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise SolveCancelled()
+
+        task = self._task = asyncio.ensure_future(awaitable)
+        try:
+            # wait(), а не await: отмена внешней задачи (остановка процесса)
+            # сама этап не отменяет — поэтому отменённый этап значит, что
+            # его отменил cancel(), и это не спутать с остановкой
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            self._task = None
+
+        if task.cancelled() and self.cancelled:
+            raise SolveCancelled()
+        return task.result()
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        if self._task is not None:
+            self._task.cancel()
+
+
+class _TrackedScope:
+    """async with cancel_service.track(...) as scope"""
+
+    def __init__(self, service: "CancelService", scope: CancelScope):
+        self._service = service
+        self._scope = scope
+
+    async def __aenter__(self) -> CancelScope:
+        self._service._register(self._scope)
+        return self._scope
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self._service._unregister(self._scope)
+
+
+class CancelService:
+    """
+    Реестр отменяемых заданий процесса
+
+    В режиме ingress + solver кнопку нажимают в ingress, а задание
+    решается в solver: тогда заявка пишется в cancel_requests, и solver
+    проверяет её раз в JOB_POLL_INTERVAL, пока у него есть задания.
+    """
+
+    def __init__(self):
+        self.poll_interval = config.JOB_POLL_INTERVAL
+        self._scopes: dict[tuple[int, int], CancelScope] = {}
+        self._poller: Optional[asyncio.Task] = None
+
+    def track(self, processing_msg: Message, user_id: int) -> _TrackedScope:
+        """Зарегистрировать задание по его сообщению о обработке"""
+        key = (processing_msg.chat.id, processing_msg.message_id)
+        return _TrackedScope(self, CancelScope(key, user_id))
+
+    async def cancel(self, chat_id: int, message_id: int, user_id: int) -> bool:
+        """
+        Отменить задание
+
+        Returns:
+            True если задание найдено в этом процессе или заявка
+            передана solver-воркерам
+        """
+        if self._cancel_local((chat_id, message_id), user_id):
+            return True
+
+        if config.BOT_ROLE == "ingress":
+            await db_service.add_cancel_request(chat_id, message_id, user_id, time.time())
+            return True
+        return False
+
+    def _cancel_local(self, key: tuple[int, int], user_id: int) -> bool:
+        scope = self._scopes.get(key)
+        # Отменить может только автор задания
+        if scope is None or scope.user_id != user_id or scope.cancelled:
+            return False
+
+        scope.cancel()
+        CANCELLED_TOTAL.inc()
+        logger.info(f"Задание {key} отменено пользователем {user_id}")
+        return True
+
+    def _register(self, scope: CancelScope) -> None:
+        self._scopes[scope.key] = scope
+        if config.BOT_ROLE == "solver" and (self._poller is None or self._poller.done()):
+            self._poller = asyncio.create_task(self._poll_cancel_requests())
+
+    def _unregister(self, scope: CancelScope) -> None:
+        if self._scopes.get(scope.key) is scope:
+            del self._scopes[scope.key]
+
+    async def _poll_cancel_requests(self) -> None:
+        """Опрос заявок на отмену, пока в процессе есть задания"""
+        while self._scopes:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                rows = await db_service.get_cancel_requests(before=time.time() - CANCEL_REQUEST_TTL)
+                for chat_id, message_id, user_id in rows:
+                    key = (chat_id, message_id)
+                    if key in self._scopes:
+                        self._cancel_local(key, user_id)
+                        await db_service.delete_cancel_request(chat_id, message_id)
+            except Exception as e:
+                logger.error(f"Ошибка чтения заявок на отмену: {e}")
+
+
+# Singleton экземпляр сервиса
+cancel_service = CancelService()
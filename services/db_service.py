@@ -2,11 +2,47 @@
 Сервис работы с базой данных SQLite
 """
 import aiosqlite
+import asyncio
+from collections import OrderedDict
 from datetime import datetime
 from typing import Optional
+import functools
+import json
 import os
+import logging
+import time
 
 from config import config
+from services.metrics import DB_QUERY_SECONDS
+from services.migrations import LATEST_VERSION, run_migrations
+from services.trace import RequestTrace, current_trace
+
+logger = logging.getLogger(__name__)
+
+# Статусы запроса (requests.status)
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+def _timed(method):
+    """Время вызова метода сервиса в гистограмму gdz_db_query_seconds"""
+    histogram = DB_QUERY_SECONDS.labels(method.__name__)
+    
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            histogram.observe(elapsed)
+            trace = current_trace()
+            if trace is not None:
+                trace.db_ms += elapsed * 1000
+    
+    return wrapper
 
 
 class DatabaseService:
@@ -14,48 +50,82 @@ class DatabaseService:
     
     def __init__(self):
         self.db_path = config.DATABASE_PATH
+        # Одно соединение на event loop: не открываем файл на каждый запрос
+        self._db: Optional[aiosqlite.Connection] = None
+        self._db_loop: Optional[asyncio.AbstractEventLoop] = None
+        # telegram_id -> users.id: строки users не удаляются, поэтому кэш не устаревает
+        self.user_id_cache_size = config.USER_ID_CACHE_SIZE
+        self._user_ids: OrderedDict[int, int] = OrderedDict()
+    
+    async def _get_db(self) -> aiosqlite.Connection:
+        """Постоянное соединение с БД для текущего event loop"""
+        loop = asyncio.get_running_loop()
+        if self._db is None or self._db_loop is not loop:
+            self._db = await aiosqlite.connect(self.db_path)
+            self._db_loop = loop
+        return self._db
     
+    async def close(self) -> None:
+        """Закрытие соединения (вызывается при остановке)"""
+        if self._db is not None and self._db_loop is asyncio.get_running_loop():
+            await self._db.close()
+        self._db = None
+        self._db_loop = None
+    
+    @_timed
     async def init_db(self) -> None:
         """Инициализация базы данных и создание таблиц"""
         # Создаём директорию если не существует
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        async with aiosqlite.connect(self.db_path) as db:
-            # Таблица пользователей
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    telegram_id INTEGER UNIQUE NOT NULL,
-                    username TEXT,
-                    first_name TEXT,
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Таблица запросов
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS requests (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    request_text TEXT NOT NULL,
-                    response_text TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            """)
-            
-            # Индексы для быстрого поиска
-            await db.execute("""
-                CREATE INDEX IF NOT EXISTS idx_users_telegram_id 
-                ON users (telegram_id)
-            """)
-            await db.execute("""
-                CREATE INDEX IF NOT EXISTS idx_requests_user_id 
-                ON requests (user_id)
-            """)
-            
-            await db.commit()
+        db = await self._get_db()
+        
+        # Схема уже актуальна — DDL не нужен (важно для холодного старта serverless).
+        # user_version хранится в заголовке файла, чтение почти бесплатное
+        cursor = await db.execute("PRAGMA user_version")
+        row = await cursor.fetchone()
+        if row[0] >= LATEST_VERSION:
+            return
+        
+        # WAL: чтение не блокируется записью и миграциями
+        await db.execute("PRAGMA journal_mode=WAL")
+        
+        # Таблица пользователей
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                telegram_id INTEGER UNIQUE NOT NULL,
+                username TEXT,
+                first_name TEXT,
+                registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Таблица запросов
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS requests (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                request_text TEXT NOT NULL,
+                response_text TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        """)
+        
+        # Индексы для быстрого поиска
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_users_telegram_id 
+            ON users (telegram_id)
+        """)
+        
+        await db.commit()
+        
+        # Индексы и колонки добавляются версионированными миграциями
+        version = await run_migrations(db)
+        logger.info(f"Версия схемы БД: {version}")
     
+    @_timed
     async def get_or_create_user(
         self, 
         telegram_id: int, 
@@ -63,17 +133,22 @@ class DatabaseService:
         first_name: Optional[str] = None
     ) -> int:
         """Получить или создать пользователя, возвращает user_id"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Проверяем существует ли пользователь
-            cursor = await db.execute(
-                "SELECT id FROM users WHERE telegram_id = ?",
-                (telegram_id,)
-            )
-            row = await cursor.fetchone()
-            
-            if row:
-                return row[0]
-            
+        user_id = self._user_ids.get(telegram_id)
+        if user_id is not None:
+            self._user_ids.move_to_end(telegram_id)
+            return user_id
+        
+        db = await self._get_db()
+        # Проверяем существует ли пользователь
+        cursor = await db.execute(
+            "SELECT id FROM users WHERE telegram_id = ?",
+            (telegram_id,)
+        )
+        row = await cursor.fetchone()
+        
+        if row:
+            user_id = row[0]
+        else:
             # Создаём нового пользователя
             cursor = await db.execute(
                 """INSERT INTO users (telegram_id, username, first_name) 
@@ -81,44 +156,297 @@ class DatabaseService:
                 (telegram_id, username, first_name)
             )
             await db.commit()
-            return cursor.lastrowid
+            user_id = cursor.lastrowid
+        
+        self.remember_user_ids([(telegram_id, user_id)])
+        return user_id
+    
+    def remember_user_ids(self, pairs: list[tuple[int, int]]) -> None:
+        """Пары (telegram_id, users.id) в кэш, от давних к недавним"""
+        if self.user_id_cache_size <= 0:
+            return
+        for telegram_id, user_id in pairs:
+            self._user_ids[telegram_id] = user_id
+            self._user_ids.move_to_end(telegram_id)
+        while len(self._user_ids) > self.user_id_cache_size:
+            self._user_ids.popitem(last=False)
+    
+    def cached_user_ids(self) -> list[tuple[int, int]]:
+        """Содержимое кэша user_id для снимка, от давних к недавним"""
+        return list(self._user_ids.items())
     
+    @_timed
     async def log_request(
         self, 
         user_id: int, 
         request_text: str, 
-        response_text: Optional[str] = None
+        response_text: Optional[str] = None,
+        source: str = "text"
     ) -> int:
         """Логирование запроса в БД, возвращает request_id"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                """INSERT INTO requests (user_id, request_text, response_text) 
-                   VALUES (?, ?, ?)""",
-                (user_id, request_text, response_text)
-            )
-            await db.commit()
-            return cursor.lastrowid
+        db = await self._get_db()
+        cursor = await db.execute(
+            """INSERT INTO requests (user_id, request_text, response_text, source, status) 
+               VALUES (?, ?, ?, ?, ?)""",
+            (user_id, request_text, response_text, source, PENDING if response_text is None else DONE)
+        )
+        await db.commit()
+        return cursor.lastrowid
     
-    async def update_response(self, request_id: int, response_text: str) -> None:
+    @_timed
+    async def update_response(
+        self, 
+        request_id: int, 
+        response_text: str,
+        latency_ms: Optional[int] = None
+    ) -> None:
         """Обновление ответа в запросе"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "UPDATE requests SET response_text = ? WHERE id = ?",
-                (response_text, request_id)
-            )
-            await db.commit()
+        db = await self._get_db()
+        await db.execute(
+            "UPDATE requests SET response_text = ?, latency_ms = ?, status = ? WHERE id = ?",
+            (response_text, latency_ms, DONE, request_id)
+        )
+        await db.commit()
+    
+    @_timed
+    async def update_request_text(self, request_id: int, request_text: str) -> None:
+        """Текст задания, известный только после записи запроса (OCR в пачке API)"""
+        db = await self._get_db()
+        await db.execute(
+            "UPDATE requests SET request_text = ? WHERE id = ?",
+            (request_text, request_id)
+        )
+        await db.commit()
+    
+    @_timed
+    async def set_request_status(self, request_id: int, status: str) -> None:
+        """Изменение статуса запроса (например, отмена пользователем)"""
+        db = await self._get_db()
+        await db.execute(
+            "UPDATE requests SET status = ? WHERE id = ?",
+            (status, request_id)
+        )
+        await db.commit()
+    
+    @_timed
+    async def get_failed_request(self, request_id: int, max_age: int) -> Optional[tuple]:
+        """
+        Неудавшийся запрос не старше max_age секунд для повтора
+        
+        Returns:
+            (telegram_id, request_text, source) или None
+        """
+        db = await self._get_db()
+        cursor = await db.execute(
+            """SELECT u.telegram_id, r.request_text, r.source FROM requests r
+               JOIN users u ON r.user_id = u.id
+               WHERE r.id = ? AND r.status = ? AND r.created_at >= datetime('now', ?)""",
+            (request_id, FAILED, f"-{max_age} seconds")
+        )
+        return await cursor.fetchone()
+    
+    @_timed
+    async def add_cancel_request(self, chat_id: int, message_id: int, user_id: int, now: float) -> None:
+        """Заявка на отмену задания, которое решает другой процесс"""
+        db = await self._get_db()
+        await db.execute(
+            """INSERT OR REPLACE INTO cancel_requests (chat_id, message_id, user_id, created_at)
+               VALUES (?, ?, ?, ?)""",
+            (chat_id, message_id, user_id, now)
+        )
+        await db.commit()
+    
+    @_timed
+    async def get_cancel_requests(self, before: float) -> list[tuple]:
+        """
+        Текущие заявки на отмену: (chat_id, message_id, user_id)
+        Заявки старше before удаляются без возврата
+        """
+        db = await self._get_db()
+        await db.execute("DELETE FROM cancel_requests WHERE created_at < ?", (before,))
+        cursor = await db.execute("SELECT chat_id, message_id, user_id FROM cancel_requests")
+        rows = await cursor.fetchall()
+        await db.commit()
+        return rows
+    
+    @_timed
+    async def delete_cancel_request(self, chat_id: int, message_id: int) -> None:
+        """Заявка обработана"""
+        db = await self._get_db()
+        await db.execute(
+            "DELETE FROM cancel_requests WHERE chat_id = ? AND message_id = ?",
+            (chat_id, message_id)
+        )
+        await db.commit()
+    
+    @_timed
+    async def claim_update(self, update_id: int, now: float, stale_before: float) -> bool:
+        """
+        Занять update_id для обработки
+        
+        Returns:
+            False если update уже обработан или обрабатывается другим
+            инстансом (зависшие дольше stale_before записи перехватываются)
+        """
+        db = await self._get_db()
+        cursor = await db.execute(
+            """INSERT INTO processed_updates (update_id, status, updated_at)
+               VALUES (?, 'processing', ?)
+               ON CONFLICT (update_id) DO UPDATE SET updated_at = excluded.updated_at
+               WHERE status = 'processing' AND updated_at < ?""",
+            (update_id, now, stale_before)
+        )
+        await db.commit()
+        return cursor.rowcount > 0
+    
+    @_timed
+    async def finish_update(self, update_id: int, now: float) -> None:
+        """Отметить update как обработанный"""
+        db = await self._get_db()
+        await db.execute(
+            "UPDATE processed_updates SET status = 'done', updated_at = ? WHERE update_id = ?",
+            (now, update_id)
+        )
+        await db.commit()
     
+    @_timed
+    async def release_update(self, update_id: int) -> None:
+        """Освободить update после ошибки, чтобы повторная доставка обработалась"""
+        db = await self._get_db()
+        await db.execute("DELETE FROM processed_updates WHERE update_id = ?", (update_id,))
+        await db.commit()
+    
+    @_timed
+    async def purge_processed_updates(self, before: float) -> None:
+        """Удалить update_id старше окна дедупликации"""
+        db = await self._get_db()
+        await db.execute("DELETE FROM processed_updates WHERE updated_at < ?", (before,))
+        await db.commit()
+    
+    @_timed
+    async def load_quotas(self, day: str) -> list[tuple]:
+        """Счётчики квот за день: (telegram_id, used, recent)"""
+        db = await self._get_db()
+        cursor = await db.execute(
+            "SELECT telegram_id, used, recent FROM user_quotas WHERE day = ?",
+            (day,)
+        )
+        return await cursor.fetchall()
+    
+    @_timed
+    async def save_quotas(self, rows: list[tuple]) -> None:
+        """Сохранение счётчиков квот: (telegram_id, day, used, recent, updated_at)"""
+        db = await self._get_db()
+        await db.executemany(
+            """INSERT INTO user_quotas (telegram_id, day, used, recent, updated_at)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (telegram_id) DO UPDATE SET
+                   day = excluded.day, used = excluded.used,
+                   recent = excluded.recent, updated_at = excluded.updated_at""",
+            rows
+        )
+        await db.commit()
+    
+    @_timed
+    async def save_trace(self, request_id: int, trace: RequestTrace) -> None:
+        """Сохранение трассы задания (этапы и атрибуты) одной транзакцией"""
+        db = await self._get_db()
+        total_ms = trace.elapsed_ms()
+        await db.execute(
+            """INSERT OR REPLACE INTO request_traces (request_id, total_ms, db_ms, attrs, created_at)
+               VALUES (?, ?, ?, ?, ?)""",
+            (request_id, total_ms, round(trace.db_ms, 1),
+             json.dumps(trace.attrs, ensure_ascii=False), trace.created_at)
+        )
+        # Повтор пишет новую трассу поверх прежней
+        await db.execute("DELETE FROM request_stages WHERE request_id = ?", (request_id,))
+        await db.executemany(
+            """INSERT INTO request_stages (request_id, stage, start_ms, duration_ms, created_at)
+               VALUES (?, ?, ?, ?, ?)""",
+            [(request_id, name, start_ms, duration_ms, trace.created_at)
+             for name, start_ms, duration_ms in trace.stages]
+            + [(request_id, "total", 0.0, total_ms, trace.created_at)]
+        )
+        await db.commit()
+    
+    @_timed
+    async def get_stage_percentiles(self, since: float) -> list[tuple]:
+        """
+        Перцентили длительности этапов за окно (ближайший ранг)
+        
+        Returns:
+            [(stage, count, p50_ms, p95_ms, p99_ms), ...]
+        """
+        db = await self._get_db()
+        cursor = await db.execute(
+            """WITH ranked AS (
+                   SELECT stage, duration_ms,
+                          ROW_NUMBER() OVER (PARTITION BY stage ORDER BY duration_ms) AS rn,
+                          COUNT(*) OVER (PARTITION BY stage) AS n
+                   FROM request_stages
+                   WHERE created_at >= ?
+               )
+               SELECT stage, n,
+                      MIN(CASE WHEN rn >= 0.50 * n THEN duration_ms END),
+                      MIN(CASE WHEN rn >= 0.95 * n THEN duration_ms END),
+                      MIN(CASE WHEN rn >= 0.99 * n THEN duration_ms END)
+               FROM ranked
+               GROUP BY stage
+               ORDER BY MIN(CASE WHEN rn >= 0.50 * n THEN duration_ms END) DESC""",
+            (since,)
+        )
+        return await cursor.fetchall()
+    
+    @_timed
+    async def create_api_job(self, job_id: str, api_client: str, request_ids: list[int], now: float) -> None:
+        """Пачка заданий HTTP API"""
+        db = await self._get_db()
+        await db.execute(
+            "INSERT INTO api_jobs (id, api_client, request_ids, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, api_client, json.dumps(request_ids), now)
+        )
+        await db.commit()
+    
+    @_timed
+    async def get_api_job(self, job_id: str) -> Optional[tuple]:
+        """
+        Пачка заданий с состоянием запросов
+        
+        Returns:
+            (api_client, created_at, [(request_id, status, response_text, latency_ms), ...])
+            или None
+        """
+        db = await self._get_db()
+        cursor = await db.execute(
+            "SELECT api_client, request_ids, created_at FROM api_jobs WHERE id = ?",
+            (job_id,)
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            return None
+        
+        api_client, request_ids, created_at = row
+        request_ids = json.loads(request_ids)
+        cursor = await db.execute(
+            f"""SELECT id, status, response_text, latency_ms FROM requests
+                WHERE id IN ({",".join("?" * len(request_ids))})""",
+            request_ids
+        )
+        by_id = {r[0]: r for r in await cursor.fetchall()}
+        return api_client, created_at, [by_id[i] for i in request_ids if i in by_id]
+    
+    @_timed
     async def get_user_stats(self, telegram_id: int) -> dict:
         """Получить статистику пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                """SELECT COUNT(*) FROM requests r
-                   JOIN users u ON r.user_id = u.id
-                   WHERE u.telegram_id = ?""",
-                (telegram_id,)
-            )
-            row = await cursor.fetchone()
-            return {"total_requests": row[0] if row else 0}
+        db = await self._get_db()
+        cursor = await db.execute(
+            """SELECT COUNT(*) FROM requests r
+               JOIN users u ON r.user_id = u.id
+               WHERE u.telegram_id = ?""",
+            (telegram_id,)
+        )
+        row = await cursor.fetchone()
+        return {"total_requests": row[0] if row else 0}
 
 
 # Singleton экземпляр сервиса
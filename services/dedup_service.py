@@ -0,0 +1,119 @@
+"""
+Сервис дедупликации обновлений Telegram по update_id
+Кольцо последних update_id в памяти плюс общая таблица в SQLite
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from aiogram.types import Update
+
+from config import config
+from services.db_service import db_service
+from services.metrics import DEDUP_AI_CALLS_SAVED_TOTAL, DUPLICATE_UPDATES_TOTAL
+
+logger = logging.getLogger(__name__)
+
+PROCESSING = "processing"
+DONE = "done"
+
+
+class DedupService:
+    """Отсекает повторно доставленные и уже обрабатываемые обновления"""
+
+    # Как часто чистить устаревшие записи в БД (в захватах)
+    PURGE_EVERY = 1000
+
+    def __init__(self):
+        self.window_size = config.DEDUP_WINDOW_SIZE
+        self.window_seconds = config.DEDUP_WINDOW_SECONDS
+        self.processing_ttl = config.DEDUP_PROCESSING_TTL
+        self.persist = config.DEDUP_PERSIST
+
+        # update_id -> статус, в порядке поступления (кольцо фиксированного размера)
+        self._seen: OrderedDict[int, str] = OrderedDict()
+        self._claims = 0
+
+    def _remember(self, update_id: int, status: str) -> None:
+        self._seen[update_id] = status
+        self._seen.move_to_end(update_id)
+        while len(self._seen) > self.window_size:
+            self._seen.popitem(last=False)
+
+    async def claim(self, update_id: int, take_over: bool = False) -> bool:
+        """
+        Занять update для обработки
+
+        Args:
+            update_id: ID обновления
+            take_over: перехватить захват 'processing' сразу, не дожидаясь
+                DEDUP_PROCESSING_TTL — для update из журнала очереди, чью
+                обработку прервало падение прошлого процесса
+
+        Returns:
+            True если update новый (или брошенный) и его нужно обработать
+        """
+        # Быстрый путь без обращения к БД. При перехвате решает БД: в окне
+        # отмечены и update, захват которых просто не удался
+        if update_id in self._seen and not (take_over and self.persist):
+            return False
+
+        if self.persist:
+            now = time.time()
+            claimed = await db_service.claim_update(
+                update_id, now, stale_before=now if take_over else now - self.processing_ttl
+            )
+            if not claimed:
+                self._remember(update_id, DONE)
+                return False
+
+            self._claims += 1
+            if self._claims % self.PURGE_EVERY == 0:
+                await db_service.purge_processed_updates(before=now - self.window_seconds)
+
+        self._remember(update_id, PROCESSING)
+        return True
+
+    async def complete(self, update_id: int) -> None:
+        """Update обработан успешно"""
+        self._remember(update_id, DONE)
+        if self.persist:
+            await db_service.finish_update(update_id, time.time())
+
+    async def release(self, update_id: int) -> None:
+        """Обработка упала — разрешаем повторную доставку"""
+        self._seen.pop(update_id, None)
+        if self.persist:
+            await db_service.release_update(update_id)
+
+    def snapshot(self) -> list[int]:
+        """Обработанные update_id окна (по порядку поступления) для снимка"""
+        return [update_id for update_id, status in self._seen.items() if status == DONE]
+
+    def restore(self, update_ids: list[int]) -> None:
+        """Окно из snapshot(): повторные доставки после перезапуска — без запроса к БД"""
+        for update_id in update_ids:
+            if update_id not in self._seen:
+                self._remember(update_id, DONE)
+
+    def record_duplicate(self, update: Update) -> None:
+        """Учёт пропущенного дубликата (gdz_duplicate_updates_total, gdz_dedup_ai_calls_saved_total)"""
+        DUPLICATE_UPDATES_TOTAL.inc()
+        if self._costs_ai_call(update):
+            DEDUP_AI_CALLS_SAVED_TOTAL.inc()
+
+    @staticmethod
+    def _costs_ai_call(update: Update) -> bool:
+        """Привёл бы update к платному запросу к AI (фото или текст не-команда, оценка)"""
+        message = update.message
+        if message is None:
+            return False
+        if message.photo:
+            return True
+        text: Optional[str] = message.text
+        return bool(text) and not text.startswith("/")
+
+
+# Singleton экземпляр сервиса
+dedup_service = DedupService()
@@ -0,0 +1,171 @@
+"""
+Надёжная очередь задач на SQLite
+Ingress ставит задачи на решение, solver-воркеры забирают их с таймаутом видимости
+"""
+import aiosqlite
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import NamedTuple, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DEAD = "dead"
+
+
+class Job(NamedTuple):
+    """Задача, захваченная воркером"""
+    id: int
+    kind: str
+    payload: dict
+    attempts: int
+
+
+class JobQueue:
+    """
+    Очередь задач с таймаутом видимости и повторными попытками
+
+    Захваченная задача невидима для других воркеров до visible_at. Если
+    воркер упал и не продлил видимость, задачу заберёт другой. Файл очереди
+    может лежать на общем диске, если solver-ы на разных машинах.
+    """
+
+    def __init__(self, path: str = config.JOB_QUEUE_PATH):
+        self.path = path
+        self.visibility_timeout = config.JOB_VISIBILITY_TIMEOUT
+        self.max_attempts = config.JOB_MAX_ATTEMPTS
+        self._db: Optional[aiosqlite.Connection] = None
+        self._db_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _get_db(self) -> aiosqlite.Connection:
+        """Постоянное соединение для текущего event loop"""
+        loop = asyncio.get_running_loop()
+        if self._db is None or self._db_loop is not loop:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # isolation_level=None: транзакциями управляем явно (BEGIN IMMEDIATE)
+            db = await aiosqlite.connect(self.path, isolation_level=None)
+            await db.execute("PRAGMA journal_mode=WAL")
+            await db.execute("PRAGMA busy_timeout=5000")
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    dedup_key TEXT UNIQUE,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    visible_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL
+                )
+            """)
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_jobs_status_visible
+                ON jobs (status, visible_at)
+            """)
+            self._db = db
+            self._db_loop = loop
+        return self._db
+
+    async def close(self) -> None:
+        """Закрытие соединения"""
+        if self._db is not None and self._db_loop is asyncio.get_running_loop():
+            await self._db.close()
+        self._db = None
+        self._db_loop = None
+
+    async def enqueue(self, kind: str, payload: dict, dedup_key: Optional[str] = None) -> bool:
+        """
+        Поставить задачу в очередь
+
+        Returns:
+            False если задача с таким dedup_key уже есть
+        """
+        db = await self._get_db()
+        now = time.time()
+        cursor = await db.execute(
+            """INSERT OR IGNORE INTO jobs (kind, dedup_key, payload, visible_at, created_at)
+               VALUES (?, ?, ?, ?, ?)""",
+            (kind, dedup_key, json.dumps(payload), now, now)
+        )
+        return cursor.rowcount > 0
+
+    async def claim(self) -> Optional[Job]:
+        """Захватить следующую видимую задачу (атомарно между процессами)"""
+        db = await self._get_db()
+        now = time.time()
+
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = await db.execute(
+                """SELECT id, kind, payload, attempts FROM jobs
+                   WHERE status IN ('queued', 'running') AND visible_at <= ?
+                   ORDER BY id LIMIT 1""",
+                (now,)
+            )
+            row = await cursor.fetchone()
+            if row is None:
+                await db.execute("COMMIT")
+                return None
+
+            job_id, kind, payload, attempts = row
+            await db.execute(
+                """UPDATE jobs SET status = 'running', attempts = attempts + 1, visible_at = ?
+                   WHERE id = ?""",
+                (now + self.visibility_timeout, job_id)
+            )
+            await db.execute("COMMIT")
+        except Exception:
+            await db.execute("ROLLBACK")
+            raise
+
+        return Job(job_id, kind, json.loads(payload), attempts + 1)
+
+    async def extend(self, job_id: int) -> None:
+        """Продлить видимость задачи, пока воркер над ней работает"""
+        db = await self._get_db()
+        await db.execute(
+            "UPDATE jobs SET visible_at = ? WHERE id = ? AND status = 'running'",
+            (time.time() + self.visibility_timeout, job_id)
+        )
+
+    async def complete(self, job_id: int) -> None:
+        """Задача выполнена — удаляем"""
+        db = await self._get_db()
+        await db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    async def fail(self, job: Job, error: str) -> None:
+        """Ошибка: повтор с экспоненциальной задержкой или dead после max_attempts"""
+        db = await self._get_db()
+        if job.attempts >= self.max_attempts:
+            await db.execute(
+                "UPDATE jobs SET status = 'dead', last_error = ? WHERE id = ?",
+                (error, job.id)
+            )
+            logger.error(f"Задача {job.id} исчерпала попытки: {error}")
+            return
+
+        delay = 2 ** job.attempts
+        await db.execute(
+            "UPDATE jobs SET status = 'queued', visible_at = ?, last_error = ? WHERE id = ?",
+            (time.time() + delay, error, job.id)
+        )
+
+    async def depth(self) -> int:
+        """Число задач, ожидающих или выполняемых"""
+        db = await self._get_db()
+        cursor = await db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')")
+        row = await cursor.fetchone()
+        return row[0]
+
+
+# Singleton экземпляр очереди
+job_queue = JobQueue()
@@ -0,0 +1,148 @@
+"""
+Деградация под нагрузкой: режимы по сигналам давления с гистерезисом
+Когда после урока приходит волна заданий, бот отвечает короче и быстрее,
+а не одинаково медленно всем до таймаутов
+"""
+import logging
+import math
+import time
+from collections import deque
+from typing import Optional
+
+from config import config
+from services.metrics import AI_IN_FLIGHT, DEGRADATION_LEVEL, OCR_EXECUTOR_QUEUE
+
+logger = logging.getLogger(__name__)
+
+# Уровни накопительные: каждый следующий включает все предыдущие
+NORMAL = 0
+SHORT_ANSWERS = 1   # max_tokens = DEGRADE_MAX_TOKENS
+FAST_MODEL = 2      # все задания на AI_MODEL_FAST (если задана)
+OCR_REDUCED = 3     # OCR без увеличения, ширина не больше DEGRADE_OCR_WIDTH
+NEAR_DUPLICATES = 4  # корпус ответов с порогом DEGRADE_CORPUS_SIMILARITY
+CACHE_ONLY = 5      # только кэш и корпус, новым заданиям — «попробуй через минуту»
+
+LEVEL_NAMES = {
+    NORMAL: "normal",
+    SHORT_ANSWERS: "short_answers",
+    FAST_MODEL: "fast_model",
+    OCR_REDUCED: "ocr_reduced",
+    NEAR_DUPLICATES: "near_duplicates",
+    CACHE_ONLY: "cache_only",
+}
+
+# Через сколько секунд предлагать повторить отклонённое задание
+RETRY_AFTER = 60
+# Меньше замеров в окне — p95 не учитывается
+_MIN_SAMPLES = 10
+_MAX_SAMPLES = 2000
+
+
+class Overloaded(Exception):
+    """Задание не принято: режим CACHE_ONLY, а готового ответа нет"""
+
+    def __init__(self, retry_after: int = RETRY_AFTER):
+        super().__init__(f"перегрузка, повтор через {retry_after} с")
+        self.retry_after = retry_after
+
+
+class LoadShedder:
+    """
+    Текущий режим деградации
+
+    Давление — наибольшая доля порога среди сигналов: очередь подготовки
+    OCR, запросы к AI в работе и p95 времени решения за DEGRADE_WINDOW
+    секунд. Давление ≥ 1 поднимает режим на ступень не чаще раза в
+    DEGRADE_STEP_INTERVAL секунд; ступень вниз — только после
+    DEGRADE_COOLDOWN секунд давления ниже DEGRADE_RECOVER_RATIO.
+    Между порогами режим держится — без дрожания на границе.
+
+    Пересчёт ленивый: при обращении к level не чаще раза в секунду
+    и при сборе метрик.
+    """
+
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self):
+        self.enabled = config.DEGRADE_ENABLED
+        self.ocr_queue_high = config.DEGRADE_OCR_QUEUE
+        self.ai_in_flight_high = config.DEGRADE_AI_IN_FLIGHT
+        self.p95_high = config.DEGRADE_P95_SECONDS
+        self.window = config.DEGRADE_WINDOW
+        self.step_interval = config.DEGRADE_STEP_INTERVAL
+        self.recover_ratio = config.DEGRADE_RECOVER_RATIO
+        self.cooldown = config.DEGRADE_COOLDOWN
+
+        self._level = NORMAL
+        self._changed_at = 0.0
+        self._checked_at = 0.0
+        self._calm_since: Optional[float] = None
+        # (monotonic, секунды) последних решений через AI
+        self._samples: deque[tuple[float, float]] = deque(maxlen=_MAX_SAMPLES)
+
+    @property
+    def level(self) -> int:
+        if not self.enabled:
+            return NORMAL
+        now = time.monotonic()
+        if now - self._checked_at >= self.CHECK_INTERVAL:
+            self._checked_at = now
+            self._evaluate(now)
+        return self._level
+
+    def observe(self, seconds: float) -> None:
+        """Время решения одного задания через AI (успешного или нет)"""
+        self._samples.append((time.monotonic(), seconds))
+
+    def p95(self, now: Optional[float] = None) -> float:
+        """p95 времени решения за окно (0 — мало замеров)"""
+        now = time.monotonic() if now is None else now
+        while self._samples and self._samples[0][0] < now - self.window:
+            self._samples.popleft()
+        if len(self._samples) < _MIN_SAMPLES:
+            return 0.0
+        values = sorted(seconds for _, seconds in self._samples)
+        return values[math.ceil(0.95 * len(values)) - 1]
+
+    def signals(self, now: Optional[float] = None) -> dict[str, float]:
+        return {
+            "ocr_queue": OCR_EXECUTOR_QUEUE.get(),
+            "ai_in_flight": AI_IN_FLIGHT.get(),
+            "p95": round(self.p95(now), 2),
+        }
+
+    def _evaluate(self, now: float) -> None:
+        signals = self.signals(now)
+        pressure = max(
+            signals["ocr_queue"] / self.ocr_queue_high if self.ocr_queue_high else 0,
+            signals["ai_in_flight"] / self.ai_in_flight_high if self.ai_in_flight_high else 0,
+            signals["p95"] / self.p95_high if self.p95_high else 0,
+        )
+
+        if pressure >= 1:
+            self._calm_since = None
+            if self._level < CACHE_ONLY and now - self._changed_at >= self.step_interval:
+                self._set_level(self._level + 1, now, signals)
+        elif pressure <= self.recover_ratio:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif self._level > NORMAL and now - self._calm_since >= self.cooldown:
+                self._set_level(self._level - 1, now, signals)
+                # Следующая ступень вниз — после ещё одного спокойного интервала
+                self._calm_since = now
+        else:
+            self._calm_since = None
+
+    def _set_level(self, level: int, now: float, signals: dict[str, float]) -> None:
+        logger.warning(
+            f"Режим нагрузки: {LEVEL_NAMES[self._level]} -> {LEVEL_NAMES[level]} "
+            f"(очередь OCR {signals['ocr_queue']:.0f}, AI в работе {signals['ai_in_flight']:.0f}, "
+            f"p95 {signals['p95']} с)"
+        )
+        self._level = level
+        self._changed_at = now
+
+
+# Singleton экземпляр
+load_shedder = LoadShedder()
+DEGRADATION_LEVEL.set_function(lambda: load_shedder.level)
@@ -0,0 +1,178 @@
+"""
+Логирование без блокирующего I/O в event loop
+
+Обработчики логгеров только кладут запись в очередь (QueueHandler),
+а консоль и файл с ротацией пишет фоновый поток QueueListener.
+Записи дополняются update_id / request_id текущего задания, частые
+INFO-строки отдельных модулей можно сэмплировать.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from config import config
+from services.metrics import LOG_RECORDS_DROPPED
+
+# Идентификаторы для корреляции строк одного update / задания
+_log_context: ContextVar[dict[str, Any]] = ContextVar("log_context", default={})
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+def bind_log_context(**values: Any) -> Any:
+    """Добавить идентификаторы к записям текущего контекста (токен для reset_log_context)"""
+    return _log_context.set({**_log_context.get(), **values})
+
+
+def reset_log_context(token: Any) -> None:
+    _log_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Копирует идентификаторы из контекста в запись (в потоке вызова)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        record.update_id = context.get("update_id")
+        record.request_id = context.get("request_id")
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Оставляет долю INFO/DEBUG записей логгера и его потомков
+
+    WARNING и выше проходят всегда. rates: {"aiogram.event": 0.1}
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        # Длинные префиксы первыми: правило модуля важнее правила пакета
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _rate(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при переполнении очереди теряет запись, а не ждёт"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение и traceback собираются здесь (аргументы могут измениться
+        # до записи), но остаются раздельными — для поля exc в JSON
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна JSON-строка"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ("update_id", "request_id"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Прежний формат строк + [update=… request=…], если идентификаторы есть"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        ids = [
+            f"{label}={value}"
+            for label, value in (("update", getattr(record, "update_id", None)),
+                                 ("request", getattr(record, "request_id", None)))
+            if value is not None
+        ]
+        return f"{line} [{' '.join(ids)}]" if ids else line
+
+
+def _file_handler(path: str) -> logging.Handler:
+    if config.LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when=config.LOG_ROTATE_WHEN, backupCount=config.LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    return logging.handlers.RotatingFileHandler(
+        path, maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+
+
+def setup_logging(to_file: bool = True) -> None:
+    """
+    Настройка корневого логгера (повторный вызов ничего не делает)
+
+    Args:
+        to_file: Писать ли в LOG_FILE; serverless-функциям хватает консоли
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if config.LOG_FORMAT == "json" else TextFormatter(TEXT_FORMAT)
+    handlers: list[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if to_file and config.LOG_FILE:
+        handlers.append(_file_handler(config.LOG_FILE))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=config.LOG_QUEUE_SIZE))
+    queue_handler.addFilter(SamplingFilter(config.LOG_SAMPLING))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(config.LOG_LEVEL.upper())
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Дописать очередь и остановить поток записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,313 @@
+"""
+Метрики бота в текстовом формате Prometheus
+Счётчики, gauge и гистограммы без внешних зависимостей
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+# Границы гистограмм задержек (секунды): от быстрых запросов к БД до ответа AI
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Общая часть: имя, описание и дочерние значения по меткам"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Метрика без меток видна в /metrics сразу, с нулём
+            self._children[()] = self._new_child()
+
+    def labels(self, *values: str):
+        """Значение метрики для набора меток (создаётся при первом обращении)"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key: tuple[str, ...], child) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"]
+
+
+class _Value:
+    """Число, изменяемое из любого потока"""
+
+    __slots__ = ("_value", "_lock", "_function")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Значение вычисляется при каждом запросе /metrics"""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._value
+
+
+class Counter(_Metric):
+    """Монотонный счётчик"""
+
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    """Текущее значение (задачи в работе, глубина очереди)"""
+
+    kind = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self._default().dec(amount)
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._default().set_function(function)
+
+    def get(self) -> float:
+        return self._default().get()
+
+
+class _HistogramValue:
+    """Распределение наблюдений по корзинам"""
+
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя — +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Замер длительности блока with"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    """Гистограмма длительностей"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, key: tuple[str, ...], child: _HistogramValue) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {child.sum!r}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Singleton реестр процесса
+metrics = MetricsRegistry()
+
+# --- Метрики конвейера ---
+
+# Этапы: download, ocr_preprocess, tesseract, ai_ttft, ai_fast, ai_main, ai_total
+STAGE_SECONDS = metrics.histogram(
+    "gdz_stage_seconds", "Длительность этапов обработки задания", ("stage",)
+)
+DB_QUERY_SECONDS = metrics.histogram(
+    "gdz_db_query_seconds", "Длительность вызовов DatabaseService", ("method",)
+)
+TELEGRAM_REQUEST_SECONDS = metrics.histogram(
+    "gdz_telegram_request_seconds", "Длительность исходящих запросов к Bot API", ("method",)
+)
+SEND_QUEUE_SECONDS = metrics.histogram(
+    "gdz_send_queue_seconds", "Ожидание в очереди исходящих сообщений"
+)
+UPDATE_SECONDS = metrics.histogram(
+    "gdz_update_seconds", "Полная обработка update диспетчером", ("type",)
+)
+
+UPDATES_TOTAL = metrics.counter("gdz_updates_total", "Обработанные update", ("type",))
+AI_REQUESTS_TOTAL = metrics.counter(
+    "gdz_ai_requests_total", "Запросы к AI по модели (fast/main) и результату", ("tier", "result")
+)
+AI_ESCALATIONS_TOTAL = metrics.counter(
+    "gdz_ai_escalations_total", "Задания, переданные с быстрой модели на основную"
+)
+AI_COST_USD = metrics.counter("gdz_ai_cost_usd_total", "Стоимость запросов к AI по AI_PRICES", ("tier",))
+TELEGRAM_RETRY_AFTER_TOTAL = metrics.counter(
+    "gdz_telegram_retry_after_total", "Ответы Bot API с flood control (retry_after)"
+)
+SOLUTION_CACHE_TOTAL = metrics.counter(
+    "gdz_solution_cache_total", "Поиск задания в кэше решений (hit/miss)", ("result",)
+)
+LOCAL_REPLIES_TOTAL = metrics.counter(
+    "gdz_local_replies_total", "Сообщения без задания, на которые бот ответил сам", ("kind",)
+)
+OVERLOADED_TOTAL = metrics.counter(
+    "gdz_overloaded_total", "Задания, отклонённые в режиме cache_only (перегрузка)"
+)
+DUPLICATE_UPDATES_TOTAL = metrics.counter(
+    "gdz_duplicate_updates_total", "Повторные доставки update, отброшенные дедупликацией"
+)
+DEDUP_AI_CALLS_SAVED_TOTAL = metrics.counter(
+    "gdz_dedup_ai_calls_saved_total", "Отброшенные дубликаты, которые стоили бы запроса к AI"
+)
+THROTTLED_TOTAL = metrics.counter(
+    "gdz_throttled_total", "Задания, отклонённые лимитами (rate — частота, quota — дневная квота)", ("reason",)
+)
+CANCELLED_TOTAL = metrics.counter("gdz_cancelled_total", "Задания, отменённые пользователем")
+CORPUS_LOOKUPS_TOTAL = metrics.counter(
+    "gdz_corpus_lookups_total", "Поиск задания в корпусе готовых ответов (hit/miss)", ("result",)
+)
+SENT_MESSAGES_TOTAL = metrics.counter(
+    "gdz_sent_messages_total", "Успешные вызовы Bot API из очереди исходящих сообщений"
+)
+SEND_EDITS_MERGED_TOTAL = metrics.counter(
+    "gdz_send_edits_merged_total", "Правки сообщения, слитые в очереди с более свежей"
+)
+LOG_RECORDS_DROPPED = metrics.counter(
+    "gdz_log_records_dropped_total", "Записи лога, потерянные из-за переполнения очереди"
+)
+
+UPDATES_IN_FLIGHT = metrics.gauge("gdz_updates_in_flight", "Update в обработке")
+UPDATE_QUEUE_PENDING = metrics.gauge("gdz_update_queue_pending", "Update в очереди webhook")
+SEND_CHATS_ACTIVE = metrics.gauge("gdz_send_chats_active", "Чаты с активной очередью исходящих сообщений")
+AI_IN_FLIGHT = metrics.gauge("gdz_ai_in_flight", "Запросы к AI в работе")
+TESSERACT_IN_FLIGHT = metrics.gauge("gdz_tesseract_in_flight", "Запущенные процессы tesseract")
+DEGRADATION_LEVEL = metrics.gauge(
+    "gdz_degradation_level", "Режим деградации под нагрузкой (0 — обычный, 5 — только кэш)"
+)
+OCR_EXECUTOR_QUEUE = metrics.gauge(
+    "gdz_ocr_executor_queue_depth", "Изображения, ждущие свободного потока подготовки OCR"
+)
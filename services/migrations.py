@@ -0,0 +1,234 @@
+"""
+Версионированные миграции схемы SQLite
+Каждая миграция применяется один раз, номер версии хранится в таблице schema_version
+"""
+import aiosqlite
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Размер пачки для фоновых обновлений больших таблиц
+BATCH_SIZE = 5000
+
+Migration = Callable[[aiosqlite.Connection], Awaitable[None]]
+
+
+async def _column_exists(db: aiosqlite.Connection, table: str, column: str) -> bool:
+    """Проверка наличия колонки (ALTER TABLE ADD COLUMN не идемпотентен)"""
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    rows = await cursor.fetchall()
+    return any(row[1] == column for row in rows)
+
+
+async def _update_in_batches(
+    db: aiosqlite.Connection,
+    table: str,
+    set_clause: str,
+    where_clause: str,
+    batch_size: int = BATCH_SIZE
+) -> int:
+    """
+    Обновление большой таблицы пачками по диапазонам id
+
+    Каждая пачка коммитится отдельно, поэтому блокировка на запись
+    держится миллисекунды, а не минуты, и бот продолжает писать в БД.
+    Условие where_clause должно быть идемпотентным — прерванная миграция
+    просто продолжится при следующем запуске.
+    """
+    cursor = await db.execute(f"SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM {table}")
+    min_id, max_id = await cursor.fetchone()
+
+    updated = 0
+    start = min_id
+    while start <= max_id:
+        cursor = await db.execute(
+            f"UPDATE {table} SET {set_clause} "
+            f"WHERE id >= ? AND id < ? AND ({where_clause})",
+            (start, start + batch_size)
+        )
+        await db.commit()
+        updated += cursor.rowcount
+        start += batch_size
+
+    return updated
+
+
+async def _001_request_time_indexes(db: aiosqlite.Connection) -> None:
+    """Индексы для выборок по времени и по пользователю за период"""
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_requests_user_created
+        ON requests (user_id, created_at)
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_requests_created_at
+        ON requests (created_at)
+    """)
+    # (user_id, created_at) покрывает поиск по user_id
+    await db.execute("DROP INDEX IF EXISTS idx_requests_user_id")
+
+
+async def _002_request_source_latency(db: aiosqlite.Connection) -> None:
+    """Типизированные колонки источника запроса и времени ответа"""
+    if not await _column_exists(db, "requests", "source"):
+        await db.execute(
+            "ALTER TABLE requests ADD COLUMN source TEXT NOT NULL DEFAULT 'text'"
+        )
+    if not await _column_exists(db, "requests", "latency_ms"):
+        await db.execute("ALTER TABLE requests ADD COLUMN latency_ms INTEGER")
+    await db.commit()
+
+    # Старые запросы с фото помечались префиксом в тексте
+    updated = await _update_in_batches(
+        db,
+        "requests",
+        "source = 'image'",
+        "source = 'text' AND request_text LIKE '[IMAGE OCR]%'"
+    )
+    logger.info(f"Миграция источника запросов: обновлено {updated} строк")
+
+
+async def _003_processed_updates(db: aiosqlite.Connection) -> None:
+    """Общее окно обработанных update_id для нескольких инстансов"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS processed_updates (
+            update_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_processed_updates_updated_at
+        ON processed_updates (updated_at)
+    """)
+
+
+async def _004_user_quotas(db: aiosqlite.Connection) -> None:
+    """Счётчики ограничений частоты и дневной квоты пользователей"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS user_quotas (
+            telegram_id INTEGER PRIMARY KEY,
+            day TEXT NOT NULL,
+            used INTEGER NOT NULL DEFAULT 0,
+            recent TEXT NOT NULL DEFAULT '',
+            updated_at REAL NOT NULL
+        )
+    """)
+
+
+async def _005_request_status_cancel(db: aiosqlite.Connection) -> None:
+    """Статус запроса и заявки на отмену для solver-процессов"""
+    if not await _column_exists(db, "requests", "status"):
+        # Все старые запросы считаются завершёнными
+        await db.execute(
+            "ALTER TABLE requests ADD COLUMN status TEXT NOT NULL DEFAULT 'done'"
+        )
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS cancel_requests (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        )
+    """)
+
+
+async def _006_request_traces(db: aiosqlite.Connection) -> None:
+    """Трассы заданий: этапы по строке на этап и атрибуты в JSON"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS request_traces (
+            request_id INTEGER PRIMARY KEY,
+            total_ms REAL NOT NULL,
+            db_ms REAL NOT NULL,
+            attrs TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            FOREIGN KEY (request_id) REFERENCES requests (id)
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS request_stages (
+            request_id INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            start_ms REAL NOT NULL,
+            duration_ms REAL NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+    # Перцентили считаются по окну времени в разрезе этапа
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_request_stages_created_stage
+        ON request_stages (created_at, stage)
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_request_stages_request_id
+        ON request_stages (request_id)
+    """)
+
+
+async def _007_api_jobs(db: aiosqlite.Connection) -> None:
+    """Пачки заданий HTTP API: статус собирается из строк requests"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS api_jobs (
+            id TEXT PRIMARY KEY,
+            api_client TEXT NOT NULL,
+            request_ids TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+
+
+# Порядок важен: версии только растут, применённые миграции не меняются
+MIGRATIONS: list[tuple[int, str, Migration]] = [
+    (1, "indexes on requests (user_id, created_at) and (created_at)", _001_request_time_indexes),
+    (2, "requests.source and requests.latency_ms", _002_request_source_latency),
+    (3, "processed_updates dedup window", _003_processed_updates),
+    (4, "user_quotas throttling counters", _004_user_quotas),
+    (5, "requests.status and cancel_requests", _005_request_status_cancel),
+    (6, "request_traces and request_stages", _006_request_traces),
+    (7, "api_jobs for HTTP API batches", _007_api_jobs),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def get_schema_version(db: aiosqlite.Connection) -> int:
+    """Текущая версия схемы (0 если миграции ещё не применялись)"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor = await db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    row = await cursor.fetchone()
+    return row[0]
+
+
+async def run_migrations(db: aiosqlite.Connection) -> int:
+    """
+    Применение всех недостающих миграций по порядку
+
+    Returns:
+        Версия схемы после применения
+    """
+    current = await get_schema_version(db)
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+
+        logger.info(f"Применяю миграцию {version}: {description}")
+        await migrate(db)
+        # OR IGNORE: параллельно стартующий инстанс мог успеть записать версию
+        await db.execute(
+            "INSERT OR IGNORE INTO schema_version (version, description) VALUES (?, ?)",
+            (version, description)
+        )
+        await db.commit()
+        current = version
+
+    # Копия версии в заголовке файла для быстрой проверки при старте
+    await db.execute(f"PRAGMA user_version = {current}")
+    return current
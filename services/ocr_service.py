@@ -1,24 +1,48 @@
 """
 Сервис распознавания текста с изображений (OCR)
-Использует pytesseract + Pillow
+Использует Pillow для подготовки изображения и процесс tesseract для распознавания
 """
-import pytesseract
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 import asyncio
 import logging
 import os
+import time
+
+from config import config
+from services.metrics import OCR_EXECUTOR_QUEUE, TESSERACT_IN_FLIGHT
+from services.trace import current_trace, record_stage, stage
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 logger = logging.getLogger(__name__)
 
-# Укажи путь к tesseract.exe если он не в PATH
-# Раскомментируй и измени путь если нужно:
-# pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+# Pillow и pytesseract загружаются при первом фото: холодный старт
+# serverless-функции на текстовых обновлениях их не импортирует
+_pytesseract = None
+_Image = None
+
+
+def _load_ocr_stack():
+    """Ленивая загрузка pytesseract и Pillow"""
+    global _pytesseract, _Image
+    if _pytesseract is None:
+        import pytesseract
+        from PIL import Image
+
+        # Укажи путь к tesseract.exe если он не в PATH
+        # Раскомментируй и измени путь если нужно:
+        # pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
-# Или через переменную окружения в .env:
-if os.getenv("TESSERACT_PATH"):
-    pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_PATH")
+        # Или через переменную окружения в .env:
+        if os.getenv("TESSERACT_PATH"):
+            pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_PATH")
+
+        _Image = Image
+        _pytesseract = pytesseract
+    return _pytesseract, _Image
 
 
 class OCRService:
@@ -27,72 +51,146 @@ class OCRService:
     # Поддерживаемые языки для распознавания
     LANGUAGES = "rus+eng"
     
-    async def extract_text(self, image_bytes: bytes) -> Optional[str]:
+    def __init__(self):
+        # Свой пул потоков подготовки: ограничивает CPU под Pillow и даёт
+        # честную глубину очереди для метрик
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=config.OCR_WORKERS,
+                thread_name_prefix="ocr"
+            )
+        return self._executor
+    
+    async def extract_text(self, image_bytes: bytes, reduced: bool = False) -> Optional[str]:
         """
         Извлечение текста из изображения
         
         Args:
             image_bytes: Байты изображения
+            reduced: Пониженное разрешение (перегрузка): без увеличения,
+                     ширина не больше DEGRADE_OCR_WIDTH — tesseract быстрее
             
         Returns:
             Распознанный текст или None при ошибке
         """
         try:
-            # Выполняем OCR в отдельном потоке чтобы не блокировать event loop
-            loop = asyncio.get_event_loop()
-            text = await loop.run_in_executor(
-                None, 
-                self._process_image, 
-                image_bytes
-            )
-            return text
+            # Подготовка изображения в отдельном потоке чтобы не блокировать event loop
+            OCR_EXECUTOR_QUEUE.inc()
+            future = self._get_executor().submit(self._prepare_image_timed, image_bytes, reduced)
+            try:
+                image_png, prepare_started, prepare_finished = await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # Задача так и не стартовала — из очереди её убрала отмена
+                if future.cancelled():
+                    OCR_EXECUTOR_QUEUE.dec()
+                raise
+            
+            record_stage("ocr_preprocess", prepare_started, prepare_finished)
+            
+            trace = current_trace()
+            if trace is not None:
+                trace.set(ocr_engine="tesseract", ocr_lang=self.LANGUAGES)
+                if reduced:
+                    trace.set(ocr_reduced=True)
+            with stage("tesseract"):
+                return await self._run_tesseract(image_png)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"Ошибка OCR: {e}")
             return None
     
-    def _process_image(self, image_bytes: bytes) -> Optional[str]:
+    def _prepare_image_timed(self, image_bytes: bytes, reduced: bool = False) -> tuple[bytes, float, float]:
+        """
+        Подготовка с учётом очереди (выполняется в потоке пула)
+        Отметки времени возвращаются в event loop: трасса задания в потоке недоступна
+        """
+        OCR_EXECUTOR_QUEUE.dec()
+        started = time.perf_counter()
+        image_png = self._prepare_image(image_bytes, reduced)
+        return image_png, started, time.perf_counter()
+    
+    def _prepare_image(self, image_bytes: bytes, reduced: bool = False) -> bytes:
         """
-        Синхронная обработка изображения (выполняется в executor)
+        Синхронная подготовка изображения (выполняется в executor)
+        Возвращает PNG для передачи tesseract через stdin
         """
+        _, Image = _load_ocr_stack()
+        
+        # Открываем изображение
+        image = Image.open(BytesIO(image_bytes))
+        
+        # Конвертируем в RGB если нужно (для PNG с прозрачностью)
+        if image.mode in ('RGBA', 'P'):
+            image = image.convert('RGB')
+        
+        # Предобработка для улучшения распознавания
+        image = self._preprocess_image(image, reduced)
+        
+        output = BytesIO()
+        image.save(output, format="PNG")
+        return output.getvalue()
+    
+    async def _run_tesseract(self, image_png: bytes) -> Optional[str]:
+        """
+        Распознавание отдельным процессом tesseract
+        
+        В отличие от потока executor процесс можно остановить: при отмене
+        задания он завершается сразу и не занимает CPU до конца распознавания.
+        """
+        pytesseract, _ = _load_ocr_stack()
+        process = await asyncio.create_subprocess_exec(
+            pytesseract.pytesseract.tesseract_cmd,
+            "stdin", "stdout",
+            "-l", self.LANGUAGES,
+            "--psm", "6",  # Assume uniform block of text
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        TESSERACT_IN_FLIGHT.inc()
         try:
-            # Открываем изображение
-            image = Image.open(BytesIO(image_bytes))
-            
-            # Конвертируем в RGB если нужно (для PNG с прозрачностью)
-            if image.mode in ('RGBA', 'P'):
-                image = image.convert('RGB')
-            
-            # Предобработка для улучшения распознавания
-            image = self._preprocess_image(image)
-            
-            # Распознаём текст
-            text = pytesseract.image_to_string(
-                image, 
-                lang=self.LANGUAGES,
-                config='--psm 6'  # Assume uniform block of text
-            )
-            
-            # Очищаем результат
-            text = text.strip()
-            
-            if not text:
-                return None
-                
-            return text
-            
-        except Exception as e:
-            logger.error(f"Ошибка обработки изображения: {e}")
+            stdout, stderr = await process.communicate(image_png)
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        finally:
+            TESSERACT_IN_FLIGHT.dec()
+        
+        if process.returncode != 0:
+            logger.error(f"Ошибка tesseract ({process.returncode}): {stderr.decode(errors='replace').strip()}")
+            return None
+        
+        # Очищаем результат
+        text = stdout.decode("utf-8", errors="replace").strip()
+        
+        if not text:
             return None
+            
+        return text
     
-    def _preprocess_image(self, image: Image.Image) -> Image.Image:
+    def _preprocess_image(self, image: "Image.Image", reduced: bool = False) -> "Image.Image":
         """
         Предобработка изображения для улучшения OCR
         """
-        # Увеличиваем размер если изображение маленькое
         width, height = image.size
+        if reduced:
+            # Под нагрузкой: меньше пикселей — быстрее tesseract, точность чуть ниже
+            if width > config.DEGRADE_OCR_WIDTH:
+                ratio = config.DEGRADE_OCR_WIDTH / width
+                _, Image = _load_ocr_stack()
+                image = image.resize((config.DEGRADE_OCR_WIDTH, int(height * ratio)), Image.Resampling.BILINEAR)
+            return image.convert('L')
+        
+        # Увеличиваем размер если изображение маленькое
         if width < 1000:
             ratio = 1000 / width
             new_size = (int(width * ratio), int(height * ratio))
+            _, Image = _load_ocr_stack()
             image = image.resize(new_size, Image.Resampling.LANCZOS)
         
         # Конвертируем в grayscale для лучшего распознавания
@@ -0,0 +1,67 @@
+"""
+Краткоживущее состояние неудавшихся запросов для кнопки «Попробовать снова»
+"""
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from config import config
+
+
+class RetryState(NamedTuple):
+    """Всё, что нужно для повтора этапа AI без повторного OCR"""
+    request_id: int
+    telegram_id: int
+    task_text: str
+    chat_id: int
+    message_id: int  # Сообщение с кнопкой повтора
+    retries: int = 0  # Сколько повторов уже было
+
+
+class RequestStateStore:
+    """
+    Хранилище состояния в памяти с TTL
+
+    Записи живут RETRY_STATE_TTL секунд и не больше RETRY_STATE_SIZE штук
+    (вытесняются самые старые). take() забирает запись, поэтому повторное
+    нажатие кнопки не запустит второй запрос к AI.
+    """
+
+    def __init__(self):
+        self.ttl = config.RETRY_STATE_TTL
+        self.max_size = config.RETRY_STATE_SIZE
+        # request_id -> (срок жизни, состояние), в порядке добавления
+        self._items: OrderedDict[int, tuple[float, RetryState]] = OrderedDict()
+
+    def put(self, state: RetryState) -> None:
+        """Сохранить состояние запроса"""
+        self._purge()
+        self._items[state.request_id] = (time.monotonic() + self.ttl, state)
+        self._items.move_to_end(state.request_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def take(self, request_id: int) -> Optional[RetryState]:
+        """Забрать состояние (None если его нет или срок истёк)"""
+        item = self._items.pop(request_id, None)
+        if item is None or item[0] < time.monotonic():
+            return None
+        return item[1]
+
+    def discard(self, request_id: int) -> None:
+        self._items.pop(request_id, None)
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        while self._items:
+            expires_at, _ = next(iter(self._items.values()))
+            if expires_at >= now:
+                break
+            self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# Singleton экземпляр хранилища
+request_state = RequestStateStore()
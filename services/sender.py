@@ -0,0 +1,213 @@
+"""
+Исходящие сообщения в Telegram с учётом лимитов
+Очередь на каждый чат, общий и чатовый token bucket, автоматический retry_after
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import DeleteMessage, EditMessageText, SendMessage, TelegramMethod
+from aiogram.types import Message
+
+from config import config
+from services.metrics import (
+    SEND_CHATS_ACTIVE,
+    SEND_EDITS_MERGED_TOTAL,
+    SEND_QUEUE_SECONDS,
+    SENT_MESSAGES_TOTAL,
+    TELEGRAM_REQUEST_SECONDS,
+    TELEGRAM_RETRY_AFTER_TOTAL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        """Дождаться свободного токена"""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _Operation:
+    """Запрос к Bot API в очереди чата"""
+
+    __slots__ = ("bot", "method", "future", "enqueued_at")
+
+    def __init__(self, bot: Bot, method: TelegramMethod, future: asyncio.Future):
+        self.bot = bot
+        self.method = method
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _ChatQueue:
+    """Очередь одного чата: операции выполняются строго по порядку"""
+
+    __slots__ = ("queue", "bucket", "pending_edits")
+
+    def __init__(self, bucket: TokenBucket):
+        self.queue: asyncio.Queue[_Operation] = asyncio.Queue()
+        self.bucket = bucket
+        # message_id -> ещё не начатое редактирование (для слияния)
+        self.pending_edits: dict[int, _Operation] = {}
+
+
+class TelegramSender:
+    """
+    Отправитель сообщений, через который ходят все хендлеры
+
+    Сообщения одного чата уходят по порядку; частота ограничена
+    чатовым и глобальным token bucket. Несколько правок одного сообщения,
+    ещё стоящих в очереди, сливаются в одну — уходит последний текст.
+    На TelegramRetryAfter очередь чата ждёт указанное время и повторяет.
+    """
+
+    # Сколько раз повторять запрос после TelegramRetryAfter
+    MAX_RETRIES = 3
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(config.SEND_GLOBAL_RATE, config.SEND_GLOBAL_RATE)
+        self.chat_rate = config.SEND_CHAT_RATE
+        self.chat_burst = config.SEND_CHAT_BURST
+        self.idle_timeout = config.SEND_QUEUE_IDLE_TIMEOUT
+        self._chats: dict[int, _ChatQueue] = {}
+
+        # Метрики: чаты с очередью; ожидание и отправки — в gdz_send_* (services.metrics)
+        SEND_CHATS_ACTIVE.set_function(lambda: len(self._chats))
+
+    # --- API для хендлеров ---
+
+    async def answer(self, message: Message, text: str, **kwargs: Any) -> Message:
+        """Аналог message.answer() через очередь"""
+        method = SendMessage(chat_id=message.chat.id, text=text, **kwargs)
+        return await self._submit(message.bot, message.chat.id, method)
+
+    async def edit_text(self, message: Message, text: str, **kwargs: Any) -> Any:
+        """Аналог message.edit_text(); правки в очереди сливаются"""
+        chat = self._get_chat(message.chat.id)
+        pending = chat.pending_edits.get(message.message_id)
+        if pending is not None:
+            # Ещё не отправлено — просто подменяем текст
+            pending.method = EditMessageText(
+                chat_id=message.chat.id, message_id=message.message_id, text=text, **kwargs
+            )
+            SEND_EDITS_MERGED_TOTAL.inc()
+            return await pending.future
+
+        method = EditMessageText(
+            chat_id=message.chat.id, message_id=message.message_id, text=text, **kwargs
+        )
+        return await self._submit(message.bot, message.chat.id, method, edit_of=message.message_id)
+
+    async def delete(self, message: Message) -> Any:
+        """Аналог message.delete() через очередь"""
+        chat = self._get_chat(message.chat.id)
+        # Правка удаляемого сообщения больше не нужна
+        pending = chat.pending_edits.pop(message.message_id, None)
+        if pending is not None:
+            pending.method = None
+        method = DeleteMessage(chat_id=message.chat.id, message_id=message.message_id)
+        return await self._submit(message.bot, message.chat.id, method)
+
+    # --- Внутреннее ---
+
+    def _get_chat(self, chat_id: int) -> _ChatQueue:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = _ChatQueue(TokenBucket(self.chat_rate, self.chat_burst))
+            self._chats[chat_id] = chat
+            asyncio.create_task(self._chat_worker(chat_id, chat))
+        return chat
+
+    async def _submit(
+        self,
+        bot: Bot,
+        chat_id: int,
+        method: TelegramMethod,
+        edit_of: Optional[int] = None
+    ) -> Any:
+        chat = self._get_chat(chat_id)
+        operation = _Operation(bot, method, asyncio.get_running_loop().create_future())
+        if edit_of is not None:
+            chat.pending_edits[edit_of] = operation
+        chat.queue.put_nowait(operation)
+        return await operation.future
+
+    async def _chat_worker(self, chat_id: int, chat: _ChatQueue) -> None:
+        """Воркер чата; завершается после простоя, чтобы не держать задачи на каждый чат"""
+        while True:
+            try:
+                operation = await asyncio.wait_for(chat.queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                if chat.queue.empty():
+                    del self._chats[chat_id]
+                    return
+                continue
+
+            method = operation.method
+            if isinstance(method, EditMessageText):
+                chat.pending_edits.pop(method.message_id, None)
+                method = operation.method  # Текст мог смениться при слиянии
+            if method is None:
+                # Правка отменена удалением сообщения
+                operation.future.set_result(True)
+                continue
+
+            waited = time.monotonic() - operation.enqueued_at
+            SEND_QUEUE_SECONDS.observe(waited)
+            try:
+                result = await self._call(operation.bot, chat, method)
+            except Exception as e:
+                if not operation.future.done():
+                    operation.future.set_exception(e)
+            else:
+                if not operation.future.done():
+                    operation.future.set_result(result)
+
+    async def _call(self, bot: Bot, chat: _ChatQueue, method: TelegramMethod) -> Any:
+        """Вызов Bot API с лимитами и ожиданием retry_after"""
+        for attempt in range(self.MAX_RETRIES + 1):
+            await chat.bucket.acquire()
+            await self.global_bucket.acquire()
+            started = time.perf_counter()
+            try:
+                result = await bot(method)
+                SENT_MESSAGES_TOTAL.inc()
+                return result
+            except TelegramRetryAfter as e:
+                TELEGRAM_RETRY_AFTER_TOTAL.inc()
+                if attempt == self.MAX_RETRIES:
+                    raise
+                retry_after = e.retry_after
+            except TelegramBadRequest as e:
+                # Правка тем же текстом — не ошибка
+                if isinstance(method, EditMessageText) and "message is not modified" in str(e):
+                    return True
+                raise
+            finally:
+                TELEGRAM_REQUEST_SECONDS.labels(type(method).__name__).observe(time.perf_counter() - started)
+
+            logger.warning(f"Flood control: ждём {retry_after} с перед повтором")
+            await asyncio.sleep(retry_after)
+
+
+# Singleton экземпляр сервиса
+sender = TelegramSender()
@@ -0,0 +1,162 @@
+"""
+Конвейер решения задания: OCR → кэш решений → корпус готовых ответов → AI
+Общий для обработчиков Telegram и HTTP API
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config import config
+from services.ai_service import ai_service
+from services.answer_corpus import answer_corpus, format_corpus_answer, normalize_task, task_hash
+from services.db_service import db_service
+from services.load_shedder import (
+    load_shedder, Overloaded, CACHE_ONLY, FAST_MODEL, NEAR_DUPLICATES, OCR_REDUCED, SHORT_ANSWERS
+)
+from services.metrics import OVERLOADED_TOTAL, SOLUTION_CACHE_TOTAL
+from services.ocr_service import ocr_service
+from services.trace import current_trace
+
+logger = logging.getLogger(__name__)
+
+
+class SolutionCache:
+    """
+    Недавние решения AI в памяти с TTL
+
+    Ключ — хеш нормализованного текста, поэтому одно и то же задание
+    от разных пользователей (класс прислал один номер) решается один раз.
+    Хранится не больше SOLUTION_CACHE_SIZE записей, старые вытесняются.
+    """
+
+    def __init__(self):
+        self.ttl = config.SOLUTION_CACHE_TTL
+        self.max_size = config.SOLUTION_CACHE_SIZE
+        # hash -> (срок жизни, решение), от давно использованных к недавним
+        self._items: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return item[1]
+
+    def put(self, key: str, solution: str, ttl: Optional[int] = None) -> None:
+        """ttl короче обычного — для ответов, полученных под нагрузкой"""
+        if self.max_size <= 0:
+            return
+        self._items[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), solution)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def snapshot(self) -> list[tuple[str, float, str]]:
+        """Живые записи (ключ, секунд до истечения, решение), от давних к недавним"""
+        now = time.monotonic()
+        return [
+            (key, expires_at - now, solution)
+            for key, (expires_at, solution) in self._items.items()
+            if expires_at > now
+        ]
+
+    def restore(self, items: list[tuple[str, float, str]]) -> None:
+        """Загрузка записей из snapshot() с оставшимся сроком жизни"""
+        now = time.monotonic()
+        for key, ttl, solution in items:
+            if ttl > 0 and self.max_size > 0:
+                self._items[key] = (now + min(ttl, self.ttl), solution)
+                self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SolvePipeline:
+    """
+    Этапы решения без привязки к транспорту: на входе байты фото или текст
+
+    Под нагрузкой этапы упрощаются по режиму load_shedder; в режиме
+    CACHE_ONLY задание без готового ответа отклоняется (Overloaded).
+    """
+
+    def __init__(self):
+        self.cache = SolutionCache()
+
+    async def recognize(self, image_data: bytes) -> Optional[str]:
+        """OCR: текст задания с изображения или None"""
+        level = load_shedder.level
+        if level >= CACHE_ONLY:
+            # OCR — самый дорогой этап; фото ждёт, пока нагрузка спадёт
+            OVERLOADED_TOTAL.inc()
+            raise Overloaded()
+        return await ocr_service.extract_text(image_data, reduced=level >= OCR_REDUCED)
+
+    async def solve(self, task_text: str) -> Optional[str]:
+        """
+        Решение задания или None при ошибке AI
+
+        Источник ответа попадает в трассу: cache_hit, corpus_id или модель AI.
+        """
+        trace = current_trace()
+        level = load_shedder.level
+        if trace is not None and level:
+            trace.set(degradation_level=level)
+        key = task_hash(normalize_task(task_text))
+
+        solution = self.cache.get(key)
+        if trace is not None:
+            trace.set(cache_hit=solution is not None)
+        if solution is not None:
+            SOLUTION_CACHE_TOTAL.labels("hit").inc()
+            return solution
+        SOLUTION_CACHE_TOTAL.labels("miss").inc()
+
+        # Номер из учебника может быть в корпусе готовых ответов — без запроса к AI
+        found = await answer_corpus.lookup(
+            task_text, config.DEGRADE_CORPUS_SIMILARITY if level >= NEAR_DUPLICATES else None
+        )
+        if found is not None:
+            if trace is not None:
+                trace.set(corpus_id=found.id, corpus_similarity=found.similarity)
+            return format_corpus_answer(found)
+
+        if level >= CACHE_ONLY:
+            OVERLOADED_TOTAL.inc()
+            raise Overloaded()
+
+        started = time.monotonic()
+        try:
+            solution = await ai_service.get_solution(
+                task_text,
+                max_tokens=config.DEGRADE_MAX_TOKENS if level >= SHORT_ANSWERS else None,
+                force_fast=level >= FAST_MODEL
+            )
+        finally:
+            load_shedder.observe(time.monotonic() - started)
+        if solution:
+            # Урезанный ответ (короткий, быстрой моделью) кэшируется ненадолго:
+            # иначе после спада нагрузки его отдавали бы ещё SOLUTION_CACHE_TTL
+            self.cache.put(key, solution, config.DEGRADE_CACHE_TTL if level >= SHORT_ANSWERS else None)
+        return solution
+
+
+async def save_trace(request_id: int) -> None:
+    """Трасса задания пишется рядом с запросом; ошибка записи не мешает ответу"""
+    trace = current_trace()
+    if trace is None:
+        return
+    try:
+        await db_service.save_trace(request_id, trace)
+    except Exception as e:
+        logger.error(f"Ошибка сохранения трассы запроса {request_id}: {e}")
+
+
+# Singleton экземпляр конвейера
+solve_pipeline = SolvePipeline()
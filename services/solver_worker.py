@@ -0,0 +1,97 @@
+"""
+Solver-воркер: забирает задачи из очереди и прогоняет их через хендлеры
+OCR, запрос к AI и отправка ответа выполняются здесь, а не в процессе ingress
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from config import config
+from services.job_queue import Job, job_queue
+
+logger = logging.getLogger(__name__)
+
+# Тип задачи: update Telegram, который нужно обработать хендлерами решения
+SOLVE_UPDATE = "solve_update"
+
+
+class SolverWorker:
+    """Цикл захвата задач с ограничением параллелизма"""
+
+    def __init__(self, bot: Bot, dp: Dispatcher, concurrency: int = config.SOLVER_CONCURRENCY):
+        self.bot = bot
+        self.dp = dp
+        self.concurrency = concurrency
+        self.poll_interval = config.JOB_POLL_INTERVAL
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._stopped: Optional[asyncio.Event] = None
+
+    async def run(self) -> None:
+        """Основной цикл: ждём свободный слот, захватываем задачу, запускаем"""
+        self._stopped = asyncio.Event()
+        logger.info(f"Solver запущен, параллельных задач: {self.concurrency}")
+
+        while not self._stopped.is_set():
+            await self._slots.acquire()
+            try:
+                job = await job_queue.claim()
+            except Exception as e:
+                self._slots.release()
+                logger.error(f"Ошибка захвата задачи: {e}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            if job is None:
+                self._slots.release()
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            task = asyncio.create_task(self._run_job(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Остановка: новые задачи не берём, текущие дожидаемся
+
+        Не успевшие за timeout секунд прерываются; задача остаётся
+        захваченной и вернётся в очередь по JOB_VISIBILITY_TIMEOUT.
+        """
+        if self._stopped is not None:
+            self._stopped.set()
+        if not self._tasks:
+            return
+        _, unfinished = await asyncio.wait(list(self._tasks), timeout=timeout)
+        if unfinished:
+            logger.warning(f"Не дождались задач в работе: {len(unfinished)}, вернутся в очередь")
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+    async def _run_job(self, job: Job) -> None:
+        """Выполнение одной задачи с продлением видимости"""
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            if job.kind != SOLVE_UPDATE:
+                raise ValueError(f"Неизвестный тип задачи: {job.kind}")
+
+            update = Update.model_validate(job.payload, context={"bot": self.bot})
+            await self.dp.feed_update(self.bot, update)
+            await job_queue.complete(job.id)
+        except Exception as e:
+            logger.error(f"Задача {job.id} (попытка {job.attempts}) упала: {e}", exc_info=True)
+            await job_queue.fail(job, str(e))
+        finally:
+            heartbeat.cancel()
+            self._slots.release()
+
+    async def _heartbeat(self, job_id: int) -> None:
+        """Продлеваем видимость каждые полтаймаута"""
+        interval = job_queue.visibility_timeout / 2
+        while True:
+            await asyncio.sleep(interval)
+            await job_queue.extend(job_id)
@@ -0,0 +1,171 @@
+"""
+Ограничение частоты заданий и дневные квоты пользователей
+Счётчики живут в памяти, в SQLite сбрасываются фоном
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+
+from config import config
+from services.db_service import db_service
+from services.metrics import THROTTLED_TOTAL
+
+logger = logging.getLogger(__name__)
+
+
+class ThrottleDecision(NamedTuple):
+    """Результат проверки: можно ли принять задание"""
+    allowed: bool
+    retry_after: int = 0      # Через сколько секунд можно повторить
+    quota_exceeded: bool = False
+
+
+class _UserCounters:
+    """Счётчики одного пользователя"""
+
+    __slots__ = ("day", "used", "recent")
+
+    def __init__(self, day: str, used: int = 0, recent: Optional[deque] = None):
+        self.day = day
+        self.used = used
+        self.recent: deque[float] = recent if recent is not None else deque()
+
+
+def _utc_day(now: float) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(now))
+
+
+class ThrottleService:
+    """
+    Скользящее окно и дневная квота на telegram_id
+
+    Проверка не обращается к БД: счётчики загружаются один раз при старте,
+    а изменения копятся в наборе «грязных» пользователей и раз в
+    THROTTLE_FLUSH_INTERVAL секунд одной пачкой записываются в user_quotas.
+    После перезапуска бот продолжает считать с сохранённых значений.
+    """
+
+    def __init__(self):
+        self.rate_limit = config.THROTTLE_RATE_LIMIT
+        self.rate_window = config.THROTTLE_RATE_WINDOW
+        self.daily_quota = config.THROTTLE_DAILY_QUOTA
+        self.flush_interval = config.THROTTLE_FLUSH_INTERVAL
+
+        self._users: dict[int, _UserCounters] = {}
+        self._dirty: set[int] = set()
+        self._loaded = False
+        self._flusher: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate_limit > 0 or self.daily_quota > 0
+
+    async def load(self) -> None:
+        """Загрузка сегодняшних счётчиков из SQLite (один запрос на процесс)"""
+        day = _utc_day(time.time())
+        rows = await db_service.load_quotas(day)
+        for telegram_id, used, recent in rows:
+            timestamps = deque(float(t) for t in recent.split(",") if t)
+            # setdefault: параллельная первая проверка могла уже завести счётчик
+            self._users.setdefault(telegram_id, _UserCounters(day, used, timestamps))
+        self._loaded = True
+        logger.info(f"Загружены квоты пользователей: {len(rows)}")
+
+    async def check(
+        self,
+        telegram_id: int,
+        count: int = 1,
+        rate_limit: Optional[int] = None,
+        daily_quota: Optional[int] = None
+    ) -> ThrottleDecision:
+        """
+        Проверить и, если разрешено, засчитать count заданий
+
+        Пачка (HTTP API) допускается только целиком. rate_limit и
+        daily_quota заменяют общие лимиты — у ключей API они свои.
+        """
+        rate_limit = self.rate_limit if rate_limit is None else rate_limit
+        daily_quota = self.daily_quota if daily_quota is None else daily_quota
+        if not self._loaded:
+            await self.load()
+        self._ensure_flusher()
+
+        now = time.time()
+        day = _utc_day(now)
+        counters = self._users.get(telegram_id)
+        if counters is None:
+            counters = self._users[telegram_id] = _UserCounters(day)
+        elif counters.day != day:
+            counters.day, counters.used = day, 0
+
+        if daily_quota and counters.used + count > daily_quota:
+            THROTTLED_TOTAL.labels("quota").inc()
+            midnight = (int(now) // 86400 + 1) * 86400
+            return ThrottleDecision(False, math.ceil(midnight - now), quota_exceeded=True)
+
+        recent = counters.recent
+        while recent and recent[0] <= now - self.rate_window:
+            recent.popleft()
+        if rate_limit and len(recent) + count > rate_limit:
+            THROTTLED_TOTAL.labels("rate").inc()
+            # Место для count заданий освободится, когда истечёт нужное число старых
+            oldest = recent[min(len(recent) + count - rate_limit, len(recent)) - 1] if recent else now
+            return ThrottleDecision(False, max(1, math.ceil(oldest + self.rate_window - now)))
+
+        recent.extend([now] * count)
+        counters.used += count
+        self._dirty.add(telegram_id)
+        return ThrottleDecision(True)
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения квот: {e}")
+
+    async def flush(self) -> None:
+        """Записать изменённые счётчики в SQLite и забыть неактивных"""
+        now = time.time()
+        if self._dirty:
+            dirty, self._dirty = self._dirty, set()
+            rows = []
+            for telegram_id in dirty:
+                counters = self._users[telegram_id]
+                recent = ",".join(f"{t:.3f}" for t in counters.recent)
+                rows.append((telegram_id, counters.day, counters.used, recent, now))
+            try:
+                await db_service.save_quotas(rows)
+            except Exception:
+                self._dirty |= dirty
+                raise
+
+        # Пользователи из прошлых суток без свежих заданий в памяти не нужны
+        day = _utc_day(now)
+        stale = [
+            telegram_id for telegram_id, counters in self._users.items()
+            if counters.day != day and telegram_id not in self._dirty
+            and (not counters.recent or counters.recent[-1] <= now - self.rate_window)
+        ]
+        for telegram_id in stale:
+            del self._users[telegram_id]
+
+    async def close(self) -> None:
+        """Остановка фонового сброса и финальная запись"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._loaded:
+            await self.flush()
+
+
+# Singleton экземпляр сервиса
+throttle_service = ThrottleService()
@@ -0,0 +1,84 @@
+"""
+Трассировка одного задания: этапы с временем начала и конца, атрибуты
+Текущая трасса живёт в contextvar и доступна сервисам без передачи аргументом
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+from services.metrics import STAGE_SECONDS
+
+_current: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """
+    Трасса задания
+
+    Этапы хранятся как (stage, start_ms, duration_ms) относительно начала
+    задания; атрибуты — движок и язык OCR, модель AI, токены, повторы.
+    Сохраняется в request_stages / request_traces вместе с запросом.
+    """
+
+    def __init__(self, source: str):
+        self.created_at = time.time()
+        self._origin = time.perf_counter()
+        self.stages: list[tuple[str, float, float]] = []
+        self.attrs: dict[str, Any] = {"source": source}
+        self.db_ms = 0.0
+
+    def add_stage(self, name: str, start: float, end: float) -> None:
+        """Этап по отметкам time.perf_counter()"""
+        self.stages.append((
+            name,
+            round((start - self._origin) * 1000, 1),
+            round((end - start) * 1000, 1)
+        ))
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def incr(self, key: str, amount: int = 1) -> None:
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._origin) * 1000, 1)
+
+
+def start_trace(source: str) -> RequestTrace:
+    """Начать трассу задания в текущем контексте"""
+    trace = RequestTrace(source)
+    _current.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+def reset_trace() -> Any:
+    """Чистый контекст для нового update (токен для restore_trace)"""
+    return _current.set(None)
+
+
+def restore_trace(token: Any) -> None:
+    _current.reset(token)
+
+
+def record_stage(name: str, start: float, end: float) -> None:
+    """Этап по готовым отметкам: в гистограмму метрик и в текущую трассу"""
+    STAGE_SECONDS.labels(name).observe(end - start)
+    trace = _current.get()
+    if trace is not None:
+        trace.add_stage(name, start, end)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Замер блока with как этапа задания"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, start, time.perf_counter())
@@ -0,0 +1,178 @@
+"""
+Очередь входящих обновлений для webhook
+Обновление сохраняется локально и подтверждается Telegram сразу,
+а обрабатывается пулом воркеров на постоянном event loop
+
+Только для долгоживущего aiohttp-сервера (bot.py, BOT_MODE=webhook):
+serverless-функцию замораживают сразу после ответа 200, и фоновые
+воркеры там не работают — Vercel/Netlify обрабатывают update синхронно.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Awaitable, Callable, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# (update, replayed): replayed=True — update из журнала, принятый до перезапуска
+UpdateProcessor = Callable[[dict, bool], Awaitable[None]]
+
+
+class UpdateQueue:
+    """Ограниченная очередь обновлений с журналом в SQLite"""
+
+    def __init__(
+        self,
+        path: str = config.UPDATE_QUEUE_PATH,
+        maxsize: int = config.UPDATE_QUEUE_SIZE,
+        workers: int = config.UPDATE_WORKERS
+    ):
+        self.path = path
+        self.maxsize = maxsize
+        self.workers = workers
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending = 0
+        self._rejected = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        # Воркеры, занятые обновлением: при остановке их дожидаемся
+        self._busy: set[asyncio.Task] = set()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Журнал принятых, но ещё не обработанных обновлений"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS pending_updates (
+                    update_id INTEGER PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    @property
+    def pending(self) -> int:
+        """Количество принятых и ещё не обработанных обновлений"""
+        return self._pending
+
+    @property
+    def rejected(self) -> int:
+        """Сколько обновлений отклонено из-за переполнения"""
+        return self._rejected
+
+    async def start(self, process: UpdateProcessor) -> None:
+        """Запуск воркеров на текущем event loop и загрузка журнала"""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._stopping = False
+
+        # Обновления, принятые до перезапуска, обрабатываем первыми
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT payload FROM pending_updates ORDER BY update_id"
+            ).fetchall()
+            self._pending = len(rows)
+        for (payload,) in rows:
+            self._queue.put_nowait((json.loads(payload), True))
+        if rows:
+            logger.info(f"Восстановлено из журнала обновлений: {len(rows)}")
+
+        self._tasks = [
+            asyncio.create_task(self._worker(process))
+            for _ in range(self.workers)
+        ]
+
+    def submit(self, update_data: dict) -> bool:
+        """
+        Принять обновление (потокобезопасно)
+
+        Returns:
+            False при переполнении — вызывающий отвечает Telegram ошибкой,
+            и тот доставит обновление повторно позже. Принятые обновления
+            не теряются: они в журнале до завершения обработки.
+        """
+        with self._lock:
+            if self._pending >= self.maxsize:
+                self._rejected += 1
+                return False
+
+            cursor = self._connect().execute(
+                "INSERT OR IGNORE INTO pending_updates (update_id, payload) VALUES (?, ?)",
+                (update_data.get("update_id"), json.dumps(update_data))
+            )
+            self._conn.commit()
+            if cursor.rowcount == 0:
+                # Повторная доставка уже принятого обновления
+                return True
+            self._pending += 1
+
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (update_data, False))
+        return True
+
+    def _done(self, update_id: Optional[int]) -> None:
+        """Удаление обработанного обновления из журнала"""
+        with self._lock:
+            self._connect().execute(
+                "DELETE FROM pending_updates WHERE update_id = ?",
+                (update_id,)
+            )
+            self._conn.commit()
+            self._pending -= 1
+
+    async def _worker(self, process: UpdateProcessor) -> None:
+        """Воркер: берёт обновления из очереди и обрабатывает по одному"""
+        task = asyncio.current_task()
+        while not self._stopping:
+            update_data, replayed = await self._queue.get()
+            self._busy.add(task)
+            try:
+                await process(update_data, replayed)
+            except asyncio.CancelledError:
+                # Прервано остановкой — обновление остаётся в журнале
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обработки update {update_data.get('update_id')}: {e}", exc_info=True)
+            finally:
+                self._busy.discard(task)
+            self._done(update_data.get("update_id"))
+            self._queue.task_done()
+
+    async def stop(self, timeout: float = 0) -> None:
+        """
+        Остановка воркеров; необработанное остаётся в журнале
+
+        Новые обновления из очереди не берутся, начатые дорабатываются
+        до timeout секунд — недоработанные прерываются и тоже остаются
+        в журнале до следующего запуска.
+        """
+        self._stopping = True
+        for task in self._tasks:
+            if task not in self._busy:
+                task.cancel()
+        busy = [task for task in self._tasks if task in self._busy]
+        if busy and timeout > 0:
+            _, unfinished = await asyncio.wait(busy, timeout=timeout)
+            if unfinished:
+                logger.warning(f"Не дождались обновлений в работе: {len(unfinished)}, остаются в журнале")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
@@ -0,0 +1,89 @@
+"""
+Снимок горячих кэшей при остановке и восстановление при запуске
+Первые минуты после деплоя не превращаются в волну промахов: решения AI,
+окно дедупликации и user_id пользователей переживают перезапуск
+"""
+import json
+import logging
+import os
+import time
+
+from config import config
+from services.db_service import db_service
+from services.dedup_service import dedup_service
+from services.solve_pipeline import solve_pipeline
+
+logger = logging.getLogger(__name__)
+
+# Меняется при несовместимом изменении формата; чужая версия игнорируется
+SNAPSHOT_VERSION = 1
+
+
+class WarmStateService:
+    """
+    JSON-файл WARM_STATE_PATH: пишется атомарно в on_shutdown, читается в on_startup
+
+    Сроки жизни решений хранятся как абсолютное время, поэтому время
+    простоя между остановкой и запуском вычитается из TTL.
+    """
+
+    def __init__(self):
+        self.path = config.WARM_STATE_PATH
+
+    def save(self) -> None:
+        """Снимок кэшей; ошибка записи не мешает остановке"""
+        if not self.path:
+            return
+        now = time.time()
+        state = {
+            "version": SNAPSHOT_VERSION,
+            "saved_at": now,
+            "solutions": [
+                [key, now + ttl, solution] for key, ttl, solution in solve_pipeline.cache.snapshot()
+            ],
+            "dedup": dedup_service.snapshot(),
+            "user_ids": db_service.cached_user_ids(),
+        }
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.error(f"Не удалось сохранить снимок кэшей: {e}")
+            return
+        logger.info(
+            f"Снимок кэшей сохранён: решений {len(state['solutions'])}, "
+            f"update_id {len(state['dedup'])}, пользователей {len(state['user_ids'])}"
+        )
+
+    def restore(self) -> None:
+        """Загрузка снимка, если он есть; повреждённый или чужой версии пропускается"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("version") != SNAPSHOT_VERSION:
+                logger.warning(f"Снимок кэшей другой версии пропущен: {state.get('version')}")
+                return
+            now = time.time()
+            solutions = [(key, expires_at - now, solution) for key, expires_at, solution in state["solutions"]]
+            solve_pipeline.cache.restore(solutions)
+            dedup_service.restore(state["dedup"])
+            db_service.remember_user_ids([(telegram_id, user_id) for telegram_id, user_id in state["user_ids"]])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Снимок кэшей не загружен: {e}")
+            return
+        logger.info(
+            f"Кэши восстановлены (снимок {now - state['saved_at']:.0f} с назад): "
+            f"решений {len(solve_pipeline.cache)}, update_id {len(state['dedup'])}, "
+            f"пользователей {len(state['user_ids'])}"
+        )
+
+
+# Singleton экземпляр сервиса
+warm_state = WarmStateService()
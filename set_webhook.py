@@ -1,57 +1,96 @@
 """
-Скрипт для установки webhook на Vercel
+Скрипт для установки webhook (Vercel/Netlify или собственный webhook-сервер bot.py)
 Запустите после деплоя: python set_webhook.py
+
+Без интерактивного ввода:
+    python set_webhook.py --url https://your-app.fly.dev --path /webhook
+    python set_webhook.py --url https://your-app.vercel.app --path /api/webhook
+URL, путь и секрет по умолчанию берутся из WEBHOOK_URL, WEBHOOK_PATH и WEBHOOK_SECRET.
 """
+import argparse
 import asyncio
 import sys
+from typing import Optional
+
 from aiogram import Bot
 from config import config
 
-async def set_webhook():
+
+def parse_args() -> argparse.Namespace:
+    """Разбор аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Установка webhook для бота")
+    parser.add_argument("--url", default=config.WEBHOOK_URL,
+                        help="Публичный адрес приложения (по умолчанию WEBHOOK_URL)")
+    parser.add_argument("--path", default=None,
+                        help="Путь webhook (по умолчанию WEBHOOK_PATH или /api/webhook для Vercel)")
+    parser.add_argument("--secret", default=config.WEBHOOK_SECRET,
+                        help="Секретный токен для заголовка X-Telegram-Bot-Api-Secret-Token")
+    parser.add_argument("--keep-pending", action="store_true",
+                        help="Не сбрасывать накопившиеся обновления")
+    return parser.parse_args()
+
+
+async def set_webhook(
+    webhook_url: str,
+    path: str,
+    secret: Optional[str],
+    drop_pending_updates: bool = True
+):
     """Устанавливает webhook для бота"""
     bot = Bot(token=config.BOT_TOKEN)
-    
-    # URL вашего Vercel приложения
-    # Замените на ваш реальный URL после деплоя
-    webhook_url = input("Введите URL вашего Vercel приложения (например, https://your-app.vercel.app): ").strip()
-    
-    if not webhook_url:
-        print("❌ URL не может быть пустым!")
-        return
-    
+
     # Добавляем путь к webhook
-    full_webhook_url = f"{webhook_url}/api/webhook"
-    
+    full_webhook_url = f"{webhook_url.rstrip('/')}{path}"
+
     try:
         # Удаляем старый webhook
-        await bot.delete_webhook(drop_pending_updates=True)
+        await bot.delete_webhook(drop_pending_updates=drop_pending_updates)
         print("✅ Старый webhook удалён")
-        
+
         # Устанавливаем новый webhook
         await bot.set_webhook(
             url=full_webhook_url,
-            drop_pending_updates=True
+            secret_token=secret or None,
+            drop_pending_updates=drop_pending_updates
         )
         print(f"✅ Webhook установлен: {full_webhook_url}")
-        
+
         # Проверяем webhook
         webhook_info = await bot.get_webhook_info()
         print(f"\n📊 Информация о webhook:")
         print(f"   URL: {webhook_info.url}")
         print(f"   Pending updates: {webhook_info.pending_update_count}")
-        
+
         if webhook_info.last_error_message:
             print(f"   ⚠️ Последняя ошибка: {webhook_info.last_error_message}")
-        
+
     except Exception as e:
         print(f"❌ Ошибка: {e}")
     finally:
         await bot.session.close()
 
 if __name__ == "__main__":
+    args = parse_args()
     try:
         config.validate()
-        asyncio.run(set_webhook())
     except ValueError as e:
         print(f"❌ Ошибка конфигурации: {e}")
         sys.exit(1)
+
+    webhook_url = args.url
+    path = args.path
+    if not webhook_url:
+        # Интерактивный режим как раньше (деплой на Vercel)
+        webhook_url = input("Введите URL вашего Vercel приложения (например, https://your-app.vercel.app): ").strip()
+        path = path or "/api/webhook"
+
+    if not webhook_url:
+        print("❌ URL не может быть пустым!")
+        sys.exit(1)
+
+    asyncio.run(set_webhook(
+        webhook_url,
+        path or config.WEBHOOK_PATH,
+        args.secret,
+        drop_pending_updates=not args.keep_pending
+    ))
@@ -0,0 +1,7 @@
+"""
+Корень проекта в sys.path: модули бота импортируются как при запуске bot.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,43 @@
+"""
+Нечёткий поиск в корпусе готовых ответов
+"""
+import asyncio
+
+from services.answer_corpus import AnswerCorpus, normalize_task, open_for_import, task_hash
+
+TASK = "Решите уравнение 12x + 35 = 107"
+
+
+def _corpus(tmp_path) -> AnswerCorpus:
+    path = str(tmp_path / "answers.db")
+    db = open_for_import(path)
+    normalized = normalize_task(TASK)
+    cursor = db.execute(
+        "INSERT INTO answers (text_hash, task_text, answer) VALUES (?, ?, ?)",
+        (task_hash(normalized), TASK, "x = 6")
+    )
+    db.execute("INSERT INTO answers_fts (rowid, norm_text) VALUES (?, ?)", (cursor.lastrowid, normalized))
+    db.close()
+    return AnswerCorpus(path)
+
+
+def _lookup(corpus: AnswerCorpus, text: str, min_similarity: float = 0.8):
+    async def run():
+        try:
+            return await corpus.lookup(text, min_similarity)
+        finally:
+            await corpus.close()
+
+    return asyncio.run(run())
+
+
+def test_word_noise_matches(tmp_path):
+    found = _lookup(_corpus(tmp_path), "Реши уравнение 12x + 35 = 107")
+    assert found is not None and found.answer == "x = 6"
+
+
+def test_different_numbers_or_operators_do_not_match(tmp_path):
+    corpus = _corpus(tmp_path)
+    # Строки похожи на 98%, но ответ другой
+    assert _lookup(corpus, "Решите уравнение 12x + 35 = 167") is None
+    assert _lookup(corpus, "Решите уравнение 12x - 35 = 107") is None
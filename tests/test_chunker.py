@@ -0,0 +1,17 @@
+"""
+Разбиение ответов на сообщения Telegram
+"""
+from utils.chunker import split_message
+
+
+def test_empty_or_whitespace_text_gives_no_parts():
+    assert split_message("") == []
+    assert split_message("  \n\n\t ") == []
+
+
+def test_parts_fit_limit_and_are_escaped():
+    text = "Ответ: a < b & c.\n\n" * 50
+    parts = split_message(text, 100)
+    assert len(parts) > 1
+    assert all(part and len(part) <= 100 for part in parts)
+    assert "&lt;" in parts[0] and "&amp;" in parts[0]
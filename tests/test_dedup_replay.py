@@ -0,0 +1,68 @@
+"""
+Падение посреди обработки → перезапуск → update из журнала очереди
+"""
+import asyncio
+
+from aiogram.types import Update
+
+from middlewares.dedup import DeduplicationMiddleware
+from services.db_service import db_service
+from services.dedup_service import dedup_service
+from services.update_queue import UpdateQueue
+
+UPDATE = {"update_id": 4242}
+
+
+def test_journal_replay_takes_over_claim_of_crashed_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_service, "db_path", str(tmp_path / "gdz.db"))
+    monkeypatch.setattr(dedup_service, "persist", True)
+    journal = str(tmp_path / "update_queue.db")
+    middleware = DeduplicationMiddleware()
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event.update_id)
+
+    async def run():
+        await db_service.init_db()
+        try:
+            # Первый процесс: update принят и захвачен, обработка не закончена
+            crashed = UpdateQueue(path=journal, workers=1)
+            started = asyncio.Event()
+
+            async def hang(update_data, replayed):
+                assert await dedup_service.claim(update_data["update_id"])
+                started.set()
+                await asyncio.Event().wait()
+
+            await crashed.start(hang)
+            assert crashed.submit(UPDATE)
+            await asyncio.wait_for(started.wait(), 5)
+            # Падение: воркер убит, захват не отпущен, update остался в журнале
+            for task in crashed._tasks:
+                task.cancel()
+            await asyncio.gather(*crashed._tasks, return_exceptions=True)
+            dedup_service._seen.clear()
+
+            # Повторная доставка от Telegram по-прежнему отбрасывается
+            assert not await dedup_service.claim(UPDATE["update_id"])
+
+            # Перезапуск: update из журнала обрабатывается
+            restarted = UpdateQueue(path=journal, workers=1)
+
+            async def process(update_data, replayed):
+                update = Update.model_validate(update_data)
+                await middleware(handler, update, {"journal_replay": replayed})
+
+            await restarted.start(process)
+            assert restarted.pending == 1
+            for _ in range(100):
+                if restarted.pending == 0:
+                    break
+                await asyncio.sleep(0.01)
+            await restarted.stop()
+        finally:
+            await db_service.close()
+
+    asyncio.run(run())
+    assert handled == [UPDATE["update_id"]]
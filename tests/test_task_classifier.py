@@ -0,0 +1,29 @@
+"""
+Определение предмета по тексту задания
+"""
+from utils.task_classifier import detect_subject
+
+
+def test_stems_match_only_at_word_start():
+    # «век» внутри «человек», «sin» внутри «Using»
+    assert detect_subject("В классе 25 человек, из них 40% девочки. Сколько девочек?") == "математика"
+    assert detect_subject("Using the words, fill the gaps") == "английский"
+
+
+def test_math_functions_and_formulas():
+    assert detect_subject("Найдите sin x, если cos x = 0.6") == "математика"
+    assert detect_subject("Решите 2x + 3 = 7") == "математика"
+    # Формула не перебивает ключевые слова другого предмета
+    assert detect_subject("Найдите скорость, если s = 100 м, t = 20 с") == "физика"
+
+
+def test_short_stems_match_whole_words_only():
+    assert detect_subject("Отсортируйте массив по возрастанию") is None
+    assert detect_subject("Статья о вреде героина") is None
+    assert detect_subject("Найдите массу тела") == "физика"
+    assert detect_subject("Опиши главного героя рассказа") == "литература"
+    assert detect_subject("Реформы Петра в XVIII веке") == "история"
+
+
+def test_tie_between_subjects_is_none():
+    assert detect_subject("Найдите массу раствора") is None
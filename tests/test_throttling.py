@@ -0,0 +1,54 @@
+"""
+Лимиты заданий для кнопки «Попробовать снова»
+"""
+import asyncio
+
+from aiogram.types import CallbackQuery, User
+
+from handlers import setup_routers
+from handlers.retry import router as retry_router
+from middlewares.throttling import ThrottlingMiddleware
+from services.db_service import db_service
+from services.throttle_service import throttle_service
+
+
+def _press() -> CallbackQuery:
+    user = User(id=777, is_bot=False, first_name="Тест")
+    return CallbackQuery(id="1", from_user=user, chat_instance="c", data="retry:1")
+
+
+def test_retry_button_is_throttled():
+    setup_routers()
+    assert any(isinstance(m, ThrottlingMiddleware) for m in retry_router.callback_query.middleware)
+
+
+def test_retry_presses_over_the_limit_do_not_reach_handler(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_service, "db_path", str(tmp_path / "gdz.db"))
+    monkeypatch.setattr(throttle_service, "rate_limit", 2)
+    monkeypatch.setattr(throttle_service, "daily_quota", 0)
+    monkeypatch.setattr(throttle_service, "_users", {})
+    monkeypatch.setattr(throttle_service, "_loaded", False)
+    alerts = []
+
+    async def answer(self, text=None, show_alert=None, **kwargs):
+        alerts.append((text, show_alert))
+
+    monkeypatch.setattr(CallbackQuery, "answer", answer)
+    middleware = ThrottlingMiddleware()
+    solved = []
+
+    async def handler(event, data):
+        solved.append(event.data)
+
+    async def run():
+        await db_service.init_db()
+        try:
+            for _ in range(5):
+                await middleware(handler, _press(), {})
+        finally:
+            await throttle_service.close()
+            await db_service.close()
+
+    asyncio.run(run())
+    assert len(solved) == 2
+    assert len(alerts) == 3 and all(show_alert for _, show_alert in alerts)
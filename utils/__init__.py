@@ -0,0 +1,3 @@
+"""
+Вспомогательные утилиты
+"""
@@ -0,0 +1,120 @@
+"""
+Разбиение длинных ответов на сообщения Telegram
+Текст экранируется для parse_mode=HTML по ходу разбиения за один проход
+"""
+import html
+import re
+
+# Места разрыва по убыванию приоритета: абзац, строка, конец предложения, пробел
+_BREAKS = (
+    ("\n\n",),
+    ("\n",),
+    (". ", "! ", "? ", "… ", ": "),
+    (" ",),
+)
+
+# Самая длинная HTML-сущность после экранирования — "&amp;"
+_MAX_ENTITY = 5
+
+_NON_SPACE_RE = re.compile(r"\S")
+
+
+def escape_html(text: str) -> str:
+    """Экранирование текста для parse_mode=HTML"""
+    return html.escape(text, quote=False)
+
+
+def telegram_length(text: str) -> int:
+    """Длина в единицах UTF-16 — так Telegram считает лимит сообщения"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+class MessageChunker:
+    """
+    Инкрементальное разбиение текста на HTML-безопасные части
+
+    Текст подаётся кусками через feed() (например, из потокового ответа AI)
+    и экранируется сразу; готовые части возвращаются, как только за ними
+    набралось больше лимита. Поиск разрыва идёт только внутри окна
+    очередной части строковыми методами, поэтому время линейно от длины
+    ответа. Экранированные сущности (&lt; &gt; &amp;) никогда не режутся.
+    """
+
+    def __init__(self, max_length: int = 4096):
+        self.max_length = max_length
+        self._buffer = ""  # Экранированный текст, ещё не выданный частями
+        self._pos = 0
+
+    def feed(self, text: str) -> list[str]:
+        """Добавить текст, вернуть завершённые части"""
+        self._buffer = self._buffer[self._pos:] + escape_html(text)
+        self._pos = 0
+        return self._drain()
+
+    def flush(self) -> list[str]:
+        """Завершить поток, вернуть оставшиеся части"""
+        chunks = self._drain()
+        tail = self._buffer[self._pos:].strip()
+        if tail:
+            chunks.append(tail)
+        self._buffer, self._pos = "", 0
+        return chunks
+
+    def _drain(self) -> list[str]:
+        chunks: list[str] = []
+        buffer, limit = self._buffer, self.max_length
+
+        while True:
+            pos = self._pos
+            end = min(pos + limit, len(buffer))
+            # В окне могут быть символы вне BMP (эмодзи) — они занимают 2 единицы
+            excess = telegram_length(buffer[pos:end]) - limit
+            while excess > 0:
+                end -= excess
+                excess = telegram_length(buffer[pos:end]) - limit
+
+            if end == len(buffer):
+                # Остаток помещается целиком: ждём продолжения или flush()
+                break
+
+            cut = self._find_break(buffer, pos, end)
+            chunk = buffer[pos:cut].strip()
+            if chunk:
+                chunks.append(chunk)
+
+            # Пропускаем разделитель в начале следующей части
+            match = _NON_SPACE_RE.search(buffer, cut)
+            self._pos = match.start() if match else len(buffer)
+
+        return chunks
+
+    def _find_break(self, buffer: str, pos: int, end: int) -> int:
+        """Позиция разрыва в окне [pos, end): лучшая граница во второй половине окна"""
+        half = pos + (end - pos) // 2
+        fallback = -1
+        for separators in _BREAKS:
+            index = max(buffer.rfind(sep, pos, end) for sep in separators)
+            if index >= half:
+                # Разделитель предложения оставляем в текущей части
+                return index + 1 if separators[0] != "\n\n" else index
+            fallback = max(fallback, index)
+        if fallback > pos:
+            return fallback + 1
+
+        # Границ нет — режем по лимиту, не разрывая HTML-сущность
+        amp = buffer.rfind("&", max(pos, end - _MAX_ENTITY + 1), end)
+        if amp > pos and buffer.find(";", amp, end) == -1:
+            return amp
+        return end
+
+
+def split_message(text: str, max_length: int = 4096) -> list[str]:
+    """
+    Разбивает длинное сообщение на части, экранированные для HTML
+    Старается разбивать по абзацам, строкам или предложениям
+
+    Пустой или состоящий из пробелов текст — пустой список: Telegram
+    отклоняет сообщение без текста («message text is empty»)
+    """
+    chunker = MessageChunker(max_length)
+    return chunker.feed(text) + chunker.flush()
@@ -0,0 +1,209 @@
+"""
+Локальные эвристики по тексту задания: тип сообщения, предмет и сложность
+Без сетевых вызовов — считаются до запроса к AI
+"""
+import re
+from typing import Optional
+
+# Основы слов (нижний регистр) по предметам; совпадают только с начала слова
+# («уравнен» — и в «уравнение», и в «уравнения»). С пробелом на конце — только
+# слово целиком: так записаны формы коротких слов, чья основа начинает чужие
+# слова («масс» — «массив», «геро» — «героин», «век» — «вековой»)
+SUBJECT_KEYWORDS: dict[str, tuple[str, ...]] = {
+    "математика": (
+        "уравнен", "вычисл", "выражен", "дроб", "корень", "процент", "площад",
+        "периметр", "функци", "график", "неравенств", "треугольник", "угол",
+        "логарифм", "производн", "интеграл",
+    ),
+    "физика": (
+        "скорост", "ускорен", "сила ", "масса ", "массу ", "массы ", "массой ",
+        "массе ", "энерги", "давлени", "ток ",
+        "напряжени", "сопротивлени", "импульс", "кпд", "плотност", "температур",
+    ),
+    "химия": (
+        "реакци", "молекул", "моль ", "моля ", "молей ", "молях ", "раствор",
+        "валентн", "оксид", "кислот",
+        "щёлоч", "щелоч", "элемент", "массовую долю",
+    ),
+    "русский язык": (
+        "разбор", "падеж", "орфограмм", "суффикс", "приставк", "подлежащ",
+        "сказуем", "спряжени", "пунктуаци", "запятые", "вставь",
+    ),
+    "английский": (
+        "переведи на англ", "translate", "present simple", "past simple",
+        "fill in", "fill the gap", "english", "choose the correct",
+    ),
+    "литература": (
+        "стихотворени", "произведени", "автор", "сочинени", "герой ", "героя ",
+        "герою ", "героем ", "герое ", "герои ", "героев ", "героям ", "героями ",
+        "героине ", "героини ", "героиню ", "героиней ",
+    ),
+    "история": (
+        "век ", "века ", "веке ", "веков ", "векам ", "войн", "революци", "царь",
+        "импери", "истори",
+    ),
+    "биология": ("клетк", "организм", "фотосинтез", "растени", "животн"),
+    "география": ("материк", "климат", "океан", "столиц", "рельеф"),
+}
+
+# Признаки многошаговых заданий
+HARD_KEYWORDS = (
+    "докаж", "интеграл", "производн", "логарифм", "тригонометр", "предел",
+    "вероятност", "систему уравнений", "систем уравнений", "неравенств",
+    "импульс", "кпд", "сочинени", "эссе", "проанализируй", "сравни",
+)
+
+_FORMULA_CHARS = set("0123456789+-*/=^√()<>·×÷%")
+_SUBJECT_PATTERNS = {
+    subject: [
+        re.compile(r"(?<!\w)" + re.escape(keyword.strip()) + (r"(?!\w)" if keyword.endswith(" ") else ""))
+        for keyword in keywords
+    ]
+    for subject, keywords in SUBJECT_KEYWORDS.items()
+}
+# Тригонометрия и логарифмы — только с аргументом: «sin x», «cos(2a)», «log2 8»
+_MATH_FUNCTION_RE = re.compile(
+    r"(?<![a-z])(?:arcsin|arccos|arctg|sin|cos|tg|ctg|tan|log|lg|ln)\s*(?:\(|\d|[a-zα-ω](?![a-z]))"
+)
+# Формула: число со знаком операции или процентом, «x = 5», корень.
+# Минус и двоеточие не в счёт — «1941-1945», «10:30»
+_FORMULA_RE = re.compile(r"\d\s*[+*/^=<>×÷·%]|(?<![a-zа-я])[a-z]\s*[=<>]\s*-?\d|√")
+# Пункты задания: «1)», «2.», «а)», «б)» в начале строки
+_SUBTASK_RE = re.compile(r"^\s*(?:\d+|[а-яa-z])[).]\s", re.MULTILINE | re.IGNORECASE)
+
+# Предметы, где и короткие задачи обычно многошаговые
+HARD_SUBJECTS = ("физика", "химия")
+
+# Типы сообщений: на всё, кроме TASK, бот отвечает сам, без AI
+TASK = "task"
+GREETING = "greeting"
+THANKS = "thanks"
+SMALL_TALK = "small_talk"
+NOT_TASK = "not_task"
+
+# Реплики целиком (после нормализации): «привет», «спасибо!», «как дела?»
+_PHRASES: dict[str, tuple[str, ...]] = {
+    GREETING: (
+        "привет", "приветик", "прив", "здравствуй", "здравствуйте", "здарова",
+        "добрый день", "доброе утро", "добрый вечер", "доброй ночи", "хай",
+        "салют", "йо", "ку", "hi", "hello", "hey",
+    ),
+    THANKS: (
+        "спасибо", "спасибо большое", "большое спасибо", "спс", "пасиб",
+        "благодарю", "thanks", "thank you", "thx",
+    ),
+    SMALL_TALK: (
+        "как дела", "как ты", "что делаешь", "ты кто", "кто ты", "что ты умеешь",
+        "ты бот", "ок", "окей", "ok", "понятно", "ясно", "хорошо", "да", "нет",
+        "ага", "угу", "круто", "класс", "супер", "пока", "до свидания", "ладно",
+    ),
+}
+_PHRASE_KINDS = {phrase: kind for kind, phrases in _PHRASES.items() for phrase in phrases}
+# Обращение перед репликой: «бот, привет», «привет бот»
+_ADDRESS_WORDS = ("бот", "ботик", "bot")
+# Реплика из нескольких фраз: «привет, как дела?» — не длиннее стольких слов
+_MAX_SMALL_TALK_WORDS = 6
+_PHRASE_SPLIT_RE = re.compile(r"[,.!?;)(]+|\s+-\s+")
+
+
+def detect_subject(text: str) -> Optional[str]:
+    """
+    Предмет с наибольшим числом совпадений или None
+
+    Ничья — None: «масса раствора» одинаково похожа на физику и химию,
+    а неверный предмет в промпте хуже общего. Формула без единого
+    ключевого слова — математика; при словах других предметов она не в
+    счёт (у физики тоже есть «v = 5 м/с»).
+    """
+    lowered = text.lower()
+    best, best_hits, tie = None, 0, False
+    for subject, patterns in _SUBJECT_PATTERNS.items():
+        hits = sum(1 for pattern in patterns if pattern.search(lowered))
+        if subject == "математика" and _MATH_FUNCTION_RE.search(lowered):
+            hits += 1
+        if hits > best_hits:
+            best, best_hits, tie = subject, hits, False
+        elif hits and hits == best_hits:
+            tie = True
+    if tie:
+        return None
+    if best is None and _FORMULA_RE.search(lowered):
+        return "математика"
+    return best
+
+
+def estimate_difficulty(text: str, source: str = "text") -> int:
+    """
+    Оценка сложности задания в баллах (0 — тривиальное)
+
+    Учитываются длина, предмет, ключевые слова многошаговых задач,
+    плотность формул, число пунктов и источник: текст после OCR
+    зашумлён, слабой модели с ним тяжелее.
+    """
+    lowered = text.lower()
+    score = 0
+
+    if len(text) > 800:
+        score += 2
+    elif len(text) > 300:
+        score += 1
+
+    if detect_subject(text) in HARD_SUBJECTS:
+        score += 1
+
+    score += min(2, sum(1 for keyword in HARD_KEYWORDS if keyword in lowered))
+
+    compact = [c for c in text if not c.isspace()]
+    if len(compact) > 40:
+        density = sum(1 for c in compact if c in _FORMULA_CHARS) / len(compact)
+        if density > 0.25:
+            score += 1
+    if text.count("=") >= 3:
+        score += 1
+
+    if len(_SUBTASK_RE.findall(text)) >= 2:
+        score += 1
+
+    if source in ("image", "api_image"):
+        score += 1
+
+    return score
+
+
+def _normalize_phrase(text: str) -> str:
+    text = text.lower().replace("ё", "е")
+    words = [word for word in re.findall(r"\w+", text) if word not in _ADDRESS_WORDS]
+    return " ".join(words)
+
+
+def classify_message(text: str) -> str:
+    """
+    Тип текстового сообщения: TASK или реплика, на которую AI не нужен
+
+    Разговорной репликой считается короткое сообщение, каждая часть
+    которого — известная фраза («привет, как дела?»). Любая цифра,
+    формула или лишнее слово делают сообщение заданием: «привет, реши
+    2+2» уходит в AI. Сообщение без букв и цифр (эмодзи, знаки) — NOT_TASK.
+    """
+    if not any(c.isalnum() for c in text):
+        return NOT_TASK
+    if any(c.isdigit() for c in text) or len(text.split()) > _MAX_SMALL_TALK_WORDS:
+        return TASK
+
+    kinds = []
+    for part in _PHRASE_SPLIT_RE.split(text):
+        phrase = _normalize_phrase(part)
+        if not phrase:
+            continue
+        kind = _PHRASE_KINDS.get(phrase)
+        if kind is None:
+            return TASK
+        kinds.append(kind)
+
+    if not kinds:
+        return NOT_TASK
+    # «Привет, спасибо!» — благодарность важнее приветствия
+    for kind in (THANKS, GREETING):
+        if kind in kinds:
+            return kind
+    return SMALL_TALK